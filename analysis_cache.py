@@ -0,0 +1,158 @@
+# analysis_cache.py
+"""
+Кэш результатов анализа каналов между запусками main.py.
+
+Результаты анализа канала (channel_results без рангов) хранятся в таблице analysis_cache вместе
+с отпечатком входных данных: параметры анализа (опорная дата, окна, версия кэша), теги групп канала
+и данные канала в БД (название, подписчики, last_fetched, количество видео, максимальная fetch_date).
+Любая запись канала или его видео меняет last_fetched / fetch_date / количество, поэтому совпадение
+отпечатка означает, что пересчет дал бы тот же результат.
+
+  * Каналы с неизмененным отпечатком берутся из кэша без запросов анализа.
+  * Ранги пересчитываются инкрементально (analyzer.update_ranks) от рангов прошлого запуска.
+  * Если не изменилось ничего (отпечатки всех каналов и список каналов), агрегаты групп
+    также берутся из кэша.
+
+При изменении логики анализа нужно увеличить CACHE_VERSION (весь кэш станет недействительным).
+"""
+import hashlib
+import json
+from datetime import date
+import database
+import analyzer
+import pipeline
+
+CACHE_VERSION = 1
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _encode(value):
+    return json.dumps(value, default=_json_default, separators=(',', ':'))
+
+def _decode_results(results_json):
+    results = json.loads(results_json)
+    if isinstance(results.get('date_added'), str):
+        results['date_added'] = date.fromisoformat(results['date_added'])
+    return results
+
+def _hash(value):
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+
+class AnalysisCache:
+    """Кэш анализа одного запуска: чтение при создании, запись изменений в save()."""
+
+    def __init__(self, conn, reference_date, windows):
+        self.conn = conn
+        self.params = (CACHE_VERSION, reference_date.isoformat(), tuple(windows))
+        self.inputs = database.get_channel_fingerprint_inputs(conn)
+        self.entries, self.state = database.get_analysis_cache(conn)
+        self.fingerprints = {} # channel_id -> отпечаток в этом запуске
+        self.pending = {} # channel_id -> (отпечаток или None до запроса к БД, JSON результатов) для записи
+        self.pending_groups = {} # channel_id -> теги групп пересчитанного канала (для отпечатка)
+        self.decoded = {} # channel_id -> результаты из кэша (без рангов)
+        self.run_fingerprint = None
+        self.new_state = {}
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _fingerprint(self, groups, inputs):
+        return _hash((self.params, groups, inputs))
+
+    def _get_decoded(self, channel_id):
+        if channel_id not in self.decoded:
+            entry = self.entries.get(channel_id)
+            self.decoded[channel_id] = _decode_results(entry[1]) if entry else None
+        return self.decoded[channel_id]
+
+    def get(self, channel_id, groups=None):
+        """
+        Возвращает копию закэшированных результатов канала, если отпечаток не изменился, иначе None.
+        Каналы без названия или с неизвестным числом подписчиков в БД не берутся из кэша:
+        main.py запрашивает для них данные канала из API.
+        """
+        inputs = self.inputs.get(channel_id)
+        groups = ", ".join(groups) if groups else None
+        fingerprint = self._fingerprint(groups, inputs)
+        self.fingerprints[channel_id] = fingerprint
+        entry = self.entries.get(channel_id)
+        if not inputs or not inputs[0] or inputs[1] is None or not entry or entry[0] != fingerprint:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return dict(self._get_decoded(channel_id))
+
+    def put(self, channel_id, channel_results):
+        """
+        Запоминает рассчитанные результаты канала. Отпечаток берется по состоянию БД после загрузки
+        (одним запросом для всех пересчитанных каналов в rank() / save()): запись других каналов
+        не меняет входные данные этого канала.
+        """
+        self.fingerprints[channel_id] = None
+        self.pending_groups[channel_id] = channel_results.get('groups')
+        self.pending[channel_id] = (None, _encode(channel_results))
+
+    def _resolve_fingerprints(self):
+        """Рассчитывает отпечатки пересчитанных каналов (один запрос к БД на все каналы)."""
+        channel_ids = [channel_id for channel_id, (fingerprint, _) in self.pending.items() if fingerprint is None]
+        if not channel_ids:
+            return
+        inputs = database.get_channel_fingerprint_inputs(self.conn, channel_ids)
+        for channel_id in channel_ids:
+            fingerprint = self._fingerprint(self.pending_groups[channel_id], inputs.get(channel_id))
+            self.fingerprints[channel_id] = fingerprint
+            self.pending[channel_id] = (fingerprint, self.pending[channel_id][1])
+
+    def rank(self, all_results, extra_metrics=None):
+        """
+        Ранжирует каналы: инкрементально от рангов прошлого запуска или полным расчетом,
+        если рангов в кэше нет или изменился набор метрик.
+        """
+        rank_metrics = list(analyzer.get_rank_metrics(extra_metrics))
+        rank_keys = [f'rank_{metric}' for metric in rank_metrics]
+        channel_ids = [channel['channel_id'] for channel in all_results]
+        self._resolve_fingerprints()
+        self.run_fingerprint = _hash((self.params, rank_metrics, [(channel_id, self.fingerprints.get(channel_id)) for channel_id in channel_ids]))
+
+        previous_ranks = json.loads(self.state['ranks']) if 'ranks' in self.state else None
+        if previous_ranks is None or json.loads(self.state.get('rank_metrics', '[]')) != rank_metrics:
+            ranked_results = analyzer.calculate_ranks(all_results, extra_metrics=extra_metrics)
+        elif self.run_fingerprint == self.state.get('run_fingerprint'):
+            print("DEBUG Analysis cache: No changes since last run, ranks served from cache.")
+            ranked_results = [dict(channel, **dict(zip(rank_keys, previous_ranks[channel['channel_id']]))) for channel in all_results]
+        else:
+            previous_ranked = {}
+            for channel_id, ranks in previous_ranks.items():
+                previous = self._get_decoded(channel_id)
+                if previous is not None:
+                    previous_ranked[channel_id] = dict(previous, **dict(zip(rank_keys, ranks)))
+            ranked_results = analyzer.update_ranks(all_results, previous_ranked, extra_metrics=extra_metrics)
+
+        self.new_state['rank_metrics'] = _encode(rank_metrics)
+        self.new_state['ranks'] = _encode({channel['channel_id']: [channel.get(key) for key in rank_keys] for channel in ranked_results})
+        self.new_state['run_fingerprint'] = self.run_fingerprint
+        return ranked_results
+
+    def group_stats(self, ranked_results, window_metrics, channel_list):
+        """
+        Возвращает (агрегаты группы, {тег: агрегаты}) - из кэша, если с прошлого запуска ничего не изменилось.
+        Вызывается после rank().
+        """
+        if self.run_fingerprint == self.state.get('run_fingerprint') and self.state.get('group_stats'):
+            cached = json.loads(self.state['group_stats'])
+            return cached['all'], cached['by_tag']
+        group_stats = pipeline.calculate_group_stats(ranked_results, window_metrics)
+        stats_by_tag = pipeline.calculate_group_stats_by_tag(ranked_results, window_metrics, channel_list)
+        self.new_state['group_stats'] = _encode({'all': group_stats, 'by_tag': stats_by_tag})
+        return group_stats, stats_by_tag
+
+    def save(self):
+        """Записывает измененные результаты каналов и состояние запуска одной транзакцией."""
+        self._resolve_fingerprints()
+        entries = [(channel_id, fingerprint, results_json) for channel_id, (fingerprint, results_json) in self.pending.items()]
+        if self.new_state.get('run_fingerprint') != self.state.get('run_fingerprint') and 'group_stats' not in self.new_state:
+            self.new_state['group_stats'] = None # Агрегаты прошлого запуска больше не соответствуют рангам
+        database.save_analysis_cache(self.conn, entries, self.new_state)
+        print(f"DEBUG Analysis cache: {self.stats['hits']} channels served from cache, "
+              f"{len(self.pending)} recomputed, {len(entries)} cache entries written.")
@@ -1,6 +1,7 @@
 import math
 from datetime import timedelta
 import operator
+import bisect
 
 def format_duration(seconds):
     """Форматирует длительность из секунд в строку HH:MM:SS."""
@@ -59,8 +60,8 @@ def calculate_average_engagement_rate(video_data_list):
     Игнорирует видео с 0 просмотров.
 
     Args:
-        video_data_list (list): Список словарей, каждый содержит ключи
-                               'view_count', 'like_count', 'comment_count'.
+        video_data_list (list): Список объектов VideoRecord с полями
+                               view_count, like_count, comment_count.
 
     Returns:
         float: Средний ER в процентах, или 0.0 если рассчитать не удалось.
@@ -72,9 +73,9 @@ def calculate_average_engagement_rate(video_data_list):
     valid_videos_count = 0
 
     for video in video_data_list:
-        views = video.get('view_count', 0)
-        likes = video.get('like_count', 0)
-        comments = video.get('comment_count', 0)
+        views = video.view_count or 0
+        likes = video.like_count or 0
+        comments = video.comment_count or 0
 
         # Пропускаем видео без просмотров, чтобы избежать деления на ноль
         if views > 0:
@@ -83,7 +84,7 @@ def calculate_average_engagement_rate(video_data_list):
             total_er += er
             valid_videos_count += 1
         # else:
-            # print(f"DEBUG Analyzer: Skipping video (ID: {video.get('video_id', 'N/A')}) for ER calculation due to zero views.")
+            # print(f"DEBUG Analyzer: Skipping video (ID: {video.id}) for ER calculation due to zero views.")
 
 
     if valid_videos_count > 0:
@@ -94,18 +95,50 @@ def calculate_average_engagement_rate(video_data_list):
         print("DEBUG Analyzer: No videos with views found to calculate average ER.")
         return 0.0
 
-def calculate_ranks(all_channels_data):
+# Метрики ранжирования: True - больше значит лучше (ранг 1 у максимума), False - наоборот
+RANK_METRICS = {
+    'subscriber_count': True, 'observed_videos_count': True, 'avg_views': True,
+    'max_views': True, 'min_views': True, 'avg_likes': True, 'max_likes': True,
+    'min_likes': True, 'avg_duration_sec': True, 'max_duration_sec': True,
+    'min_duration_sec': False, 'avg_duration_sec_30d': True,
+    'avg_views_per_video_30d': True, 'videos_last_30d_count': True,
+    'avg_engagement_rate': True, 'views_sum_last_30d': True,
+    'view_trend_ratio': True,
+}
+
+def get_rank_metrics(extra_metrics=None):
+    """Возвращает {метрика: больше_лучше} с учетом дополнительных метрик (ранжируются по убыванию)."""
+    metrics_to_rank = dict(RANK_METRICS)
+    for metric in extra_metrics or []:
+        metrics_to_rank.setdefault(metric, True)
+    return metrics_to_rank
+
+def get_rank_value(metric, value, channel_id_debug='UNKNOWN_ID'):
+    """Приводит значение метрики к числу для ранжирования (None - канал не ранжируется по метрике)."""
+    if value is None:
+        return None
+    if metric.startswith('view_trend_ratio') and value == float('inf'):
+        return float('inf')
+    # Проверяем остальные метрики (кроме channel_name, date_added и т.п.)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str): # Попытка конвертировать строку, если она пришла (например, для subs)
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                print(f"Warning Analyzer Ranker: Could not convert string value '{value}' for metric '{metric}' on channel {channel_id_debug}")
+    return None
+
+def calculate_ranks(all_channels_data, extra_metrics=None):
+    """
+    Рассчитывает ранги каналов по набору метрик (1 = лучший, при равенстве значений ранги совпадают).
+    extra_metrics - дополнительные метрики (например, оконные), ранжируемые по убыванию.
+    """
     if not all_channels_data: return []
-    # ... (словарь metrics_to_rank остается прежним) ...
-    metrics_to_rank = {
-        'subscriber_count': True, 'observed_videos_count': True, 'avg_views': True,
-        'max_views': True, 'min_views': True, 'avg_likes': True, 'max_likes': True,
-        'min_likes': True, 'avg_duration_sec': True, 'max_duration_sec': True,
-        'min_duration_sec': False, 'avg_duration_sec_30d': True,
-        'avg_views_per_video_30d': True, 'videos_last_30d_count': True,
-        'avg_engagement_rate': True, 'views_sum_last_30d': True,
-        'view_trend_ratio': True,
-    }
+    metrics_to_rank = get_rank_metrics(extra_metrics)
     ranked_data = [channel.copy() for channel in all_channels_data]
 
     print("DEBUG Analyzer Ranker: Starting rank calculation...") # Отладка
@@ -118,23 +151,7 @@ def calculate_ranks(all_channels_data):
             channel_id_debug = channel.get('channel_id', 'UNKNOWN_ID') # Отладка
             # print(f"DEBUG Analyzer Ranker: Channel {channel_id_debug}, Raw value for {metric}: {value} (type: {type(value)})") # Детальная Отладка (можно раскомментировать)
 
-            # Попытка конвертации в числовой тип, если это ожидается
-            numeric_value = None
-            if value is not None:
-                if metric == 'view_trend_ratio' and value == float('inf'):
-                    numeric_value = float('inf')
-                # Проверяем остальные метрики (кроме channel_name, date_added и т.п.)
-                elif isinstance(value, (int, float)):
-                    numeric_value = value
-                elif isinstance(value, str): # Попытка конвертировать строку, если она пришла (например, для subs)
-                    try:
-                        numeric_value = int(value)
-                    except ValueError:
-                        try:
-                            numeric_value = float(value)
-                        except ValueError:
-                            print(f"Warning Analyzer Ranker: Could not convert string value '{value}' for metric '{metric}' on channel {channel_id_debug}")
-                            pass # Оставляем numeric_value = None
+            numeric_value = get_rank_value(metric, value, channel_id_debug)
 
             if numeric_value is not None:
                  valid_channels.append({'index': i, 'value': numeric_value})
@@ -161,4 +178,66 @@ def calculate_ranks(all_channels_data):
             last_value = current_value
 
     print("DEBUG Analyzer Ranker: Rank calculation finished.") # Отладка
-    return ranked_data
\ No newline at end of file
+    return ranked_data
+
+def _count_better(sorted_values, value, higher_is_better):
+    """Количество значений в отсортированном по возрастанию списке, строго лучших value."""
+    if higher_is_better:
+        return len(sorted_values) - bisect.bisect_right(sorted_values, value)
+    return bisect.bisect_left(sorted_values, value)
+
+def update_ranks(all_channels_data, previous_ranked, extra_metrics=None):
+    """
+    Инкрементальный пересчет рангов по результатам прошлого расчета (тот же результат, что calculate_ranks).
+
+    Ранг канала = 1 + число каналов со строго лучшим значением метрики. Поэтому для канала, значение
+    которого не изменилось, новый ранг = прежний ранг - (сколько изменившихся/удаленных каналов было лучше)
+    + (сколько изменившихся/новых каналов стало лучше) - это O(log k) на канал, где k - число изменений
+    по метрике. Ранги изменившихся каналов определяются бинарным поиском по значениям остальных.
+
+    Args:
+        all_channels_data (list): Текущие результаты каналов (без рангов или с устаревшими рангами).
+        previous_ranked (dict): {channel_id: результат канала с рангами} для ВСЕХ каналов прошлого расчета.
+        extra_metrics (list, optional): Как в calculate_ranks.
+    """
+    ranked_data = [channel.copy() for channel in all_channels_data]
+    current_ids = {channel['channel_id'] for channel in ranked_data}
+    removed = [channel for channel_id, channel in previous_ranked.items() if channel_id not in current_ids]
+
+    for metric, reverse_sort in get_rank_metrics(extra_metrics).items():
+        rank_key = f'rank_{metric}'
+        unchanged = [] # (индекс, значение, прежний ранг)
+        changed = [] # (индекс, новое значение)
+        old_changed_values = [] # Прежние значения изменившихся и удаленных каналов
+        for i, channel in enumerate(ranked_data):
+            channel_id = channel.get('channel_id', 'UNKNOWN_ID')
+            value = get_rank_value(metric, channel.get(metric), channel_id)
+            previous = previous_ranked.get(channel_id)
+            old_value = get_rank_value(metric, previous.get(metric), channel_id) if previous is not None else None
+            if previous is not None and value == old_value and (value is None or previous.get(rank_key) is not None):
+                unchanged.append((i, value, previous.get(rank_key)))
+                continue
+            if old_value is not None:
+                old_changed_values.append(old_value)
+            changed.append((i, value))
+        for channel in removed:
+            old_value = get_rank_value(metric, channel.get(metric), channel.get('channel_id', 'UNKNOWN_ID'))
+            if old_value is not None:
+                old_changed_values.append(old_value)
+
+        new_changed_values = sorted(value for _, value in changed if value is not None)
+        old_changed_values.sort()
+        for i, value, rank in unchanged:
+            if value is None:
+                ranked_data[i][rank_key] = None
+            elif new_changed_values or old_changed_values:
+                ranked_data[i][rank_key] = (rank - _count_better(old_changed_values, value, reverse_sort)
+                                            + _count_better(new_changed_values, value, reverse_sort))
+            else:
+                ranked_data[i][rank_key] = rank
+        if changed:
+            unchanged_values = sorted(value for _, value, _ in unchanged if value is not None)
+            for i, value in changed:
+                ranked_data[i][rank_key] = None if value is None else (
+                    1 + _count_better(unchanged_values, value, reverse_sort) + _count_better(new_changed_values, value, reverse_sort))
+    return ranked_data
@@ -0,0 +1,247 @@
+# anomalies.py
+"""
+Поиск аномальных видео и каналов относительно базовой линии самого канала (NumPy).
+
+Видео группы каналов (BATCH_CHANNELS каналов за раз) загружаются одним запросом и превращаются
+в столбцы NumPy; все расчеты векторные, без цикла Python по видео:
+  * просмотры в день с момента публикации (views / возраст в днях, не меньше 1 дня) и ER (%);
+  * медианы и MAD по каналам считаются сразу для всей группы: значения сортируются внутри
+    каналов (np.lexsort), медиана берется по индексам середины каждого канала;
+  * скользящая базовая линия видео - медиана метрики предыдущих BASELINE_VIDEOS видео канала
+    (sliding_window_view); для первых видео канала - медиана всего канала;
+  * робастный z-score: 0.6745 * (значение - базовая линия) / MAD канала
+    (при MAD = 0 используется 1.2533 * среднее абсолютное отклонение).
+Аномалией считается |z| >= Z_THRESHOLD при отличии от базовой линии не меньше чем на MIN_RELATIVE_CHANGE
+(у каналов с почти постоянной метрикой MAD очень мал, и без этого условия аномалиями становились бы
+незначимые колебания).
+Просмотры в день сравниваются в логарифмической шкале (log1p), т.к. распределение очень скошено.
+
+Аномалии видео: views_spike / views_drop, er_spike / er_drop (|z| >= Z_THRESHOLD).
+Аномалии канала: медиана видео за последние RECENT_DAYS дней против истории канала -
+views_surge / views_collapse, er_surge / er_collapse.
+
+Результат записывается в таблицу anomalies (для отсканированных каналов таблица перезаписывается)
+и выводится в отчете main.py. Полное сканирование БД: python anomalies.py
+"""
+import time
+import warnings
+import database
+import window_engine
+import config_loader as app_config
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    np = None
+    print("WARNING: 'numpy' library not found. Anomaly detection is unavailable. Install it using: pip install numpy")
+
+SECONDS_PER_DAY = 86400
+MAD_SCALE = 0.6745 # Приводит MAD к стандартному отклонению нормального распределения
+MEAN_AD_SCALE = 1.2533 # То же для среднего абсолютного отклонения (если MAD = 0)
+MIN_RELATIVE_CHANGE = 0.5 # Минимальное отличие значения от базовой линии (50%)
+MIN_RECENT_VIDEOS = 3 # Минимум недавних видео для сравнения канала с его историей
+
+def _group_starts(groups):
+    """Индексы начала групп в отсортированном по группам массиве кодов групп."""
+    return np.concatenate(([0], np.flatnonzero(groups[1:] != groups[:-1]) + 1))
+
+def group_medians(values, groups, group_count):
+    """
+    Медиана values для каждой группы (groups - коды 0..group_count-1, массивы любого порядка).
+    Группы без значений получают NaN.
+    """
+    medians = np.full(group_count, np.nan)
+    if values.size == 0:
+        return medians
+    # Одна сортировка вместо np.lexsort: значения каждой группы сдвигаются в свой непересекающийся диапазон
+    lowest = values.min()
+    span = values.max() - lowest + 1
+    order = np.argsort(groups * span + (values - lowest))
+    sorted_values = values[order]
+    sorted_groups = groups[order]
+    starts = _group_starts(sorted_groups)
+    counts = np.diff(np.append(starts, sorted_values.size))
+    medians[sorted_groups[starts]] = (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+    return medians
+
+def group_scales(values, groups, group_count, medians):
+    """Робастный масштаб группы: MAD, а при MAD = 0 - среднее абсолютное отклонение (в единицах z-score)."""
+    deviations = np.abs(values - medians[groups])
+    mad = group_medians(deviations, groups, group_count) / MAD_SCALE
+    mean_ad = np.bincount(groups, weights=deviations, minlength=group_count) / np.maximum(np.bincount(groups, minlength=group_count), 1)
+    scales = np.where(mad > 0, mad, mean_ad * MEAN_AD_SCALE)
+    return np.where(scales > 0, scales, np.nan)
+
+def rolling_baseline(values, positions, window, fallback):
+    """
+    Медиана предыдущих window значений той же группы для каждого элемента
+    (массив отсортирован по группам и времени, positions - номер элемента внутри группы).
+    Элементы с историей короче window получают fallback.
+    """
+    baseline = fallback.copy()
+    if values.size <= window:
+        return baseline
+    windows = sliding_window_view(values, window)[:-1] # [i] - значения values[i:i+window]
+    if np.isnan(values).any():
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning) # Окна только из NaN (видео без просмотров для ER)
+            window_medians = np.nanmedian(windows, axis=1)
+    else:
+        window_medians = np.median(windows, axis=1)
+    has_history = np.flatnonzero(positions >= window)
+    history_medians = window_medians[has_history - window]
+    baseline[has_history] = np.where(np.isnan(history_medians), baseline[has_history], history_medians)
+    return baseline
+
+def _relative_change_mask(values, baseline):
+    """Значения, отличающиеся от базовой линии не меньше чем на MIN_RELATIVE_CHANGE (в исходных единицах)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs(values - baseline) >= MIN_RELATIVE_CHANGE * np.abs(baseline)
+
+def detect_batch(rows, reference_ts, settings):
+    """
+    Находит аномалии в видео группы каналов.
+
+    Args:
+        rows (list): Кортежи (channel_id, video_id, published_at, view_count, like_count, comment_count),
+                     отсортированные по каналу и дате публикации.
+        reference_ts (int): Опорная точка (Unix timestamp).
+        settings (dict): z_threshold, min_videos, baseline_videos, recent_days.
+
+    Returns:
+        list: Кортежи (scope, entity_id, channel_id, kind, metric_value, baseline, score).
+    """
+    if not rows:
+        return []
+    channel_col, video_col, published_col, views_col, likes_col, comments_col = zip(*rows)
+    channel_ids = np.array(channel_col, dtype=object)
+    published = np.array(published_col, dtype=np.float64)
+    views = np.array(views_col, dtype=np.float64)
+    likes = np.array([value or 0 for value in likes_col], dtype=np.float64)
+    comments = np.array([value or 0 for value in comments_col], dtype=np.float64)
+
+    starts = _group_starts(channel_ids)
+    group_count = starts.size
+    sizes = np.diff(np.append(starts, channel_ids.size))
+    groups = np.repeat(np.arange(group_count), sizes)
+    positions = np.arange(channel_ids.size) - starts[groups]
+    group_names = channel_ids[starts]
+    enough = sizes >= settings['min_videos'] # Каналы с достаточной историей для базовой линии
+
+    age_days = np.maximum((reference_ts - published) / SECONDS_PER_DAY, 1.0)
+    views_per_day = views / age_days
+    with np.errstate(divide='ignore', invalid='ignore'):
+        engagement = np.where(views > 0, (likes + comments) / views * 100, np.nan)
+
+    results = []
+    recent = published >= reference_ts - settings['recent_days'] * SECONDS_PER_DAY
+    threshold = settings['z_threshold']
+    for metric_name, values, transform, inverse in (
+            ('views', views_per_day, np.log1p, np.expm1),
+            ('er', engagement, None, None)):
+        scaled = transform(values) if transform else values
+        valid = ~np.isnan(scaled)
+
+        # --- Видео: отклонение от скользящей базовой линии канала ---
+        valid_groups = groups[valid]
+        medians = group_medians(scaled[valid], valid_groups, group_count)
+        scales = group_scales(scaled[valid], valid_groups, group_count, medians)
+        baseline = rolling_baseline(scaled, positions, settings['baseline_videos'], medians[groups])
+        baseline_values = inverse(baseline) if inverse else baseline
+        with np.errstate(invalid='ignore'):
+            scores = (scaled - baseline) / scales[groups]
+            flagged = np.flatnonzero(valid & enough[groups] & (np.abs(scores) >= threshold)
+                                     & _relative_change_mask(values, baseline_values))
+        for i in flagged:
+            kind = f"{metric_name}_spike" if scores[i] > 0 else f"{metric_name}_drop"
+            results.append(('video', video_col[i], group_names[groups[i]], kind,
+                            float(values[i]), float(baseline_values[i]), round(float(scores[i]), 3)))
+
+        # --- Канал: недавние видео против истории канала ---
+        history = valid & ~recent
+        recent_valid = valid & recent
+        history_medians = group_medians(scaled[history], groups[history], group_count)
+        history_scales = group_scales(scaled[history], groups[history], group_count, history_medians)
+        recent_medians = group_medians(scaled[recent_valid], groups[recent_valid], group_count)
+        history_counts = np.bincount(groups[history], minlength=group_count)
+        recent_counts = np.bincount(groups[recent_valid], minlength=group_count)
+        recent_values = inverse(recent_medians) if inverse else recent_medians
+        history_values = inverse(history_medians) if inverse else history_medians
+        with np.errstate(invalid='ignore'):
+            channel_scores = (recent_medians - history_medians) / history_scales
+            flagged = np.flatnonzero((history_counts >= settings['min_videos']) & (recent_counts >= MIN_RECENT_VIDEOS)
+                                     & (np.abs(channel_scores) >= threshold) & _relative_change_mask(recent_values, history_values))
+        for g in flagged:
+            kind = f"{metric_name}_surge" if channel_scores[g] > 0 else f"{metric_name}_collapse"
+            results.append(('channel', group_names[g], group_names[g], kind,
+                            float(recent_values[g]), float(history_values[g]), round(float(channel_scores[g]), 3)))
+    return results
+
+def get_settings():
+    """Параметры поиска аномалий из секции [ANOMALIES] конфигурации."""
+    return {
+        'z_threshold': app_config.ANOMALIES_Z_THRESHOLD,
+        'min_videos': app_config.ANOMALIES_MIN_VIDEOS,
+        'baseline_videos': app_config.ANOMALIES_BASELINE_VIDEOS,
+        'recent_days': app_config.ANOMALIES_RECENT_DAYS,
+    }
+
+def detect_anomalies(conn, channel_ids, reference_date, batch_channels=None):
+    """
+    Ищет аномалии для каналов пакетами и сохраняет их в таблицу anomalies.
+
+    Returns:
+        dict | None: Сводка {'channels', 'videos', 'anomalies', 'seconds'} или None, если NumPy не установлен.
+    """
+    if np is None:
+        print("ERROR Anomalies: 'numpy' is not installed. Skipping anomaly detection.")
+        return None
+    batch_channels = min(batch_channels or app_config.ANOMALIES_BATCH_CHANNELS, database.SQLITE_MAX_VARIABLES - 1)
+    reference_ts = window_engine.get_reference_timestamp(reference_date)
+    settings = get_settings()
+    started = time.perf_counter()
+    summary = {'channels': len(channel_ids), 'videos': 0, 'anomalies': 0}
+    for i in range(0, len(channel_ids), batch_channels):
+        batch = list(channel_ids[i:i + batch_channels])
+        rows = database.get_video_metrics_for_channels(conn, batch, reference_ts)
+        found = detect_batch(rows, reference_ts, settings)
+        database.save_anomalies(conn, batch, found, reference_date)
+        summary['videos'] += len(rows)
+        summary['anomalies'] += len(found)
+    summary['seconds'] = round(time.perf_counter() - started, 2)
+    print(f"DEBUG Anomalies: {summary['anomalies']} anomalies in {summary['videos']} videos of "
+          f"{summary['channels']} channels ({summary['seconds']}s).")
+    return summary
+
+def format_anomalies(anomalies):
+    """Строки таблицы отчета по аномалиям (результат database.get_anomalies)."""
+    table_data = []
+    for anomaly in anomalies:
+        metric_format = "{:,.0f}" if anomaly['kind'].startswith('views') else "{:.2f}"
+        entity = anomaly['title'] if anomaly['scope'] == 'video' and anomaly['title'] else anomaly['entity_id']
+        table_data.append([
+            anomaly['channel_name'] or anomaly['channel_id'], anomaly['scope'], entity, anomaly['kind'],
+            metric_format.format(anomaly['metric_value']), metric_format.format(anomaly['baseline']),
+            f"{anomaly['score']:+.1f}"])
+    return table_data
+
+ANOMALY_HEADERS = ["Channel", "Scope", "Video / Channel", "Kind", "Value", "Baseline", "Z"]
+
+if __name__ == "__main__":
+    try:
+        from tabulate import tabulate
+    except ImportError:
+        tabulate = None
+    conn = database.connect_db()
+    if conn:
+        database.create_tables(conn)
+        reference_date = window_engine.get_reference_date(app_config.REFERENCE_DATE)
+        if detect_anomalies(conn, database.get_all_channel_ids(conn), reference_date):
+            table_data = format_anomalies(database.get_anomalies(conn, limit=app_config.ANOMALIES_REPORT_LIMIT))
+            if tabulate:
+                print(tabulate(table_data, headers=ANOMALY_HEADERS, tablefmt="grid"))
+            else:
+                for row in table_data: print(" | ".join(map(str, row)))
+        conn.close()
+        print("DEBUG DB: Database connection closed.")
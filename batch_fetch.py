@@ -0,0 +1,209 @@
+# batch_fetch.py
+"""
+Пакетная загрузка каналов: много небольших запросов к API в одном HTTP-запросе.
+
+У большинства каналов из длинного хвоста списка мало видео: одна страница playlistItems.list
+и один небольшой videos.list. При синхронной загрузке каждый такой вызов - отдельный HTTP-запрос
+со своей задержкой. Здесь независимые запросы разных каналов объединяются в пакетные HTTP-запросы
+googleapiclient (youtube_api.execute_batch, new_batch_http_request):
+  * загрузка идет волнами: в каждой волне для каждого активного канала запрашивается следующая
+    страница плейлиста загрузок и все уже известные пакеты по 50 ID видео;
+  * ответы возвращаются в обработчики своего канала (ChannelFetch), канал записывается в БД
+    (pipeline.save_fetched_channel) сразу после получения всех его данных;
+  * одновременно загружается не больше MAX_ACTIVE_CHANNELS_PER_BATCH * BATCH_API_MAX_REQUESTS
+    каналов, поэтому память не зависит от длины списка;
+  * подзапросы, завершившиеся временной ошибкой, повторяются по одному (execute_batch).
+Каждый подзапрос расходует квоту и проходит через ограничитель частоты так же, как обычный вызов,
+а результаты совпадают с синхронной загрузкой.
+
+Включается в config.ini: [BATCH_API] ENABLED = True.
+"""
+import time
+from datetime import datetime
+from functools import partial
+from googleapiclient.errors import HttpError
+import youtube_api
+import database
+import pipeline
+import config_loader as app_config
+
+MAX_IDS_PER_REQUEST = 50
+MAX_ACTIVE_CHANNELS_PER_BATCH = 1 # Активных каналов на один пакетный HTTP-запрос волны
+
+def _is_quota_exceeded(exception):
+    return getattr(getattr(exception, 'resp', None), 'status', None) == 403 and 'quotaExceeded' in str(getattr(exception, 'content', ''))
+
+def _report_error(exception, what):
+    """Выводит ошибку подзапроса так же, как синхронный клиент."""
+    if isinstance(exception, HttpError):
+        print(f"An HTTP error {exception.resp.status} occurred while fetching {what}:\n{exception.content}")
+        if _is_quota_exceeded(exception):
+            print(f"!!! YouTube API Quota Exceeded during {what} fetch !!!")
+    else:
+        print(f"An unexpected error occurred while fetching {what}: {exception}")
+
+class ChannelFetch:
+    """Состояние загрузки одного канала и обработчики ответов его запросов."""
+
+    def __init__(self, channel_id, channel_info, max_videos, fetch_date):
+        self.channel_id = channel_id
+        self.channel_info = channel_info
+        self.max_videos = max_videos
+        self.fetch_date = fetch_date
+        self.playlist_id = channel_info.get('uploads_playlist_id')
+        self.video_ids = []
+        self.next_page_token = None
+        self.playlist_done = not self.playlist_id
+        self.requested_ids = 0 # Сколько ID видео уже запрошено через videos.list
+        self.chunks = [] # Результаты videos.list в порядке пакетов ID (None - пакет не получен)
+        self.pending = 0 # Запросов канала в текущей волне
+        self.quota_exceeded = False
+        if not self.playlist_id:
+            print(f"Warning: No uploads playlist ID found for {channel_id}")
+
+    def is_done(self):
+        return self.pending == 0 and self.playlist_done and self.requested_ids >= len(self.video_ids)
+
+    def next_requests(self, youtube):
+        """
+        Запросы канала для следующей волны: следующая страница плейлиста и полные пакеты
+        по 50 ID видео (последний неполный пакет - после чтения всего плейлиста).
+
+        Returns:
+            list: [(запрос, эндпоинт, обработчик)] для youtube_api.execute_batch.
+        """
+        requests = []
+        if not self.playlist_done:
+            request = youtube.playlistItems().list(part='contentDetails', playlistId=self.playlist_id,
+                                                   maxResults=MAX_IDS_PER_REQUEST, pageToken=self.next_page_token)
+            requests.append((request, 'playlistItems.list', self.on_playlist_page))
+        while self.requested_ids < len(self.video_ids) and (self.playlist_done or len(self.video_ids) - self.requested_ids >= MAX_IDS_PER_REQUEST):
+            chunk_ids = self.video_ids[self.requested_ids:self.requested_ids + MAX_IDS_PER_REQUEST]
+            self.requested_ids += len(chunk_ids)
+            self.chunks.append(None)
+            request = youtube.videos().list(part="snippet,contentDetails,statistics", id=','.join(chunk_ids),
+                                            maxResults=MAX_IDS_PER_REQUEST)
+            requests.append((request, 'videos.list', partial(self.on_video_details, len(self.chunks) - 1)))
+        self.pending = len(requests)
+        return requests
+
+    def on_playlist_page(self, response, exception):
+        self.pending -= 1
+        if exception is not None:
+            _report_error(exception, "playlist items")
+            self.quota_exceeded = self.quota_exceeded or _is_quota_exceeded(exception)
+            self.playlist_done = True # Как и синхронный клиент, используем то, что успели собрать
+            return
+        for item in response.get('items', []):
+            video_id = item.get('contentDetails', {}).get('videoId')
+            if video_id:
+                self.video_ids.append(video_id)
+                if self.max_videos is not None and len(self.video_ids) >= self.max_videos:
+                    break
+        self.next_page_token = response.get('nextPageToken')
+        if not self.next_page_token or (self.max_videos is not None and len(self.video_ids) >= self.max_videos):
+            self.playlist_done = True
+
+    def on_video_details(self, chunk_index, response, exception):
+        self.pending -= 1
+        if exception is not None:
+            _report_error(exception, "video details")
+            self.quota_exceeded = self.quota_exceeded or _is_quota_exceeded(exception)
+            return # Пакет пропускается, как и в синхронном клиенте
+        self.chunks[chunk_index] = [youtube_api.parse_video_item(item, self.fetch_date) for item in response.get('items', [])]
+
+    def get_videos(self):
+        return [video for chunk in self.chunks if chunk for video in chunk]
+
+def get_channels_details(youtube, channel_ids):
+    """
+    Получает информацию о каналах: запросы channels.list по 50 ID объединяются в пакетные HTTP-запросы.
+
+    Returns:
+        dict: {channel_id: информация о канале} для найденных каналов (как youtube_api.get_channels_details).
+    """
+    channels = {}
+
+    def on_channels(response, exception):
+        if exception is not None:
+            _report_error(exception, "channel details")
+            return
+        for channel_item in response.get('items', []):
+            channels[channel_item['id']] = youtube_api.parse_channel_item(channel_item['id'], channel_item)
+
+    requests = []
+    for i in range(0, len(channel_ids), MAX_IDS_PER_REQUEST):
+        request = youtube.channels().list(part="snippet,contentDetails,statistics",
+                                          id=','.join(channel_ids[i:i + MAX_IDS_PER_REQUEST]), maxResults=MAX_IDS_PER_REQUEST)
+        requests.append((request, 'channels.list', on_channels))
+    youtube_api.execute_batch(requests)
+    print(f"Fetched details for {len(channels)} of {len(channel_ids)} channels.")
+    return channels
+
+def fetch_channels(conn, channel_ids, max_videos, known_counts=None):
+    """
+    Загружает каналы пакетными HTTP-запросами и сохраняет каждый в БД по мере готовности.
+
+    Args:
+        conn: Объект соединения с БД.
+        channel_ids (list): ID каналов.
+        max_videos (int | None): Лимит видео канала (None - все).
+        known_counts (dict, optional): {channel_id: число видео канала в БД до загрузки};
+                                       None - запросить из БД одним запросом.
+
+    Returns:
+        dict: {channel_id: результат pipeline.save_fetched_channel без списка видео}.
+    """
+    youtube = youtube_api.get_authenticated_service()
+    if not youtube: return {}
+    channel_ids = list(channel_ids)
+    if known_counts is None:
+        known_counts = {channel_id: info[3] for channel_id, info in database.get_channels_db_info(conn, channel_ids).items()}
+    fetch_date = datetime.now().date().isoformat() # Дата сбора данных (одна строка на весь вызов)
+    max_active = MAX_ACTIVE_CHANNELS_PER_BATCH * app_config.BATCH_API_MAX_REQUESTS
+
+    results = {}
+    channels_details = get_channels_details(youtube, channel_ids)
+    channel_iter = iter(channel_id for channel_id in channel_ids if channel_id in channels_details)
+    active = []
+    quota_exceeded = False
+    while True:
+        if not quota_exceeded:
+            for channel_id in channel_iter:
+                active.append(ChannelFetch(channel_id, channels_details[channel_id], max_videos, fetch_date))
+                if len(active) >= max_active:
+                    break
+        if not active:
+            break
+        requests = [] if quota_exceeded else [request for channel in active for request in channel.next_requests(youtube)]
+        if requests:
+            youtube_api.execute_batch(requests)
+        quota_exceeded = quota_exceeded or any(channel.quota_exceeded for channel in active)
+
+        still_active = []
+        for channel in active:
+            if channel.is_done() or quota_exceeded: # После исчерпания квоты сохраняется то, что успели получить
+                result = pipeline.save_fetched_channel(conn, channel.channel_id, channel.channel_info,
+                                                       channel.get_videos(), known_counts.get(channel.channel_id))
+                result['videos'] = [] # Видео уже в БД, не держим их в памяти до конца загрузки
+                results[channel.channel_id] = result
+            else:
+                still_active.append(channel)
+        active = still_active
+    return results
+
+def run_batch_fetch(conn, channel_ids, max_videos):
+    """
+    Точка входа для main.py: загружает каналы пакетными HTTP-запросами.
+
+    Returns:
+        dict: {channel_id: результат загрузки}.
+    """
+    print(f"\n=== Batch fetch: {len(channel_ids)} channels, up to {app_config.BATCH_API_MAX_REQUESTS} API calls per HTTP request ===")
+    started = time.perf_counter()
+    results = fetch_channels(conn, channel_ids, max_videos)
+    stats = youtube_api.batch_stats
+    print(f"DEBUG Batch fetch: {len(results)} channels fetched, {len(channel_ids) - len(results)} failed "
+          f"in {time.perf_counter() - started:.1f}s, {stats['requests']} API calls in {stats['batches']} HTTP requests "
+          f"({stats['retried']} retried one by one), API calls: {youtube_api.api_call_counts}")
+    return results
@@ -0,0 +1,187 @@
+# channel_sources.py
+"""
+Загрузка списков каналов из одного или нескольких файлов.
+
+Формат файла (одна запись на строку):
+  UCxxxxxxxxxxxxxxxxxxxxxx                 - ID канала
+  https://www.youtube.com/channel/UC...    - URL канала с ID (ID берется из URL без запроса к API)
+  @handle, https://www.youtube.com/@handle - handle канала
+  https://www.youtube.com/user/name        - старое имя пользователя
+  https://www.youtube.com/c/name           - пользовательский URL (разрешается как handle)
+  # group: Название                        - тег группы для следующих строк файла (до следующей директивы)
+  # комментарий                            - пустые строки и комментарии пропускаются
+
+Файлы читаются построчно (в памяти только уникальные записи), записи дедуплицируются,
+формат проверяется до обращения к API: некорректные строки отбрасываются с предупреждением,
+а не тратят вызов API. Handle и имена пользователей разрешаются в ID через channels.list
+(1 единица квоты) с постоянным кэшем в таблице channel_resolution: каждый handle стоит квоты
+не более одного раза (в том числе, если канал не найден).
+"""
+import re
+import time
+import database
+import youtube_api
+
+CHANNEL_ID_LENGTH = 24
+CHANNEL_ID_RE = re.compile(r'UC[A-Za-z0-9_-]{22}')
+CHANNEL_URL_RE = re.compile(r'(?:https?://)?(?:www\.|m\.)?youtube\.com/(channel/|user/|c/|@)([^/?#\s]+)', re.IGNORECASE)
+HANDLE_RE = re.compile(r'@[A-Za-z0-9._-]{3,30}')
+USERNAME_RE = re.compile(r'[A-Za-z0-9._-]{1,100}')
+GROUP_DIRECTIVE_RE = re.compile(r'#\s*group\s*:\s*(.*)', re.IGNORECASE)
+
+class ChannelList:
+    """Результат загрузки: ID каналов в порядке первого появления и теги групп."""
+
+    def __init__(self):
+        self.ids = []
+        self.groups = {} # channel_id -> [теги групп] (только для каналов с тегами)
+        self.stats = {'lines': 0, 'duplicates': 0, 'invalid': 0,
+                      'resolved_cached': 0, 'resolved_api': 0, 'unresolved': 0}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def group_names(self):
+        """Все теги групп в порядке первого появления."""
+        names = {}
+        for tags in self.groups.values():
+            for tag in tags:
+                names.setdefault(tag, None)
+        return list(names)
+
+    def channels_in_group(self, group):
+        return [channel_id for channel_id in self.ids if group in self.groups.get(channel_id, ())]
+
+def parse_entry(entry):
+    """
+    Разбирает запись списка каналов.
+
+    Returns:
+        str | None: ID канала, ключ для разрешения ('handle:@name' / 'user:name')
+                    или None, если формат не распознан.
+    """
+    # Быстрый путь для основной массы строк - готовых ID
+    if len(entry) == CHANNEL_ID_LENGTH and CHANNEL_ID_RE.fullmatch(entry):
+        return entry
+    if entry.startswith('@'):
+        return f"handle:{entry.lower()}" if HANDLE_RE.fullmatch(entry) else None
+    match = CHANNEL_URL_RE.match(entry)
+    if not match:
+        return None
+    kind, value = match.group(1).lower(), match.group(2)
+    if kind == 'channel/':
+        return value if CHANNEL_ID_RE.fullmatch(value) else None
+    if kind == 'user/':
+        return f"user:{value.lower()}" if USERNAME_RE.fullmatch(value) else None
+    handle = '@' + value.lstrip('@')
+    return f"handle:{handle.lower()}" if HANDLE_RE.fullmatch(handle) else None
+
+def _read_file_entries(filename, entries, stats):
+    """
+    Построчно читает файл и добавляет записи в entries ({ключ записи: [теги групп] или None}, порядок
+    первого появления). Готовые ID проверяются одним fullmatch без вызова parse_entry (основная масса строк).
+    """
+    group = None
+    fullmatch = CHANNEL_ID_RE.fullmatch
+    line_number = 0
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            entry = line.strip()
+            if len(entry) != CHANNEL_ID_LENGTH or not fullmatch(entry):
+                if not entry:
+                    continue
+                if entry[0] == '#':
+                    directive = GROUP_DIRECTIVE_RE.match(entry)
+                    if directive:
+                        group = directive.group(1).strip() or None
+                    continue
+                key = parse_entry(entry)
+                if key is None:
+                    stats['invalid'] += 1
+                    print(f"WARNING: Invalid channel entry '{entry}' in '{filename}' line {line_number}. Skipping.")
+                    continue
+                entry = key
+            if entry in entries:
+                stats['duplicates'] += 1
+                if group is not None:
+                    entries[entry] = _merge_tags(entries[entry], [group])
+            else:
+                entries[entry] = [group] if group is not None else None
+    stats['lines'] += line_number
+
+def _merge_tags(tags, new_tags):
+    if not new_tags:
+        return tags
+    if not tags:
+        return list(new_tags)
+    tags.extend(tag for tag in new_tags if tag not in tags)
+    return tags
+
+def _resolve_sources(conn, sources, resolve, stats):
+    """Разрешает ключи handle/user в ID каналов через кэш в БД и, при resolve=True, через API."""
+    resolved = database.get_channel_resolutions(conn, sources)
+    stats['resolved_cached'] = sum(1 for source in sources if source in resolved)
+    for source in sources:
+        if source in resolved or not resolve:
+            continue
+        kind, value = source.split(':', 1)
+        channel_id = youtube_api.resolve_channel_id(handle=value) if kind == 'handle' else youtube_api.resolve_channel_id(username=value)
+        if channel_id is False:
+            continue # Ошибка запроса - не кэшируем, попробуем при следующем запуске
+        stats['resolved_api'] += 1
+        resolved[source] = channel_id
+        database.save_channel_resolution(conn, source, channel_id)
+    return resolved
+
+def load_channel_list(filenames, conn=None, resolve=True):
+    """
+    Загружает каналы из файлов.
+
+    Args:
+        filenames (str | list): Путь к файлу или список путей.
+        conn: Соединение с БД для кэша разрешения handle (None - handle не разрешаются).
+        resolve (bool): Разрешать ли через API handle, которых нет в кэше
+                        (False - только кэш, например для соединения только для чтения).
+
+    Returns:
+        ChannelList: ID каналов без повторов и их теги групп.
+    """
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    started = time.perf_counter()
+    channel_list = ChannelList()
+    stats = channel_list.stats
+    entries = {} # ключ записи -> [теги групп] или None, в порядке первого появления
+
+    for filename in filenames:
+        try:
+            _read_file_entries(filename, entries, stats)
+        except FileNotFoundError:
+            print(f"ERROR: Channels file '{filename}' not found.")
+        except Exception as e:
+            print(f"ERROR: Failed to read channels file '{filename}': {e}")
+
+    sources = [key for key in entries if ':' in key]
+    resolved = _resolve_sources(conn, sources, resolve, stats) if sources and conn else {}
+
+    if sources:
+        # Замена ключей handle/URL на ID каналов с повторной дедупликацией
+        channels = {}
+        for key, tags in entries.items():
+            channel_id = resolved.get(key) if ':' in key else key
+            if not channel_id:
+                stats['unresolved'] += 1
+            elif channel_id in channels:
+                stats['duplicates'] += 1 # Handle указывает на уже перечисленный канал
+                channels[channel_id] = _merge_tags(channels[channel_id], tags)
+            else:
+                channels[channel_id] = tags
+        entries = channels
+    channel_list.ids = list(entries)
+    channel_list.groups = {channel_id: tags for channel_id, tags in entries.items() if tags}
+
+    print(f"DEBUG: Loaded {len(channel_list.ids)} channel IDs from {', '.join(filenames)} in "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms ({stats['lines']} lines, {stats['duplicates']} duplicates, "
+          f"{stats['invalid']} invalid, {len(sources)} handles/URLs: {stats['resolved_cached']} cached, "
+          f"{stats['resolved_api']} resolved via API, {stats['unresolved']} unresolved).")
+    return channel_list
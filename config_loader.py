@@ -1,7 +1,9 @@
 # config_loader.py
 import configparser
 import os
+import re
 import sys
+from datetime import date
 
 CONFIG_FILENAME = 'config.ini'
 
@@ -12,6 +14,103 @@ DEFAULT_CHANNELS_FILE = 'channels_default.txt'
 DEFAULT_MAX_VIDEOS = 50
 DEFAULT_FETCH_API = True
 DEFAULT_ANALYZE_DB = True
+DEFAULT_ANALYSIS_WINDOWS = [7, 30, 90, 365] # Окна анализа в днях
+DEFAULT_REFERENCE_DATE = None # None означает "сегодня" (фиксируется один раз на запуск)
+DEFAULT_ANALYSIS_CACHE = True # Кэш результатов анализа между запусками (analysis_cache.py)
+DEFAULT_ANALYSIS_WORKERS = 1 # Процессы анализа каналов (parallel_analysis.py): 1 - последовательно, 0 - по числу ядер
+DEFAULT_EXPORT_ENABLED = False
+DEFAULT_EXPORT_DIRECTORY = 'export'
+DEFAULT_EXPORT_FORMAT = 'parquet' # parquet | arrow
+DEFAULT_EXPORT_PARTITION_BY = 'none' # none | channel | month
+DEFAULT_EXPORT_INCREMENTAL = True
+DEFAULT_EXPORT_BATCH_SIZE = 50000
+DEFAULT_DAEMON_DAILY_QUOTA = 10000 # Бюджет единиц квоты API в сутки (квота сбрасывается в полночь по тихоокеанскому времени)
+DEFAULT_DAEMON_MIN_REFRESH_HOURS = 1.0 # Минимальный интервал обновления активного канала
+DEFAULT_DAEMON_MAX_REFRESH_HOURS = 168.0 # Максимальный интервал обновления неактивного канала
+DEFAULT_DAEMON_POLL_INTERVAL_SEC = 30 # Период проверки очереди и изменений файла каналов
+DEFAULT_SERVER_HOST = '127.0.0.1'
+DEFAULT_SERVER_PORT = 8080
+DEFAULT_SHARDING_ENABLED = False
+DEFAULT_SHARDING_WORKERS = 0 # 0 - по числу ядер, но не больше числа ключей API
+DEFAULT_SHARDING_STAGING_DIR = 'staging'
+DEFAULT_SHARDING_KEEP_STAGING = False
+DEFAULT_ASYNC_API_ENABLED = False
+DEFAULT_ASYNC_API_MAX_CONCURRENT_REQUESTS = 10 # Одновременных HTTP-запросов (и размер пула соединений)
+DEFAULT_ASYNC_API_TIMEOUT_SEC = 30
+DEFAULT_BATCH_API_ENABLED = False
+DEFAULT_BATCH_API_MAX_REQUESTS = 50 # Запросов API в одном пакетном HTTP-запросе (ограничение API - 1000)
+DEFAULT_RATE_LIMIT_ENABLED = True
+DEFAULT_RATE_LIMIT_REQUESTS_PER_SEC = 20.0 # Запросов в секунду на один ключ API (все эндпоинты)
+DEFAULT_RATE_LIMIT_BURST = 20 # Емкость корзины: сколько запросов можно отправить подряд без пауз
+DEFAULT_RATE_LIMIT_ENDPOINT_LIMITS = {} # Отдельные лимиты эндпоинтов: {'videos.list': 10.0}
+DEFAULT_RATE_LIMIT_RETRIES = 3 # Повторов запроса после ошибки rateLimitExceeded / 429
+DEFAULT_ANOMALIES_ENABLED = False
+DEFAULT_ANOMALIES_Z_THRESHOLD = 3.5 # Порог |робастный z-score| для аномалии
+DEFAULT_ANOMALIES_MIN_VIDEOS = 10 # Минимум видео канала для базовой линии
+DEFAULT_ANOMALIES_BASELINE_VIDEOS = 20 # Скользящая базовая линия: предыдущие N видео канала
+DEFAULT_ANOMALIES_RECENT_DAYS = 30 # Недавние видео канала (сравниваются с историей канала)
+DEFAULT_ANOMALIES_BATCH_CHANNELS = 500 # Каналов в одном пакете загрузки
+DEFAULT_ANOMALIES_REPORT_LIMIT = 20 # Строк в отчете main.py
+DEFAULT_REPORT_SORT_BY = 'rank_avg_views' # Колонка ранга для сортировки итоговой таблицы
+DEFAULT_REPORT_FILTER = [] # Условия по колонкам рангов: [('rank_avg_views', '<=', 100)]
+DEFAULT_REPORT_TOP_N = 0 # 0 - все каналы
+DEFAULT_REPORT_PAGE_SIZE = 0 # Строк на страницу таблицы, 0 - одна таблица
+DEFAULT_REPORT_PAGE = 0 # Номер выводимой страницы, 0 - все страницы
+DEFAULT_REPORT_TABLE_FORMAT = 'grid' # Формат tabulate, 'stream' (фиксированная ширина колонок) или 'none'
+DEFAULT_REPORT_CSV_FILE = None
+DEFAULT_REPORT_JSONL_FILE = None
+DEFAULT_STORAGE_PARTITION_DIR = 'partitions'
+DEFAULT_STORAGE_PARTITION_PERIOD = 'year' # year | month
+DEFAULT_STORAGE_HOT_DAYS = 180 # Видео, опубликованные раньше, переносятся из основной БД в партиции
+DEFAULT_STORAGE_HISTORY_FULL_DAYS = 30 # История счетчиков младше этого срока хранится полностью
+DEFAULT_STORAGE_HISTORY_DOWNSAMPLE = 'week' # week | month - один снимок на видео за период для старой истории
+DEFAULT_STORAGE_VACUUM_PAGES = 0 # Страниц за один incremental_vacuum (0 - все свободные)
+DEFAULT_STORAGE_COMPACT_AFTER_RUN = False
+BASE_WINDOW_DAYS = 30 # Окно, на котором построены основная таблица и ранги (всегда включается)
+
+def parse_file_list(files_str):
+    """Разбирает список файлов через запятую ('a.txt, b.txt') в список путей."""
+    return [part.strip() for part in files_str.split(',') if part.strip()]
+
+def parse_endpoint_limits(limits_str):
+    """Разбирает строку вида 'videos.list: 10, playlistItems.list: 5' в словарь {эндпоинт: запросов в секунду}."""
+    limits = {}
+    for part in limits_str.split(','):
+        if not part.strip():
+            continue
+        endpoint, separator, rate = part.partition(':')
+        if not separator or not endpoint.strip():
+            raise ValueError(f"endpoint limit must look like 'videos.list: 10', got '{part.strip()}'")
+        limits[endpoint.strip()] = float(rate)
+        if limits[endpoint.strip()] <= 0:
+            raise ValueError(f"endpoint limit must be positive, got '{part.strip()}'")
+    return limits
+
+def parse_rank_filter(filter_str):
+    """
+    Разбирает условия вида 'rank_avg_views <= 100, rank_view_trend_ratio < 10'
+    в список [(колонка ранга, оператор, число)].
+    """
+    conditions = []
+    for part in filter_str.split(','):
+        if not part.strip():
+            continue
+        match = re.fullmatch(r"\s*(rank_\w+)\s*(<=|>=|<|>|=)\s*(\d+)\s*", part)
+        if not match:
+            raise ValueError(f"filter condition must look like 'rank_avg_views <= 100', got '{part.strip()}'")
+        conditions.append((match.group(1), match.group(2), int(match.group(3))))
+    return conditions
+
+def parse_windows(windows_str):
+    """
+    Разбирает строку вида '7, 30, 90, 365' в отсортированный список уникальных окон (в днях).
+    Базовое 30-дневное окно добавляется всегда.
+    """
+    windows = {int(part) for part in windows_str.split(',') if part.strip()}
+    if any(w <= 0 for w in windows):
+        raise ValueError(f"window sizes must be positive integers, got '{windows_str}'")
+    windows.add(BASE_WINDOW_DAYS)
+    return sorted(windows)
 
 # --- Чтение конфигурации ---
 config = configparser.ConfigParser(allow_no_value=True) # allow_no_value для пустых ключей, если нужно
@@ -25,6 +124,58 @@ if not loaded_files:
     MAX_VIDEOS_TO_FETCH_PER_CHANNEL = DEFAULT_MAX_VIDEOS
     FETCH_DATA_FROM_API = DEFAULT_FETCH_API
     ANALYZE_DATA_FROM_DB = DEFAULT_ANALYZE_DB
+    ANALYSIS_WINDOWS = DEFAULT_ANALYSIS_WINDOWS
+    REFERENCE_DATE = DEFAULT_REFERENCE_DATE
+    ANALYSIS_CACHE_ENABLED = DEFAULT_ANALYSIS_CACHE
+    ANALYSIS_WORKERS = DEFAULT_ANALYSIS_WORKERS
+    EXPORT_ENABLED = DEFAULT_EXPORT_ENABLED
+    EXPORT_DIRECTORY = DEFAULT_EXPORT_DIRECTORY
+    EXPORT_FORMAT = DEFAULT_EXPORT_FORMAT
+    EXPORT_PARTITION_BY = DEFAULT_EXPORT_PARTITION_BY
+    EXPORT_INCREMENTAL = DEFAULT_EXPORT_INCREMENTAL
+    EXPORT_BATCH_SIZE = DEFAULT_EXPORT_BATCH_SIZE
+    DAEMON_DAILY_QUOTA = DEFAULT_DAEMON_DAILY_QUOTA
+    DAEMON_MIN_REFRESH_HOURS = DEFAULT_DAEMON_MIN_REFRESH_HOURS
+    DAEMON_MAX_REFRESH_HOURS = DEFAULT_DAEMON_MAX_REFRESH_HOURS
+    DAEMON_POLL_INTERVAL_SEC = DEFAULT_DAEMON_POLL_INTERVAL_SEC
+    SERVER_HOST = DEFAULT_SERVER_HOST
+    SERVER_PORT = DEFAULT_SERVER_PORT
+    SHARDING_ENABLED = DEFAULT_SHARDING_ENABLED
+    SHARDING_WORKERS = DEFAULT_SHARDING_WORKERS
+    SHARDING_STAGING_DIR = DEFAULT_SHARDING_STAGING_DIR
+    SHARDING_KEEP_STAGING = DEFAULT_SHARDING_KEEP_STAGING
+    ASYNC_API_ENABLED = DEFAULT_ASYNC_API_ENABLED
+    ASYNC_API_MAX_CONCURRENT_REQUESTS = DEFAULT_ASYNC_API_MAX_CONCURRENT_REQUESTS
+    ASYNC_API_TIMEOUT_SEC = DEFAULT_ASYNC_API_TIMEOUT_SEC
+    BATCH_API_ENABLED = DEFAULT_BATCH_API_ENABLED
+    BATCH_API_MAX_REQUESTS = DEFAULT_BATCH_API_MAX_REQUESTS
+    RATE_LIMIT_ENABLED = DEFAULT_RATE_LIMIT_ENABLED
+    RATE_LIMIT_REQUESTS_PER_SEC = DEFAULT_RATE_LIMIT_REQUESTS_PER_SEC
+    RATE_LIMIT_BURST = DEFAULT_RATE_LIMIT_BURST
+    RATE_LIMIT_ENDPOINT_LIMITS = DEFAULT_RATE_LIMIT_ENDPOINT_LIMITS
+    RATE_LIMIT_RETRIES = DEFAULT_RATE_LIMIT_RETRIES
+    ANOMALIES_ENABLED = DEFAULT_ANOMALIES_ENABLED
+    ANOMALIES_Z_THRESHOLD = DEFAULT_ANOMALIES_Z_THRESHOLD
+    ANOMALIES_MIN_VIDEOS = DEFAULT_ANOMALIES_MIN_VIDEOS
+    ANOMALIES_BASELINE_VIDEOS = DEFAULT_ANOMALIES_BASELINE_VIDEOS
+    ANOMALIES_RECENT_DAYS = DEFAULT_ANOMALIES_RECENT_DAYS
+    ANOMALIES_BATCH_CHANNELS = DEFAULT_ANOMALIES_BATCH_CHANNELS
+    ANOMALIES_REPORT_LIMIT = DEFAULT_ANOMALIES_REPORT_LIMIT
+    REPORT_SORT_BY = DEFAULT_REPORT_SORT_BY
+    REPORT_FILTER = DEFAULT_REPORT_FILTER
+    REPORT_TOP_N = DEFAULT_REPORT_TOP_N
+    REPORT_PAGE_SIZE = DEFAULT_REPORT_PAGE_SIZE
+    REPORT_PAGE = DEFAULT_REPORT_PAGE
+    REPORT_TABLE_FORMAT = DEFAULT_REPORT_TABLE_FORMAT
+    REPORT_CSV_FILE = DEFAULT_REPORT_CSV_FILE
+    REPORT_JSONL_FILE = DEFAULT_REPORT_JSONL_FILE
+    STORAGE_PARTITION_DIR = DEFAULT_STORAGE_PARTITION_DIR
+    STORAGE_PARTITION_PERIOD = DEFAULT_STORAGE_PARTITION_PERIOD
+    STORAGE_HOT_DAYS = DEFAULT_STORAGE_HOT_DAYS
+    STORAGE_HISTORY_FULL_DAYS = DEFAULT_STORAGE_HISTORY_FULL_DAYS
+    STORAGE_HISTORY_DOWNSAMPLE = DEFAULT_STORAGE_HISTORY_DOWNSAMPLE
+    STORAGE_VACUUM_PAGES = DEFAULT_STORAGE_VACUUM_PAGES
+    STORAGE_COMPACT_AFTER_RUN = DEFAULT_STORAGE_COMPACT_AFTER_RUN
 else:
     print(f"DEBUG Config: Loaded configuration from '{CONFIG_FILENAME}'")
     # --- Секция [API] ---
@@ -72,17 +223,221 @@ else:
          FETCH_DATA_FROM_API = DEFAULT_FETCH_API
          ANALYZE_DATA_FROM_DB = DEFAULT_ANALYZE_DB
 
+    # --- Секция [ANALYSIS] ---
+    try:
+        ANALYSIS_WINDOWS = parse_windows(config.get('ANALYSIS', 'WINDOWS', fallback=','.join(map(str, DEFAULT_ANALYSIS_WINDOWS))))
+        reference_date_str = config.get('ANALYSIS', 'REFERENCE_DATE', fallback='')
+        REFERENCE_DATE = date.fromisoformat(reference_date_str.strip()) if reference_date_str and reference_date_str.strip() else DEFAULT_REFERENCE_DATE
+        ANALYSIS_CACHE_ENABLED = config.getboolean('ANALYSIS', 'CACHE', fallback=DEFAULT_ANALYSIS_CACHE)
+        ANALYSIS_WORKERS = config.getint('ANALYSIS', 'WORKERS', fallback=DEFAULT_ANALYSIS_WORKERS)
+        if ANALYSIS_WORKERS < 0:
+            raise ValueError(f"WORKERS must be >= 0, got {ANALYSIS_WORKERS}")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [ANALYSIS] section of config.ini: {e}. Check that WINDOWS is a comma-separated list of positive integers, REFERENCE_DATE is YYYY-MM-DD, CACHE is True/False and WORKERS is a non-negative integer. Using defaults for analysis.")
+        ANALYSIS_WINDOWS = DEFAULT_ANALYSIS_WINDOWS
+        REFERENCE_DATE = DEFAULT_REFERENCE_DATE
+        ANALYSIS_CACHE_ENABLED = DEFAULT_ANALYSIS_CACHE
+        ANALYSIS_WORKERS = DEFAULT_ANALYSIS_WORKERS
+
+    # --- Секция [EXPORT] ---
+    try:
+        EXPORT_ENABLED = config.getboolean('EXPORT', 'ENABLED', fallback=DEFAULT_EXPORT_ENABLED)
+        EXPORT_DIRECTORY = config.get('EXPORT', 'DIRECTORY', fallback=DEFAULT_EXPORT_DIRECTORY)
+        EXPORT_FORMAT = config.get('EXPORT', 'FORMAT', fallback=DEFAULT_EXPORT_FORMAT).strip().lower()
+        EXPORT_PARTITION_BY = config.get('EXPORT', 'PARTITION_BY', fallback=DEFAULT_EXPORT_PARTITION_BY).strip().lower()
+        EXPORT_INCREMENTAL = config.getboolean('EXPORT', 'INCREMENTAL', fallback=DEFAULT_EXPORT_INCREMENTAL)
+        EXPORT_BATCH_SIZE = config.getint('EXPORT', 'BATCH_SIZE', fallback=DEFAULT_EXPORT_BATCH_SIZE)
+        if EXPORT_FORMAT not in ('parquet', 'arrow'):
+            raise ValueError(f"FORMAT must be 'parquet' or 'arrow', got '{EXPORT_FORMAT}'")
+        if EXPORT_PARTITION_BY not in ('none', 'channel', 'month'):
+            raise ValueError(f"PARTITION_BY must be 'none', 'channel' or 'month', got '{EXPORT_PARTITION_BY}'")
+        if EXPORT_BATCH_SIZE <= 0:
+            raise ValueError(f"BATCH_SIZE must be positive, got {EXPORT_BATCH_SIZE}")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [EXPORT] section of config.ini: {e}. Export disabled.")
+        EXPORT_ENABLED = False
+        EXPORT_DIRECTORY = DEFAULT_EXPORT_DIRECTORY
+        EXPORT_FORMAT = DEFAULT_EXPORT_FORMAT
+        EXPORT_PARTITION_BY = DEFAULT_EXPORT_PARTITION_BY
+        EXPORT_INCREMENTAL = DEFAULT_EXPORT_INCREMENTAL
+        EXPORT_BATCH_SIZE = DEFAULT_EXPORT_BATCH_SIZE
+
+    # --- Секция [DAEMON] ---
+    try:
+        DAEMON_DAILY_QUOTA = config.getint('DAEMON', 'DAILY_QUOTA', fallback=DEFAULT_DAEMON_DAILY_QUOTA)
+        DAEMON_MIN_REFRESH_HOURS = config.getfloat('DAEMON', 'MIN_REFRESH_HOURS', fallback=DEFAULT_DAEMON_MIN_REFRESH_HOURS)
+        DAEMON_MAX_REFRESH_HOURS = config.getfloat('DAEMON', 'MAX_REFRESH_HOURS', fallback=DEFAULT_DAEMON_MAX_REFRESH_HOURS)
+        DAEMON_POLL_INTERVAL_SEC = config.getint('DAEMON', 'POLL_INTERVAL_SEC', fallback=DEFAULT_DAEMON_POLL_INTERVAL_SEC)
+        if DAEMON_MIN_REFRESH_HOURS <= 0 or DAEMON_MAX_REFRESH_HOURS < DAEMON_MIN_REFRESH_HOURS:
+            raise ValueError("expected 0 < MIN_REFRESH_HOURS <= MAX_REFRESH_HOURS")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [DAEMON] section of config.ini: {e}. Using defaults for daemon.")
+        DAEMON_DAILY_QUOTA = DEFAULT_DAEMON_DAILY_QUOTA
+        DAEMON_MIN_REFRESH_HOURS = DEFAULT_DAEMON_MIN_REFRESH_HOURS
+        DAEMON_MAX_REFRESH_HOURS = DEFAULT_DAEMON_MAX_REFRESH_HOURS
+        DAEMON_POLL_INTERVAL_SEC = DEFAULT_DAEMON_POLL_INTERVAL_SEC
+
+    # --- Секция [SERVER] ---
+    try:
+        SERVER_HOST = config.get('SERVER', 'HOST', fallback=DEFAULT_SERVER_HOST)
+        SERVER_PORT = config.getint('SERVER', 'PORT', fallback=DEFAULT_SERVER_PORT)
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [SERVER] section of config.ini: {e}. Using defaults for server.")
+        SERVER_HOST = DEFAULT_SERVER_HOST
+        SERVER_PORT = DEFAULT_SERVER_PORT
+
+    # --- Секция [SHARDING] ---
+    try:
+        SHARDING_ENABLED = config.getboolean('SHARDING', 'ENABLED', fallback=DEFAULT_SHARDING_ENABLED)
+        SHARDING_WORKERS = config.getint('SHARDING', 'WORKERS', fallback=DEFAULT_SHARDING_WORKERS)
+        SHARDING_STAGING_DIR = config.get('SHARDING', 'STAGING_DIR', fallback=DEFAULT_SHARDING_STAGING_DIR)
+        SHARDING_KEEP_STAGING = config.getboolean('SHARDING', 'KEEP_STAGING', fallback=DEFAULT_SHARDING_KEEP_STAGING)
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [SHARDING] section of config.ini: {e}. Sharded fetch disabled.")
+        SHARDING_ENABLED = False
+        SHARDING_WORKERS = DEFAULT_SHARDING_WORKERS
+        SHARDING_STAGING_DIR = DEFAULT_SHARDING_STAGING_DIR
+        SHARDING_KEEP_STAGING = DEFAULT_SHARDING_KEEP_STAGING
+
+    # --- Секция [ASYNC_API] ---
+    try:
+        ASYNC_API_ENABLED = config.getboolean('ASYNC_API', 'ENABLED', fallback=DEFAULT_ASYNC_API_ENABLED)
+        ASYNC_API_MAX_CONCURRENT_REQUESTS = config.getint('ASYNC_API', 'MAX_CONCURRENT_REQUESTS', fallback=DEFAULT_ASYNC_API_MAX_CONCURRENT_REQUESTS)
+        ASYNC_API_TIMEOUT_SEC = config.getfloat('ASYNC_API', 'TIMEOUT_SEC', fallback=DEFAULT_ASYNC_API_TIMEOUT_SEC)
+        if ASYNC_API_MAX_CONCURRENT_REQUESTS <= 0 or ASYNC_API_TIMEOUT_SEC <= 0:
+            raise ValueError("expected MAX_CONCURRENT_REQUESTS > 0 and TIMEOUT_SEC > 0")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [ASYNC_API] section of config.ini: {e}. Async API client disabled.")
+        ASYNC_API_ENABLED = False
+        ASYNC_API_MAX_CONCURRENT_REQUESTS = DEFAULT_ASYNC_API_MAX_CONCURRENT_REQUESTS
+        ASYNC_API_TIMEOUT_SEC = DEFAULT_ASYNC_API_TIMEOUT_SEC
+
+    # --- Секция [BATCH_API] ---
+    try:
+        BATCH_API_ENABLED = config.getboolean('BATCH_API', 'ENABLED', fallback=DEFAULT_BATCH_API_ENABLED)
+        BATCH_API_MAX_REQUESTS = config.getint('BATCH_API', 'MAX_REQUESTS', fallback=DEFAULT_BATCH_API_MAX_REQUESTS)
+        if not 1 <= BATCH_API_MAX_REQUESTS <= 1000:
+            raise ValueError("expected 1 <= MAX_REQUESTS <= 1000")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [BATCH_API] section of config.ini: {e}. Batch API requests disabled.")
+        BATCH_API_ENABLED = False
+        BATCH_API_MAX_REQUESTS = DEFAULT_BATCH_API_MAX_REQUESTS
+
+    # --- Секция [RATE_LIMIT] ---
+    try:
+        RATE_LIMIT_ENABLED = config.getboolean('RATE_LIMIT', 'ENABLED', fallback=DEFAULT_RATE_LIMIT_ENABLED)
+        RATE_LIMIT_REQUESTS_PER_SEC = config.getfloat('RATE_LIMIT', 'REQUESTS_PER_SEC', fallback=DEFAULT_RATE_LIMIT_REQUESTS_PER_SEC)
+        RATE_LIMIT_BURST = config.getint('RATE_LIMIT', 'BURST', fallback=DEFAULT_RATE_LIMIT_BURST)
+        RATE_LIMIT_ENDPOINT_LIMITS = parse_endpoint_limits(config.get('RATE_LIMIT', 'ENDPOINT_LIMITS', fallback=''))
+        RATE_LIMIT_RETRIES = config.getint('RATE_LIMIT', 'RETRIES', fallback=DEFAULT_RATE_LIMIT_RETRIES)
+        if RATE_LIMIT_REQUESTS_PER_SEC <= 0 or RATE_LIMIT_BURST <= 0 or RATE_LIMIT_RETRIES < 0:
+            raise ValueError("expected REQUESTS_PER_SEC > 0, BURST > 0 and RETRIES >= 0")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [RATE_LIMIT] section of config.ini: {e}. Using defaults for rate limiting.")
+        RATE_LIMIT_ENABLED = DEFAULT_RATE_LIMIT_ENABLED
+        RATE_LIMIT_REQUESTS_PER_SEC = DEFAULT_RATE_LIMIT_REQUESTS_PER_SEC
+        RATE_LIMIT_BURST = DEFAULT_RATE_LIMIT_BURST
+        RATE_LIMIT_ENDPOINT_LIMITS = DEFAULT_RATE_LIMIT_ENDPOINT_LIMITS
+        RATE_LIMIT_RETRIES = DEFAULT_RATE_LIMIT_RETRIES
+
+    # --- Секция [ANOMALIES] ---
+    try:
+        ANOMALIES_ENABLED = config.getboolean('ANOMALIES', 'ENABLED', fallback=DEFAULT_ANOMALIES_ENABLED)
+        ANOMALIES_Z_THRESHOLD = config.getfloat('ANOMALIES', 'Z_THRESHOLD', fallback=DEFAULT_ANOMALIES_Z_THRESHOLD)
+        ANOMALIES_MIN_VIDEOS = config.getint('ANOMALIES', 'MIN_VIDEOS', fallback=DEFAULT_ANOMALIES_MIN_VIDEOS)
+        ANOMALIES_BASELINE_VIDEOS = config.getint('ANOMALIES', 'BASELINE_VIDEOS', fallback=DEFAULT_ANOMALIES_BASELINE_VIDEOS)
+        ANOMALIES_RECENT_DAYS = config.getint('ANOMALIES', 'RECENT_DAYS', fallback=DEFAULT_ANOMALIES_RECENT_DAYS)
+        ANOMALIES_BATCH_CHANNELS = config.getint('ANOMALIES', 'BATCH_CHANNELS', fallback=DEFAULT_ANOMALIES_BATCH_CHANNELS)
+        ANOMALIES_REPORT_LIMIT = config.getint('ANOMALIES', 'REPORT_LIMIT', fallback=DEFAULT_ANOMALIES_REPORT_LIMIT)
+        if ANOMALIES_Z_THRESHOLD <= 0 or min(ANOMALIES_MIN_VIDEOS, ANOMALIES_BASELINE_VIDEOS, ANOMALIES_RECENT_DAYS, ANOMALIES_BATCH_CHANNELS) <= 0:
+            raise ValueError("expected Z_THRESHOLD, MIN_VIDEOS, BASELINE_VIDEOS, RECENT_DAYS and BATCH_CHANNELS > 0")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [ANOMALIES] section of config.ini: {e}. Anomaly detection disabled.")
+        ANOMALIES_ENABLED = False
+        ANOMALIES_Z_THRESHOLD = DEFAULT_ANOMALIES_Z_THRESHOLD
+        ANOMALIES_MIN_VIDEOS = DEFAULT_ANOMALIES_MIN_VIDEOS
+        ANOMALIES_BASELINE_VIDEOS = DEFAULT_ANOMALIES_BASELINE_VIDEOS
+        ANOMALIES_RECENT_DAYS = DEFAULT_ANOMALIES_RECENT_DAYS
+        ANOMALIES_BATCH_CHANNELS = DEFAULT_ANOMALIES_BATCH_CHANNELS
+        ANOMALIES_REPORT_LIMIT = DEFAULT_ANOMALIES_REPORT_LIMIT
+
+    # --- Секция [REPORT] ---
+    try:
+        REPORT_SORT_BY = config.get('REPORT', 'SORT_BY', fallback=DEFAULT_REPORT_SORT_BY).strip()
+        REPORT_FILTER = parse_rank_filter(config.get('REPORT', 'FILTER', fallback=''))
+        REPORT_TOP_N = config.getint('REPORT', 'TOP_N', fallback=DEFAULT_REPORT_TOP_N)
+        REPORT_PAGE_SIZE = config.getint('REPORT', 'PAGE_SIZE', fallback=DEFAULT_REPORT_PAGE_SIZE)
+        REPORT_PAGE = config.getint('REPORT', 'PAGE', fallback=DEFAULT_REPORT_PAGE)
+        REPORT_TABLE_FORMAT = config.get('REPORT', 'TABLE_FORMAT', fallback=DEFAULT_REPORT_TABLE_FORMAT).strip().lower()
+        REPORT_CSV_FILE = config.get('REPORT', 'CSV_FILE', fallback='').strip() or DEFAULT_REPORT_CSV_FILE
+        REPORT_JSONL_FILE = config.get('REPORT', 'JSONL_FILE', fallback='').strip() or DEFAULT_REPORT_JSONL_FILE
+        if not REPORT_SORT_BY.startswith('rank_'):
+            raise ValueError(f"SORT_BY must be a rank column (rank_<metric>), got '{REPORT_SORT_BY}'")
+        if min(REPORT_TOP_N, REPORT_PAGE_SIZE, REPORT_PAGE) < 0:
+            raise ValueError("expected TOP_N, PAGE_SIZE and PAGE >= 0")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [REPORT] section of config.ini: {e}. Using default report settings.")
+        REPORT_SORT_BY = DEFAULT_REPORT_SORT_BY
+        REPORT_FILTER = DEFAULT_REPORT_FILTER
+        REPORT_TOP_N = DEFAULT_REPORT_TOP_N
+        REPORT_PAGE_SIZE = DEFAULT_REPORT_PAGE_SIZE
+        REPORT_PAGE = DEFAULT_REPORT_PAGE
+        REPORT_TABLE_FORMAT = DEFAULT_REPORT_TABLE_FORMAT
+        REPORT_CSV_FILE = DEFAULT_REPORT_CSV_FILE
+        REPORT_JSONL_FILE = DEFAULT_REPORT_JSONL_FILE
+
+    # --- Секция [STORAGE] ---
+    try:
+        STORAGE_PARTITION_DIR = config.get('STORAGE', 'PARTITION_DIR', fallback=DEFAULT_STORAGE_PARTITION_DIR)
+        STORAGE_PARTITION_PERIOD = config.get('STORAGE', 'PARTITION_PERIOD', fallback=DEFAULT_STORAGE_PARTITION_PERIOD).strip().lower()
+        STORAGE_HOT_DAYS = config.getint('STORAGE', 'HOT_DAYS', fallback=DEFAULT_STORAGE_HOT_DAYS)
+        STORAGE_HISTORY_FULL_DAYS = config.getint('STORAGE', 'HISTORY_FULL_DAYS', fallback=DEFAULT_STORAGE_HISTORY_FULL_DAYS)
+        STORAGE_HISTORY_DOWNSAMPLE = config.get('STORAGE', 'HISTORY_DOWNSAMPLE', fallback=DEFAULT_STORAGE_HISTORY_DOWNSAMPLE).strip().lower()
+        STORAGE_VACUUM_PAGES = config.getint('STORAGE', 'VACUUM_PAGES', fallback=DEFAULT_STORAGE_VACUUM_PAGES)
+        STORAGE_COMPACT_AFTER_RUN = config.getboolean('STORAGE', 'COMPACT_AFTER_RUN', fallback=DEFAULT_STORAGE_COMPACT_AFTER_RUN)
+        if STORAGE_PARTITION_PERIOD not in ('year', 'month'):
+            raise ValueError(f"PARTITION_PERIOD must be 'year' or 'month', got '{STORAGE_PARTITION_PERIOD}'")
+        if STORAGE_HISTORY_DOWNSAMPLE not in ('week', 'month'):
+            raise ValueError(f"HISTORY_DOWNSAMPLE must be 'week' or 'month', got '{STORAGE_HISTORY_DOWNSAMPLE}'")
+        if STORAGE_HOT_DAYS <= 0 or STORAGE_HISTORY_FULL_DAYS < 0 or STORAGE_VACUUM_PAGES < 0:
+            raise ValueError("expected HOT_DAYS > 0, HISTORY_FULL_DAYS >= 0, VACUUM_PAGES >= 0")
+    except ValueError as e:
+        print(f"ERROR: Invalid value in [STORAGE] section of config.ini: {e}. Using defaults for storage.")
+        STORAGE_PARTITION_DIR = DEFAULT_STORAGE_PARTITION_DIR
+        STORAGE_PARTITION_PERIOD = DEFAULT_STORAGE_PARTITION_PERIOD
+        STORAGE_HOT_DAYS = DEFAULT_STORAGE_HOT_DAYS
+        STORAGE_HISTORY_FULL_DAYS = DEFAULT_STORAGE_HISTORY_FULL_DAYS
+        STORAGE_HISTORY_DOWNSAMPLE = DEFAULT_STORAGE_HISTORY_DOWNSAMPLE
+        STORAGE_VACUUM_PAGES = DEFAULT_STORAGE_VACUUM_PAGES
+        STORAGE_COMPACT_AFTER_RUN = DEFAULT_STORAGE_COMPACT_AFTER_RUN
+
 # --- Финальная проверка критичных настроек ---
 if not API_KEYS:
     print("CRITICAL ERROR: No API keys available after checking config.ini and defaults. YouTube API calls will fail. Exiting.")
     sys.exit(1) # Выход, если нет ключей API
 
+# Файл каналов может быть списком файлов через запятую
+CHANNELS_FILES = parse_file_list(CHANNELS_FILE) or [DEFAULT_CHANNELS_FILE]
+
 # --- Вывод загруженной конфигурации для проверки ---
 print("--- Loaded Configuration ---")
 print(f"API Keys Loaded: {len(API_KEYS)}")
 print(f"Database File: {DATABASE_NAME}")
-print(f"Channels File: {CHANNELS_FILE}")
+print(f"Channels File(s): {', '.join(CHANNELS_FILES)}")
 print(f"Max Videos To Fetch: {MAX_VIDEOS_TO_FETCH_PER_CHANNEL if MAX_VIDEOS_TO_FETCH_PER_CHANNEL is not None else 'All'}")
 print(f"Fetch from API: {FETCH_DATA_FROM_API}")
 print(f"Analyze from DB: {ANALYZE_DATA_FROM_DB}")
+print(f"Analysis Windows (days): {ANALYSIS_WINDOWS}")
+print(f"Reference Date: {REFERENCE_DATE if REFERENCE_DATE is not None else 'Today'}")
+print(f"Analysis Cache: {'Enabled' if ANALYSIS_CACHE_ENABLED else 'Disabled'}")
+print(f"Analysis Workers: {ANALYSIS_WORKERS if ANALYSIS_WORKERS > 0 else 'auto'}{' (serial)' if ANALYSIS_WORKERS == 1 else ''}")
+print(f"Export: {f'{EXPORT_FORMAT} -> {EXPORT_DIRECTORY} (partition: {EXPORT_PARTITION_BY}, incremental: {EXPORT_INCREMENTAL})' if EXPORT_ENABLED else 'Disabled'}")
+print(f"Sharded Fetch: {'Enabled' if SHARDING_ENABLED else 'Disabled'} (workers: {SHARDING_WORKERS if SHARDING_WORKERS > 0 else 'auto'})")
+print(f"API Client: {'async' if ASYNC_API_ENABLED else 'sync'} (max concurrent requests: {ASYNC_API_MAX_CONCURRENT_REQUESTS})")
+print(f"API Batch Requests: {f'Enabled (up to {BATCH_API_MAX_REQUESTS} calls per HTTP request)' if BATCH_API_ENABLED else 'Disabled'}")
+print(f"Rate Limit: {f'{RATE_LIMIT_REQUESTS_PER_SEC} req/s per key (burst {RATE_LIMIT_BURST}), endpoint limits: {RATE_LIMIT_ENDPOINT_LIMITS}' if RATE_LIMIT_ENABLED else 'Disabled'}")
+print(f"Anomalies: {f'|z| >= {ANOMALIES_Z_THRESHOLD}, baseline {ANOMALIES_BASELINE_VIDEOS} videos, recent {ANOMALIES_RECENT_DAYS}d' if ANOMALIES_ENABLED else 'Disabled'}")
+print(f"Report: sorted by {REPORT_SORT_BY}{f', filter {REPORT_FILTER}' if REPORT_FILTER else ''}, top {REPORT_TOP_N or 'all'}, "
+      f"page size {REPORT_PAGE_SIZE or 'all'}, table format {REPORT_TABLE_FORMAT}, CSV: {REPORT_CSV_FILE or '-'}, JSONL: {REPORT_JSONL_FILE or '-'}")
+print(f"Storage: partitions in '{STORAGE_PARTITION_DIR}' by {STORAGE_PARTITION_PERIOD}, hot {STORAGE_HOT_DAYS}d, compact after run: {STORAGE_COMPACT_AFTER_RUN}")
 print("---------------------------")
\ No newline at end of file
@@ -1,21 +1,86 @@
 # database.py
+import os
+import re
+import glob
+import json
 import sqlite3
 from datetime import datetime, date, timezone
 # Импортируем загрузчик конфигурации
 import config_loader as app_config
+from records import VideoRecord
 
 # Используем имя БД из конфигурации
 DB_NAME = app_config.DATABASE_NAME
 
-def connect_db():
-    """Устанавливает соединение с базой данных SQLite."""
+# Колонки таблицы videos (общие для основной БД и файлов партиций)
+VIDEOS_COLUMNS_DDL = """
+                video_id TEXT PRIMARY KEY,
+                channel_id TEXT NOT NULL,
+                title TEXT,
+                published_at INTEGER, -- Дата публикации видео (Unix timestamp UTC)
+                duration_seconds INTEGER,
+                view_count INTEGER,
+                like_count INTEGER,
+                comment_count INTEGER,
+                fetch_date TEXT -- Дата получения данных из API (YYYY-MM-DD)
+"""
+VIDEO_COLUMNS = ['video_id', 'channel_id', 'title', 'published_at', 'duration_seconds',
+                 'view_count', 'like_count', 'comment_count', 'fetch_date']
+# Индексы videos: выборки канала по датам (оконная аналитика), отпечаток данных канала (analysis_cache.py),
+# топы по просмотрам и по диапазону дат (leaderboard.py)
+VIDEO_INDEXES = [
+    ('idx_videos_channel_published', 'channel_id, published_at'),
+    ('idx_videos_channel_fetch', 'channel_id, fetch_date'),
+    ('idx_videos_view_count', 'view_count'),
+    ('idx_videos_published', 'published_at'),
+]
+# Партиции исторических видео: файлы <STORAGE_PARTITION_DIR>/videos_<период>.db, подключаемые как p_<период>
+PARTITION_FILE_PREFIX = 'videos_'
+PARTITION_SCHEMA_PREFIX = 'p_'
+PARTITION_PERIOD_RE = re.compile(r'\d{4}(-\d{2})?|archive')
+ARCHIVE_PERIOD = 'archive' # Общая партиция для периодов старше последних (см. get_max_partitions)
+DEFAULT_ATTACH_LIMIT = 10 # Лимит SQLite на число подключенных БД (SQLITE_MAX_ATTACHED по умолчанию)
+# Класс соединений, создаваемых connect_db / connect_db_readonly (query_harness.py подставляет
+# соединение, которое считает выполненные запросы и прочитанные строки)
+CONNECTION_FACTORY = sqlite3.Connection
+
+def connect_db(db_name=None, partitions=True):
+    """
+    Устанавливает соединение с базой данных SQLite.
+    Включает режим WAL, чтобы читатели (query_server.py) не блокировали запись и наоборот.
+    partitions=False - не подключать партиции (задача уплотнения storage.py подключает их сама).
+    """
+    db_name = db_name or DB_NAME
+    conn = None
     try:
         # Убираем detect_types, т.к. будем конвертировать вручную при чтении
-        conn = sqlite3.connect(DB_NAME)
-        print(f"DEBUG DB: Successfully connected to database '{DB_NAME}'.")
+        conn = sqlite3.connect(db_name, factory=CONNECTION_FACTORY)
+        # Для новой БД включаем инкрементальную очистку (действует, только пока в БД нет таблиц)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        if partitions:
+            attach_partitions(conn)
+        print(f"DEBUG DB: Successfully connected to database '{db_name}'.")
         return conn
     except sqlite3.Error as e:
-        print(f"ERROR DB: Could not connect to database '{DB_NAME}': {e}")
+        print(f"ERROR DB: Could not connect to database '{db_name}': {e}")
+        if conn: conn.close()
+        return None
+
+def connect_db_readonly(db_name=None, check_same_thread=True):
+    """
+    Открывает соединение только для чтения (URI mode=ro). В режиме WAL такие соединения
+    читают согласованный снимок и не мешают параллельной записи.
+    """
+    db_name = db_name or DB_NAME
+    conn = None
+    try:
+        conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True, check_same_thread=check_same_thread, factory=CONNECTION_FACTORY)
+        attach_partitions(conn, readonly=True)
+        return conn
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Could not open database '{db_name}' in read-only mode: {e}")
+        if conn: conn.close()
         return None
 
 def create_tables(conn):
@@ -33,25 +98,184 @@ def create_tables(conn):
                 date_added DATE -- Дата первого добавления канала в БД
             )
         """)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS main.videos ({VIDEOS_COLUMNS_DDL}
+                , FOREIGN KEY (channel_id) REFERENCES channels (channel_id)
+            )
+        """)
+        # Компактная отметка последнего появления видео в ответе API (пишется, когда сама строка videos не менялась)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS videos (
+            CREATE TABLE IF NOT EXISTS video_last_seen (
                 video_id TEXT PRIMARY KEY,
-                channel_id TEXT NOT NULL,
-                title TEXT,
-                published_at INTEGER, -- Дата публикации видео (Unix timestamp UTC)
-                duration_seconds INTEGER,
+                last_seen TEXT -- Дата последнего получения видео из API (YYYY-MM-DD)
+            ) WITHOUT ROWID
+        """)
+        # История счетчиков видео: снимок на дату получения, пишется только для новых и измененных видео
+        # (для неизмененных действует предыдущий снимок). Используется для расчета прироста (leaderboard.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS video_stats_history (
+                video_id TEXT NOT NULL,
+                fetch_date TEXT NOT NULL, -- Дата получения данных из API (YYYY-MM-DD)
                 view_count INTEGER,
                 like_count INTEGER,
                 comment_count INTEGER,
-                fetch_date TEXT, -- Дата получения данных из API (YYYY-MM-DD)
-                FOREIGN KEY (channel_id) REFERENCES channels (channel_id)
+                PRIMARY KEY (video_id, fetch_date)
+            ) WITHOUT ROWID
+        """)
+        # Первичное заполнение истории текущими значениями (для БД, созданных до появления таблицы)
+        if cursor.execute("SELECT 1 FROM video_stats_history LIMIT 1").fetchone() is None:
+            cursor.execute("""
+                INSERT OR IGNORE INTO video_stats_history (video_id, fetch_date, view_count, like_count, comment_count)
+                SELECT video_id, fetch_date, view_count, like_count, comment_count FROM videos
+                WHERE fetch_date IS NOT NULL
+            """)
+        # Кэш разрешения @handle / URL каналов в ID (channel_sources.py); channel_id NULL - канал не найден
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS channel_resolution (
+                source TEXT PRIMARY KEY, -- Нормализованный ключ: 'handle:@name' или 'user:name'
+                channel_id TEXT,
+                resolved_at INTEGER -- Время разрешения (Unix timestamp)
+            ) WITHOUT ROWID
+        """)
+        # Водяные знаки инкрементального экспорта (exporter.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS export_state (
+                table_name TEXT PRIMARY KEY,
+                watermark TEXT, -- Максимальное значение поля-маркера изменений, выгруженное в прошлый раз
+                last_export_at INTEGER -- Время последнего экспорта (Unix timestamp)
             )
         """)
+        # Расход квоты API демоном (scheduler.py) по суткам квоты: перезапуск демона не тратит бюджет повторно
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daemon_quota_usage (
+                quota_day TEXT PRIMARY KEY, -- Сутки квоты (YYYY-MM-DD, часовой пояс сброса квоты)
+                units_used INTEGER NOT NULL,
+                updated_at INTEGER -- Время последнего обновления (Unix timestamp)
+            ) WITHOUT ROWID
+        """)
+        # Кэш результатов анализа (analysis_cache.py): результаты канала и отпечаток входных данных
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                channel_id TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                results TEXT NOT NULL -- JSON результатов анализа канала (без рангов)
+            ) WITHOUT ROWID
+        """)
+        # Состояние кэша анализа всего запуска: ранги, агрегаты групп, отпечаток списка каналов
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache_state (
+                key TEXT PRIMARY KEY,
+                value TEXT -- JSON
+            ) WITHOUT ROWID
+        """)
+        # Аномалии видео и каналов относительно базовой линии канала (anomalies.py), пересчитываются при каждом сканировании
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS anomalies (
+                scope TEXT NOT NULL, -- 'video' или 'channel'
+                entity_id TEXT NOT NULL, -- video_id или channel_id
+                channel_id TEXT NOT NULL,
+                kind TEXT NOT NULL, -- views_spike, views_drop, er_spike, er_drop (видео); views_surge, views_collapse, er_surge, er_collapse (канал)
+                metric_value REAL, -- Просмотры в день или ER (%)
+                baseline REAL, -- Базовое значение канала (медиана)
+                score REAL, -- Робастный z-score
+                reference_date TEXT, -- Опорная дата сканирования (YYYY-MM-DD)
+                detected_at INTEGER, -- Время сканирования (Unix timestamp)
+                PRIMARY KEY (scope, entity_id, kind)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_channel ON anomalies (channel_id)")
+        create_video_indexes(cursor, 'main')
         conn.commit()
-        print("DEBUG DB: Tables 'channels' and 'videos' checked/created successfully (with subscribers, date_added).") # Обновлено сообщение
+        print("DEBUG DB: Tables 'channels', 'videos', 'video_last_seen', 'video_stats_history', 'channel_resolution', 'export_state', 'daemon_quota_usage', 'analysis_cache' and 'anomalies' checked/created successfully (with subscribers, date_added).") # Обновлено сообщение
     except sqlite3.Error as e:
         print(f"ERROR DB: Failed to create tables: {e}")
 
+def create_video_indexes(cursor, schema):
+    """Создает индексы таблицы videos в указанной БД (main или партиция)."""
+    for index_name, columns in VIDEO_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{index_name} ON videos ({columns})")
+
+# --- Партиции исторических данных (ATTACH) ---
+def get_partition_schema_name(period):
+    return PARTITION_SCHEMA_PREFIX + period.replace('-', '_')
+
+def get_partition_path(period):
+    return os.path.join(app_config.STORAGE_PARTITION_DIR, f"{PARTITION_FILE_PREFIX}{period}.db")
+
+def get_partition_files():
+    """Возвращает {период: путь} для файлов партиций в STORAGE_PARTITION_DIR."""
+    pattern = os.path.join(app_config.STORAGE_PARTITION_DIR, f"{PARTITION_FILE_PREFIX}*.db")
+    partitions = {}
+    for path in sorted(glob.glob(pattern)):
+        period = os.path.basename(path)[len(PARTITION_FILE_PREFIX):-len('.db')]
+        if PARTITION_PERIOD_RE.fullmatch(period): # Имя схемы строится из периода - посторонние файлы пропускаем
+            partitions[period] = path
+    return partitions
+
+def get_partition_schemas(conn):
+    """Имена подключенных к соединению партиций (p_<период>)."""
+    return [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith(PARTITION_SCHEMA_PREFIX)]
+
+def create_videos_view(conn):
+    """
+    Пересоздает временное представление videos, объединяющее main.videos и все подключенные партиции.
+    Временные объекты имеют приоритет при разрешении имен, поэтому все запросы чтения FROM videos
+    прозрачно охватывают партиции. Запись всегда адресуется явно (main.videos / p_<период>.videos).
+    """
+    schemas = get_partition_schemas(conn)
+    conn.execute("DROP VIEW IF EXISTS temp.videos")
+    if schemas:
+        columns = ", ".join(VIDEO_COLUMNS)
+        union = "\n            UNION ALL ".join(f"SELECT {columns} FROM {schema}.videos" for schema in ['main'] + schemas)
+        conn.execute(f"CREATE TEMP VIEW videos AS {union}")
+
+def get_max_partitions(conn):
+    """
+    Максимальное число файлов партиций, которые можно подключить к соединению:
+    лимит SQLite на число подключенных БД минус одно место для слияния шардов (merge_staging_db).
+    Задача уплотнения (storage.py) не создает больше партиций: старые периоды объединяются в архив.
+    """
+    getlimit = getattr(conn, 'getlimit', None)
+    attach_limit = getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if getlimit else DEFAULT_ATTACH_LIMIT
+    return attach_limit - 1
+
+def attach_partitions(conn, readonly=False):
+    """
+    Подключает (ATTACH) файлы партиций, которые еще не подключены к соединению, отключает партиции,
+    файлы которых удалены (объединены в архив), и обновляет представление videos. Вызывается при
+    открытии соединения; долгоживущие соединения вызывают ее повторно, чтобы подхватить изменения
+    задачи уплотнения (storage.py): демон - при изменении каталога партиций, сервер запросов -
+    при смене версии данных.
+
+    Партиции подключаются только к основной БД (DATABASE_NAME), но не к промежуточным БД шардов.
+    Если подключить все партиции нельзя (превышен лимит SQLite), выбрасывается sqlite3.OperationalError:
+    чтение без части данных недопустимо.
+
+    Returns:
+        list: Имена подключенных партиций.
+    """
+    main_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not main_file or os.path.abspath(main_file) != os.path.abspath(DB_NAME):
+        return []
+    attached = get_partition_schemas(conn)
+    partition_files = get_partition_files()
+    schemas = {get_partition_schema_name(period): path for period, path in partition_files.items()}
+    removed = [schema for schema in attached if schema not in schemas]
+    new_partitions = [(schema, path) for schema, path in schemas.items() if schema not in attached]
+    if not new_partitions and not removed:
+        return attached
+    max_partitions = get_max_partitions(conn)
+    if len(schemas) > max_partitions:
+        raise sqlite3.OperationalError(
+            f"{len(schemas)} partition files in '{app_config.STORAGE_PARTITION_DIR}' exceed the limit of {max_partitions} "
+            f"attached databases. Run 'python storage.py' to merge the oldest partitions into the archive.")
+    for schema in removed:
+        conn.execute(f"DETACH DATABASE {schema}")
+    for schema, path in new_partitions:
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{path}?mode=ro" if readonly else path,))
+    create_videos_view(conn)
+    return get_partition_schemas(conn)
+
 def save_channel(conn, channel_data):
     """
     Сохраняет или обновляет информацию о канале в таблице channels.
@@ -99,6 +323,231 @@ def save_channel(conn, channel_data):
         print(f"ERROR DB: Failed to save channel {channel_data.get('id')}: {e}")
         return False
 
+def get_export_watermark(conn, table_name):
+    """Возвращает водяной знак последнего экспорта таблицы (или None, если экспорта еще не было)."""
+    if not conn: return None
+    sql = "SELECT watermark FROM export_state WHERE table_name = ?"
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, (table_name,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to get export watermark for {table_name}: {e}")
+        return None
+
+def save_export_watermark(conn, table_name, watermark):
+    """Сохраняет водяной знак экспорта таблицы."""
+    if not conn: return False
+    sql = """
+        INSERT INTO export_state (table_name, watermark, last_export_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(table_name) DO UPDATE SET
+            watermark = excluded.watermark,
+            last_export_at = excluded.last_export_at
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, (table_name, watermark, int(datetime.now(timezone.utc).timestamp())))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to save export watermark for {table_name}: {e}")
+        return False
+
+def get_quota_usage(conn, quota_day):
+    """Возвращает расход квоты демоном за сутки квоты quota_day ('YYYY-MM-DD'), 0 - если расхода не было."""
+    if not conn: return 0
+    sql = "SELECT units_used FROM daemon_quota_usage WHERE quota_day = ?"
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, (quota_day,))
+        result = cursor.fetchone()
+        return result[0] if result else 0
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to get quota usage for {quota_day}: {e}")
+        return 0
+
+def save_quota_usage(conn, quota_day, units_used):
+    """Сохраняет расход квоты демоном за сутки квоты quota_day."""
+    if not conn: return False
+    sql = """
+        INSERT INTO daemon_quota_usage (quota_day, units_used, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(quota_day) DO UPDATE SET
+            units_used = excluded.units_used,
+            updated_at = excluded.updated_at
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, (quota_day, units_used, int(datetime.now(timezone.utc).timestamp())))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to save quota usage for {quota_day}: {e}")
+        return False
+
+def get_channels_refresh_state(conn, since_ts):
+    """
+    Возвращает состояние обновления всех каналов из БД одним запросом:
+    {channel_id: (last_fetched, количество видео, опубликованных начиная с since_ts)}.
+    Используется планировщиком (scheduler.py) для расчета приоритета обновления.
+    """
+    if not conn: return {}
+    sql = """
+        SELECT c.channel_id, c.last_fetched,
+               (SELECT COUNT(*) FROM videos v
+                WHERE v.channel_id = c.channel_id AND v.published_at >= ?) AS recent_uploads
+        FROM channels c
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, (since_ts,))
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to get channels refresh state: {e}")
+        return {}
+
+def get_channel_fingerprint_inputs(conn, channel_ids=None):
+    """
+    Возвращает входные данные отпечатка анализа каналов (все каналы или переданные, одним запросом):
+    {channel_id: (channel_name, subscriber_count, last_fetched, количество видео, максимальная fetch_date видео)}.
+    Счетчики берутся из индекса idx_videos_channel_fetch без чтения строк videos.
+    """
+    if not conn: return {}
+    sql = """
+        SELECT c.channel_id, c.channel_name, c.subscriber_count, c.last_fetched,
+               (SELECT COUNT(*) FROM videos v WHERE v.channel_id = c.channel_id) AS video_count,
+               (SELECT MAX(v.fetch_date) FROM videos v WHERE v.channel_id = c.channel_id) AS max_fetch_date
+        FROM channels c
+    """
+    params = ()
+    if channel_ids is not None:
+        sql += " WHERE c.channel_id IN (SELECT value FROM json_each(?))"
+        params = (json.dumps(list(channel_ids)),)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to get channel fingerprint inputs: {e}")
+        return {}
+
+def get_analysis_cache(conn):
+    """Возвращает кэш анализа {channel_id: (fingerprint, results_json)} и состояние кэша {key: value_json}."""
+    if not conn: return {}, {}
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT channel_id, fingerprint, results FROM analysis_cache")
+        entries = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        cursor.execute("SELECT key, value FROM analysis_cache_state")
+        return entries, dict(cursor.fetchall())
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to read analysis cache: {e}")
+        return {}, {}
+
+def save_analysis_cache(conn, entries, state):
+    """
+    Сохраняет измененные записи кэша анализа [(channel_id, fingerprint, results_json)]
+    и состояние {key: value_json} одной транзакцией (ранги в состоянии согласованы с записями).
+    """
+    if not conn: return False
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT INTO analysis_cache (channel_id, fingerprint, results) VALUES (?, ?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    fingerprint = excluded.fingerprint,
+                    results = excluded.results
+            """, entries)
+            conn.executemany("""
+                INSERT INTO analysis_cache_state (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, state.items())
+        return True
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to save analysis cache: {e}")
+        return False
+
+def get_channel_resolutions(conn, sources):
+    """
+    Возвращает закэшированные результаты разрешения {source: channel_id или None} для переданных ключей
+    (ключи, которых нет в кэше, в словарь не попадают).
+    """
+    if not conn or not sources: return {}
+    sources = list(sources)
+    resolved = {}
+    try:
+        cursor = conn.cursor()
+        for i in range(0, len(sources), SQLITE_MAX_VARIABLES):
+            chunk = sources[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT source, channel_id FROM channel_resolution WHERE source IN ({placeholders})", chunk)
+            resolved.update(cursor.fetchall())
+        return resolved
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to read channel resolution cache: {e}")
+        return {}
+
+def save_channel_resolution(conn, source, channel_id):
+    """Сохраняет результат разрешения источника в ID канала (channel_id None - канал не найден)."""
+    if not conn: return False
+    sql = """
+        INSERT INTO channel_resolution (source, channel_id, resolved_at) VALUES (?, ?, ?)
+        ON CONFLICT(source) DO UPDATE SET
+            channel_id = excluded.channel_id,
+            resolved_at = excluded.resolved_at
+    """
+    try:
+        conn.execute(sql, (source, channel_id, int(datetime.now(timezone.utc).timestamp())))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to save channel resolution for {source}: {e}")
+        return False
+
+def get_all_channel_ids(conn):
+    """Возвращает ID всех каналов, сохраненных в БД."""
+    if not conn: return []
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT channel_id FROM channels ORDER BY channel_id")
+        return [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to get channel IDs: {e}")
+        return []
+
+def _parse_date_added(value, channel_id):
+    """SQLite хранит DATE как TEXT 'YYYY-MM-DD', конвертируем обратно в date."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        print(f"Warning DB: Could not parse date_added '{value}' for channel {channel_id}")
+        return None
+
+def get_channels_db_info(conn, channel_ids):
+    """
+    Возвращает данные каналов из БД одним запросом вместо четырех точечных запросов на канал:
+    {channel_id: (channel_name, date_added, subscriber_count, количество видео в БД)}.
+    Для каналов, которых нет в БД: (None, None, None, 0).
+    """
+    if not conn or not channel_ids: return {}
+    sql = """
+        SELECT j.value, c.channel_name, c.date_added, c.subscriber_count,
+               (SELECT COUNT(*) FROM videos v WHERE v.channel_id = j.value) AS video_count
+        FROM json_each(?) j
+        LEFT JOIN channels c ON c.channel_id = j.value
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, (json.dumps(list(channel_ids)),))
+        return {row[0]: (row[1], _parse_date_added(row[2], row[0]), row[3], row[4]) for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to get channels info: {e}")
+        return {}
+
 # --- Добавим функцию для чтения даты добавления ---
 def get_channel_add_date(conn, channel_id):
     """Получает дату добавления канала из базы данных."""
@@ -108,14 +557,7 @@ def get_channel_add_date(conn, channel_id):
         cursor = conn.cursor()
         cursor.execute(sql, (channel_id,))
         result = cursor.fetchone()
-        if result and result[0]:
-            # SQLite хранит DATE как TEXT 'YYYY-MM-DD', конвертируем обратно в date
-            try:
-                return date.fromisoformat(result[0])
-            except (TypeError, ValueError):
-                print(f"Warning DB: Could not parse date_added '{result[0]}' for channel {channel_id}")
-                return None
-        return None
+        return _parse_date_added(result[0], channel_id) if result else None
     except sqlite3.Error as e:
         print(f"ERROR DB: Failed to get channel add date for {channel_id}: {e}")
         return None
@@ -149,51 +591,119 @@ def get_channel_subscribers(conn, channel_id):
         print(f"ERROR DB: Failed to get channel subscribers for {channel_id}: {e}")
         return None
 
+# Колонки видео, изменение которых означает реальное изменение строки (fetch_date не учитывается)
+VIDEO_TRACKED_COLUMNS = ['channel_id', 'title', 'published_at', 'duration_seconds',
+                         'view_count', 'like_count', 'comment_count']
+# Условие для ON CONFLICT DO UPDATE: строка перезаписывается, только если изменилось хотя бы одно поле
+VIDEO_CHANGED_CONDITION = " OR ".join(f"videos.{column} IS NOT excluded.{column}" for column in VIDEO_TRACKED_COLUMNS)
+VIDEO_UPSERT_SQL = """
+    INSERT INTO {schema}.videos (video_id, channel_id, title, published_at, duration_seconds,
+                      view_count, like_count, comment_count, fetch_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(video_id) DO UPDATE SET
+        channel_id = excluded.channel_id,
+        title = excluded.title,
+        published_at = excluded.published_at,
+        duration_seconds = excluded.duration_seconds,
+        view_count = excluded.view_count,
+        like_count = excluded.like_count,
+        comment_count = excluded.comment_count,
+        fetch_date = excluded.fetch_date
+    WHERE """ + VIDEO_CHANGED_CONDITION + """
+"""
+# Отметка "видео видели в API в этот день". Пишется не чаще раза в день на видео (WHERE ... IS NOT)
+VIDEO_LAST_SEEN_SQL = """
+    INSERT INTO video_last_seen (video_id, last_seen) VALUES (?, ?)
+    ON CONFLICT(video_id) DO UPDATE SET last_seen = excluded.last_seen
+    WHERE video_last_seen.last_seen IS NOT excluded.last_seen
+"""
+VIDEO_HISTORY_SQL = """
+    INSERT OR REPLACE INTO video_stats_history (video_id, fetch_date, view_count, like_count, comment_count)
+    VALUES (?, ?, ?, ?, ?)
+"""
+SQLITE_MAX_VARIABLES = 900 # Запас до лимита SQLite на число параметров запроса (999 в старых версиях)
+
+# Накопительная статистика записи видео за время работы процесса (для сводки запуска)
+write_stats = {'inserted': 0, 'changed': 0, 'unchanged': 0}
+
+def _add_write_stats(stats):
+    for key in write_stats:
+        write_stats[key] += stats.get(key, 0)
+
+def _get_existing_videos(cursor, video_ids, schemas):
+    """
+    Возвращает {video_id: (schema, (channel_id, title, published_at, ...))} для уже сохраненных видео:
+    schema - БД, в которой хранится строка (main или партиция).
+    """
+    existing = {}
+    columns = ", ".join(VIDEO_TRACKED_COLUMNS)
+    for schema in schemas:
+        for i in range(0, len(video_ids), SQLITE_MAX_VARIABLES):
+            chunk = video_ids[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT video_id, {columns} FROM {schema}.videos WHERE video_id IN ({placeholders})", chunk)
+            for row in cursor.fetchall():
+                existing[row[0]] = (schema, row[1:])
+    return existing
+
 def save_videos(conn, videos_data, channel_id):
-    """Сохраняет или обновляет информацию о видео в таблице videos."""
+    """
+    Сохраняет информацию о видео (список VideoRecord) в таблице videos с учетом изменений.
+
+    Строка записывается, только если видео новое или изменились его счетчики/метаданные
+    (fetch_date в этом случае означает дату последнего изменения). Для неизмененных видео
+    обновляется только компактная отметка last_seen в таблице video_last_seen.
+    Для новых и измененных видео в video_stats_history добавляется снимок счетчиков.
+    Новые видео пишутся в main, измененные - туда, где хранится строка (main или партиция).
+
+    Returns:
+        dict: {'inserted', 'changed', 'unchanged'} - количество видео в пакете по категориям,
+              и 'added_to_channel' - на сколько выросло число видео канала в БД
+              (новые видео и видео, перешедшие от другого канала), или False в случае ошибки.
+    """
+    stats = {'inserted': 0, 'changed': 0, 'unchanged': 0, 'added_to_channel': 0}
     if not conn: return False
-    if not videos_data: return True
+    if not videos_data: return stats
 
-    sql = """
-        INSERT INTO videos (video_id, channel_id, title, published_at, duration_seconds,
-                          view_count, like_count, comment_count, fetch_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(video_id) DO UPDATE SET
-            title = excluded.title,
-            published_at = excluded.published_at,
-            duration_seconds = excluded.duration_seconds,
-            view_count = excluded.view_count,
-            like_count = excluded.like_count,
-            comment_count = excluded.comment_count,
-            fetch_date = excluded.fetch_date
-    """
-    videos_to_save = []
-    for video in videos_data:
-        published_dt = video.get('published_at') # Это datetime объект
-        # Конвертируем в Unix timestamp UTC, если дата есть, иначе NULL
-        published_timestamp = int(published_dt.timestamp()) if published_dt else None
-
-        fetch_dt = video.get('fetch_date')
-        fetch_date_str = fetch_dt.isoformat() if isinstance(fetch_dt, date) else None
-
-        videos_to_save.append((
-            video.get('id'),
+    videos_to_save = [(
+            video.id,
             channel_id,
-            video.get('title'),
-            published_timestamp, # Сохраняем как INTEGER
-            video.get('duration_seconds'),
-            video.get('view_count'),
-            video.get('like_count'),
-            video.get('comment_count'),
-            fetch_date_str
-        ))
+            video.title,
+            video.published_ts, # Unix timestamp UTC (INTEGER) или NULL
+            video.duration_seconds,
+            video.view_count,
+            video.like_count,
+            video.comment_count,
+            video.fetch_date # 'YYYY-MM-DD'
+        ) for video in videos_data]
 
     try:
+        schemas = ['main'] + get_partition_schemas(conn) # Партиции подключены при открытии соединения
         cursor = conn.cursor()
-        cursor.executemany(sql, videos_to_save)
+        existing = _get_existing_videos(cursor, [row[0] for row in videos_to_save], schemas)
+        rows_to_write = {} # schema -> строки для записи
+        for row in videos_to_save:
+            schema, old_values = existing.get(row[0], ('main', None))
+            if old_values is None:
+                stats['inserted'] += 1
+                stats['added_to_channel'] += 1
+            elif old_values != row[1:8]:
+                stats['changed'] += 1
+                if old_values[0] != channel_id:
+                    stats['added_to_channel'] += 1
+            else:
+                stats['unchanged'] += 1
+                continue
+            rows_to_write.setdefault(schema, []).append(row)
+
+        for schema, rows in rows_to_write.items():
+            cursor.executemany(VIDEO_UPSERT_SQL.format(schema=schema), rows)
+            cursor.executemany(VIDEO_HISTORY_SQL, [(row[0], row[8], row[5], row[6], row[7]) for row in rows])
+        cursor.executemany(VIDEO_LAST_SEEN_SQL, [(row[0], row[8]) for row in videos_to_save])
         conn.commit()
-        print(f"DEBUG DB: Saved/updated {len(videos_to_save)} videos for channel {channel_id}.")
-        return True
+        _add_write_stats(stats)
+        print(f"DEBUG DB: Saved videos for channel {channel_id}: {stats['inserted']} inserted, {stats['changed']} changed, {stats['unchanged']} unchanged.")
+        return stats
     except sqlite3.Error as e:
         print(f"ERROR DB: Failed to save videos for channel {channel_id}: {e}")
         return False
@@ -268,12 +778,19 @@ def get_videos_published_between(conn, channel_id, start_date, end_date):
     Извлекает данные видео, опубликованных в заданном диапазоне дат [start_date, end_date).
     Использует Unix timestamps для сравнения.
     """
-    if not conn: return []
-    videos_data = []
     start_ts = int(datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc).timestamp())
     end_ts = int(datetime.combine(end_date, datetime.min.time(), tzinfo=timezone.utc).timestamp())
+    return get_videos_published_in_range(conn, channel_id, start_ts, end_ts)
+
+def get_videos_published_in_range(conn, channel_id, start_ts, end_ts):
+    """
+    Извлекает данные видео (список VideoRecord без title/fetch_date), опубликованных
+    в диапазоне Unix timestamps [start_ts, end_ts), отсортированные по published_at (по возрастанию).
+    Используется оконной аналитикой: один запрос на канал покрывает объединение всех окон.
+    """
+    if not conn: return []
+    videos_data = []
 
-    # !!! Добавляем duration_seconds в SELECT !!!
     sql = """
         SELECT video_id, published_at, view_count, like_count, comment_count, duration_seconds
         FROM videos
@@ -285,31 +802,175 @@ def get_videos_published_between(conn, channel_id, start_date, end_date):
           AND like_count IS NOT NULL
           AND comment_count IS NOT NULL
           AND duration_seconds IS NOT NULL -- Добавим проверку и на длительность
+        ORDER BY published_at
     """
     try:
         cursor = conn.cursor()
         cursor.execute(sql, (channel_id, start_ts, end_ts))
-        rows = cursor.fetchall()
-        column_names = [description[0] for description in cursor.description]
-
-        for row in rows:
-            row_dict = dict(zip(column_names, row))
-            timestamp = row_dict.get('published_at')
-            # Конвертируем timestamp и проверяем числовые значения
+        for video_id, published_ts, views, likes, comments, duration in cursor:
+            # Проверяем числовые значения (SQLite не гарантирует тип колонки)
             try:
-                 row_dict['published_at'] = datetime.fromtimestamp(int(timestamp), tz=timezone.utc) if timestamp is not None else None
-                 row_dict['view_count'] = int(row_dict['view_count'])
-                 row_dict['like_count'] = int(row_dict['like_count'])
-                 row_dict['comment_count'] = int(row_dict['comment_count'])
-                 row_dict['duration_seconds'] = int(row_dict['duration_seconds']) # Добавлено преобразование для длительности
-                 if row_dict['published_at'] is not None: # Добавляем только если дата ок
-                      videos_data.append(row_dict)
-            except (TypeError, ValueError, OSError) as e: # OSError для невалидных timestamp
-                 print(f"DEBUG DB: Skipping video {row_dict.get('video_id')} due to data conversion error: {e}")
+                 videos_data.append(VideoRecord(
+                     video_id, channel_id, None, int(published_ts), int(duration),
+                     int(views), int(likes), int(comments)))
+            except (TypeError, ValueError) as e:
+                 print(f"DEBUG DB: Skipping video {video_id} due to data conversion error: {e}")
                  continue
 
-        print(f"DEBUG DB: Fetched {len(videos_data)} videos published between {start_date} and {end_date} (timestamps {start_ts} to {end_ts}) for channel {channel_id}.")
+        print(f"DEBUG DB: Fetched {len(videos_data)} videos published between timestamps {start_ts} and {end_ts} for channel {channel_id}.")
         return videos_data
     except sqlite3.Error as e:
         print(f"ERROR DB: Failed to fetch videos between dates for channel {channel_id}: {e}")
-        return []
\ No newline at end of file
+        return []
+
+def get_video_metrics_for_channels(conn, channel_ids, end_ts):
+    """
+    Возвращает счетчики видео группы каналов, опубликованных до end_ts, одним запросом:
+    список кортежей (channel_id, video_id, published_at, view_count, like_count, comment_count),
+    отсортированный по каналу и дате публикации. Используется пакетным поиском аномалий.
+    """
+    if not conn or not channel_ids: return []
+    placeholders = ",".join("?" * len(channel_ids))
+    sql = f"""
+        SELECT channel_id, video_id, published_at, view_count, like_count, comment_count
+        FROM videos
+        WHERE channel_id IN ({placeholders})
+          AND published_at < ?
+          AND view_count IS NOT NULL
+        ORDER BY channel_id, published_at
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, list(channel_ids) + [end_ts])
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to fetch video metrics for {len(channel_ids)} channels: {e}")
+        return []
+
+def save_anomalies(conn, channel_ids, anomalies, reference_date):
+    """
+    Заменяет аномалии каналов channel_ids результатами нового сканирования.
+    anomalies - кортежи (scope, entity_id, channel_id, kind, metric_value, baseline, score).
+    """
+    if not conn: return False
+    detected_at = int(datetime.now(timezone.utc).timestamp())
+    reference = reference_date.isoformat()
+    try:
+        with conn:
+            for i in range(0, len(channel_ids), SQLITE_MAX_VARIABLES):
+                chunk = channel_ids[i:i + SQLITE_MAX_VARIABLES]
+                conn.execute(f"DELETE FROM anomalies WHERE channel_id IN ({','.join('?' * len(chunk))})", chunk)
+            conn.executemany("""
+                INSERT OR REPLACE INTO anomalies (scope, entity_id, channel_id, kind, metric_value, baseline, score, reference_date, detected_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (row + (reference, detected_at) for row in anomalies))
+        return True
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to save anomalies: {e}")
+        return False
+
+def get_anomalies(conn, channel_ids=None, limit=20):
+    """
+    Возвращает аномалии (самые сильные по |score|) для отчета: список словарей с полями таблицы
+    anomalies, названием канала и названием видео.
+    """
+    if not conn: return []
+    sql = """
+        SELECT a.scope, a.entity_id, a.channel_id, c.channel_name, v.title, a.kind,
+               a.metric_value, a.baseline, a.score, a.reference_date
+        FROM anomalies a
+        LEFT JOIN channels c ON c.channel_id = a.channel_id
+        LEFT JOIN videos v ON a.scope = 'video' AND v.video_id = a.entity_id
+    """
+    params = []
+    if channel_ids is not None:
+        sql += " WHERE a.channel_id IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(channel_ids)))
+    sql += " ORDER BY abs(a.score) DESC LIMIT ?"
+    params.append(limit)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to get anomalies: {e}")
+        return []
+
+def merge_staging_db(conn, staging_path):
+    """
+    Переносит каналы и видео из промежуточной БД (шарда) в основную одним пакетным upsert.
+    Семантика совпадает с save_channel / save_videos: date_added канала в основной БД не перезаписывается.
+
+    Returns:
+        tuple: (количество каналов, количество видео) из шарда или None в случае ошибки.
+    """
+    if not conn: return None
+    partition_schemas = get_partition_schemas(conn)
+    try:
+        conn.execute("ATTACH DATABASE ? AS shard", (staging_path,))
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to attach staging database '{staging_path}': {e}")
+        return None
+    try:
+        with conn: # Одна транзакция на шард
+            channels_count = conn.execute("SELECT COUNT(*) FROM shard.channels").fetchone()[0]
+            videos_count = conn.execute("SELECT COUNT(*) FROM shard.videos").fetchone()[0]
+            # WHERE true нужен SQLite для разбора INSERT ... SELECT ... ON CONFLICT
+            conn.execute("""
+                INSERT INTO channels (channel_id, channel_name, uploads_playlist_id,
+                                      last_fetched, subscriber_count, date_added)
+                SELECT channel_id, channel_name, uploads_playlist_id, last_fetched, subscriber_count, date_added
+                FROM shard.channels WHERE true
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    channel_name = excluded.channel_name,
+                    uploads_playlist_id = excluded.uploads_playlist_id,
+                    last_fetched = excluded.last_fetched,
+                    subscriber_count = excluded.subscriber_count
+            """)
+            # Классификация строк шарда до записи: новые / измененные / без изменений
+            changed_condition = " OR ".join(f"v.{column} IS NOT s.{column}" for column in VIDEO_TRACKED_COLUMNS)
+            inserted, changed = conn.execute(f"""
+                SELECT SUM(v.video_id IS NULL), SUM(v.video_id IS NOT NULL AND ({changed_condition}))
+                FROM shard.videos s LEFT JOIN videos v ON v.video_id = s.video_id
+            """).fetchone()
+            stats = {'inserted': inserted or 0, 'changed': changed or 0}
+            stats['unchanged'] = videos_count - stats['inserted'] - stats['changed']
+            # Снимки истории для новых и измененных видео (до upsert, пока видны старые значения)
+            conn.execute(f"""
+                INSERT OR REPLACE INTO video_stats_history (video_id, fetch_date, view_count, like_count, comment_count)
+                SELECT s.video_id, s.fetch_date, s.view_count, s.like_count, s.comment_count
+                FROM shard.videos s LEFT JOIN videos v ON v.video_id = s.video_id
+                WHERE s.fetch_date IS NOT NULL AND (v.video_id IS NULL OR {changed_condition})
+            """)
+            # Видео, уже перенесенные в партиции, обновляются в своих партициях, остальные пишутся в main
+            columns = ", ".join(VIDEO_COLUMNS)
+            upsert_tail = VIDEO_UPSERT_SQL[VIDEO_UPSERT_SQL.index("ON CONFLICT"):]
+            for schema in partition_schemas:
+                conn.execute(f"""
+                    INSERT INTO {schema}.videos ({columns})
+                    SELECT {columns} FROM shard.videos
+                    WHERE video_id IN (SELECT video_id FROM {schema}.videos)
+                    {upsert_tail}
+                """)
+            not_in_partitions = "".join(f" AND video_id NOT IN (SELECT video_id FROM {schema}.videos)" for schema in partition_schemas)
+            conn.execute(f"""
+                INSERT INTO main.videos ({columns})
+                SELECT {columns} FROM shard.videos WHERE true{not_in_partitions}
+                {upsert_tail}
+            """)
+            conn.execute("""
+                INSERT INTO video_last_seen (video_id, last_seen)
+                SELECT video_id, fetch_date FROM shard.videos WHERE true
+                ON CONFLICT(video_id) DO UPDATE SET last_seen = excluded.last_seen
+                WHERE video_last_seen.last_seen IS NOT excluded.last_seen
+            """)
+        _add_write_stats(stats)
+        print(f"DEBUG DB: Merged staging database '{staging_path}': {channels_count} channels, {videos_count} videos "
+              f"({stats['inserted']} inserted, {stats['changed']} changed, {stats['unchanged']} unchanged).")
+        return channels_count, videos_count
+    except sqlite3.Error as e:
+        print(f"ERROR DB: Failed to merge staging database '{staging_path}': {e}")
+        return None
+    finally:
+        conn.execute("DETACH DATABASE shard")
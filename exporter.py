@@ -0,0 +1,302 @@
+# exporter.py
+"""
+Колоночный экспорт данных в Parquet / Arrow IPC для BI.
+
+Выгружаются:
+  * videos          - таблица видео (потоково, пакетами по EXPORT_BATCH_SIZE строк);
+  * channels        - снимок таблицы каналов (подписчики, время обновления);
+  * channel_results - итоговые метрики и ранги каналов текущего запуска.
+
+Колонки типизированы (timestamp UTC для дат публикации/обновления, date32 для дат,
+int64 для счетчиков). Данные читаются из SQLite через cursor.fetchmany(), поэтому
+потребление памяти ограничено размером одного пакета независимо от размера БД.
+
+Инкрементальный режим выгружает только строки, изменившиеся с прошлого экспорта:
+для videos маркером служит fetch_date, для channels - last_fetched. Водяные знаки
+хранятся в таблице export_state. Граница включительная (>=), поэтому строки, полученные
+в день прошлого экспорта, выгружаются повторно - потребитель дедуплицирует по ключу,
+оставляя запись с максимальным fetch_date.
+"""
+import os
+import glob
+import sqlite3
+from datetime import datetime, date, timezone
+import database
+import config_loader as app_config
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    print("WARNING: 'pyarrow' library not found. Export is unavailable. Install it using: pip install pyarrow")
+    pa = None
+
+FILE_EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+def _videos_schema():
+    return pa.schema([
+        ('video_id', pa.string()),
+        ('channel_id', pa.string()),
+        ('title', pa.string()),
+        ('published_at', pa.timestamp('s', tz='UTC')),
+        ('duration_seconds', pa.int64()),
+        ('view_count', pa.int64()),
+        ('like_count', pa.int64()),
+        ('comment_count', pa.int64()),
+        ('fetch_date', pa.date32()),
+    ])
+
+def _channels_schema():
+    return pa.schema([
+        ('channel_id', pa.string()),
+        ('channel_name', pa.string()),
+        ('uploads_playlist_id', pa.string()),
+        ('last_fetched', pa.timestamp('s', tz='UTC')),
+        ('subscriber_count', pa.int64()),
+        ('date_added', pa.date32()),
+    ])
+
+def _to_array(values, field_type):
+    """Конвертирует колонку значений из SQLite в типизированный массив Arrow."""
+    if pa.types.is_date32(field_type):
+        # SQLite хранит DATE как TEXT 'YYYY-MM-DD'
+        if any(isinstance(v, str) for v in values):
+            return pa.array(values, type=pa.string()).cast(field_type)
+    return pa.array(values, type=field_type)
+
+def _rows_to_batch(rows, schema):
+    """Собирает RecordBatch из списка строк (кортежей) в порядке полей схемы."""
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = [_to_array(list(column), field.type) for column, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+class _PartitionWriter:
+    """Файл выгрузки одной партиции (Parquet или Arrow IPC)."""
+
+    def __init__(self, path, schema, file_format):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.rows = 0
+        self._sink = None
+        if file_format == 'parquet':
+            self._writer = pq.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = pa_ipc.new_file(self._sink, schema)
+
+    def write(self, batch):
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+        if self._sink:
+            self._sink.close()
+
+def _partition_value(partition_by, row):
+    """Значение партиции для строки videos (channel_id / месяц публикации)."""
+    if partition_by == 'channel':
+        return f"channel_id={row[1]}"
+    if partition_by == 'month':
+        published_ts = row[3]
+        if published_ts is None:
+            return "publish_month=unknown"
+        return f"publish_month={datetime.fromtimestamp(published_ts, tz=timezone.utc).strftime('%Y-%m')}"
+    return None
+
+def _prepare_table_dir(table_dir, incremental):
+    """
+    Готовит каталог таблицы. При полном (не инкрементальном) экспорте старые файлы
+    таблицы удаляются, чтобы каталог содержал ровно один актуальный снимок.
+    """
+    if not incremental and os.path.isdir(table_dir):
+        for old_file in glob.glob(os.path.join(table_dir, '**', 'part-*'), recursive=True):
+            os.remove(old_file)
+    os.makedirs(table_dir, exist_ok=True)
+
+def _stream_query_to_files(conn, sql, params, schema, table_dir, file_format, batch_size, run_stamp, partition_by='none'):
+    """
+    Потоково выгружает результат SQL-запроса в файлы, пакетами по batch_size строк.
+    Запрос должен быть отсортирован по ключу партиционирования, чтобы в каждый момент
+    был открыт только один файл.
+
+    Returns:
+        tuple: (количество выгруженных строк, список созданных файлов)
+    """
+    extension = FILE_EXTENSIONS[file_format]
+    files = []
+    total_rows = 0
+    writer = None
+    current_partition = object() # Гарантированно не совпадает ни с одним значением
+
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            # Разбиваем пакет на непрерывные куски с одинаковым значением партиции
+            start = 0
+            while start < len(rows):
+                partition = _partition_value(partition_by, rows[start])
+                end = start + 1
+                while end < len(rows) and _partition_value(partition_by, rows[end]) == partition:
+                    end += 1
+                if partition != current_partition:
+                    if writer:
+                        writer.close()
+                    sub_dir = os.path.join(table_dir, partition) if partition else table_dir
+                    writer = _PartitionWriter(os.path.join(sub_dir, f"part-{run_stamp}.{extension}"), schema, file_format)
+                    files.append(writer.path)
+                    current_partition = partition
+                writer.write(_rows_to_batch(rows[start:end], schema))
+                total_rows += end - start
+                start = end
+    finally:
+        if writer:
+            writer.close()
+    return total_rows, files
+
+def export_videos(conn, export_dir, file_format, partition_by, incremental, batch_size, run_stamp):
+    """Экспортирует таблицу videos (инкрементально - только строки с fetch_date >= водяного знака)."""
+    watermark = database.get_export_watermark(conn, 'videos') if incremental else None
+    order_by = {'channel': 'channel_id, published_at', 'month': 'published_at'}.get(partition_by, 'rowid')
+    where = "WHERE fetch_date >= ?" if watermark else ""
+    sql = f"""
+        SELECT video_id, channel_id, title, published_at, duration_seconds,
+               view_count, like_count, comment_count, fetch_date
+        FROM videos
+        {where}
+        ORDER BY {order_by}
+    """
+    params = (watermark,) if watermark else ()
+    table_dir = os.path.join(export_dir, 'videos')
+    _prepare_table_dir(table_dir, incremental)
+
+    # Новый водяной знак фиксируем ДО выгрузки: строки, измененные во время экспорта, попадут в следующий
+    new_watermark = conn.execute("SELECT MAX(fetch_date) FROM videos").fetchone()[0]
+    rows, files = _stream_query_to_files(conn, sql, params, _videos_schema(), table_dir, file_format, batch_size, run_stamp, partition_by)
+    if incremental and new_watermark:
+        database.save_export_watermark(conn, 'videos', new_watermark)
+    print(f"DEBUG Export: videos - {rows} rows exported to {len(files)} file(s) (since fetch_date: {watermark or 'beginning'}).")
+    return rows
+
+def export_channels(conn, export_dir, file_format, incremental, batch_size, run_stamp):
+    """Экспортирует снимок таблицы channels (инкрементально - только обновленные с прошлого экспорта)."""
+    watermark = database.get_export_watermark(conn, 'channels') if incremental else None
+    where = "WHERE last_fetched >= ?" if watermark else ""
+    sql = f"""
+        SELECT channel_id, channel_name, uploads_playlist_id, last_fetched, subscriber_count, date_added
+        FROM channels
+        {where}
+        ORDER BY channel_id
+    """
+    params = (int(watermark),) if watermark else ()
+    table_dir = os.path.join(export_dir, 'channels')
+    _prepare_table_dir(table_dir, incremental)
+
+    new_watermark = conn.execute("SELECT MAX(last_fetched) FROM channels").fetchone()[0]
+    rows, files = _stream_query_to_files(conn, sql, params, _channels_schema(), table_dir, file_format, batch_size, run_stamp)
+    if incremental and new_watermark is not None:
+        database.save_export_watermark(conn, 'channels', str(new_watermark))
+    print(f"DEBUG Export: channels - {rows} rows exported to {len(files)} file(s).")
+    return rows
+
+def _infer_results_schema(ranked_results):
+    """
+    Строит схему для итоговых результатов каналов по значениям (набор метрик зависит от окон анализа).
+    Ранги и счетчики -> int64, метрики с дробными значениями -> float64, даты -> date32.
+    """
+    field_types = {}
+    for channel in ranked_results:
+        for key, value in channel.items():
+            if value is None:
+                field_types.setdefault(key, None)
+                continue
+            if isinstance(value, bool):
+                value_type = pa.bool_()
+            elif isinstance(value, int):
+                value_type = pa.int64()
+            elif isinstance(value, float):
+                value_type = pa.float64()
+            elif isinstance(value, datetime):
+                value_type = pa.timestamp('s', tz='UTC')
+            elif isinstance(value, date):
+                value_type = pa.date32()
+            else:
+                value_type = pa.string()
+            known_type = field_types.get(key)
+            if known_type is None or (known_type == pa.int64() and value_type == pa.float64()):
+                field_types[key] = value_type
+    fields = [('reference_date', pa.date32())]
+    fields += [(key, field_type if field_type is not None else pa.string()) for key, field_type in field_types.items()]
+    return pa.schema(fields)
+
+def export_channel_results(ranked_results, reference_date, export_dir, file_format, batch_size, run_stamp):
+    """
+    Экспортирует итоговые метрики и ранги каналов. Каждый запуск пишет отдельный файл,
+    помеченный опорной датой (reference_date), так что файлы накапливают историю рейтингов.
+    """
+    if not ranked_results:
+        return 0
+    schema = _infer_results_schema(ranked_results)
+    fields = list(schema)[1:]
+    table_dir = os.path.join(export_dir, 'channel_results')
+    os.makedirs(table_dir, exist_ok=True)
+    writer = _PartitionWriter(os.path.join(table_dir, f"part-{run_stamp}.{FILE_EXTENSIONS[file_format]}"), schema, file_format)
+    try:
+        for start in range(0, len(ranked_results), batch_size):
+            chunk = ranked_results[start:start + batch_size]
+            rows = []
+            for channel in chunk:
+                row = [reference_date]
+                for field in fields:
+                    value = channel.get(field.name)
+                    if value is not None and pa.types.is_string(field.type) and not isinstance(value, str):
+                        value = str(value)
+                    row.append(value)
+                rows.append(row)
+            writer.write(_rows_to_batch(rows, schema))
+    finally:
+        writer.close()
+    print(f"DEBUG Export: channel_results - {len(ranked_results)} rows exported to '{writer.path}'.")
+    return len(ranked_results)
+
+def run_export(conn, ranked_results=None, reference_date=None):
+    """
+    Выполняет экспорт согласно секции [EXPORT] конфигурации.
+
+    Returns:
+        dict: Количество выгруженных строк по таблицам или None, если экспорт невозможен.
+    """
+    if pa is None:
+        print("ERROR Export: 'pyarrow' is not installed. Skipping export.")
+        return None
+    if not conn:
+        return None
+    export_dir = app_config.EXPORT_DIRECTORY
+    file_format = app_config.EXPORT_FORMAT
+    incremental = app_config.EXPORT_INCREMENTAL
+    batch_size = app_config.EXPORT_BATCH_SIZE
+    run_stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    print(f"\n=== Exporting data ({file_format}, partition: {app_config.EXPORT_PARTITION_BY}, incremental: {incremental}) to '{export_dir}' ===")
+    try:
+        exported = {
+            'videos': export_videos(conn, export_dir, file_format, app_config.EXPORT_PARTITION_BY, incremental, batch_size, run_stamp),
+            'channels': export_channels(conn, export_dir, file_format, incremental, batch_size, run_stamp),
+        }
+        if ranked_results:
+            exported['channel_results'] = export_channel_results(ranked_results, reference_date, export_dir, file_format, batch_size, run_stamp)
+        return exported
+    except (sqlite3.Error, OSError, pa.ArrowException) as e:
+        print(f"ERROR Export: Export failed: {e}")
+        return None
+
+if __name__ == "__main__":
+    # Самостоятельный запуск: выгрузка videos и channels без пересчета рейтингов
+    conn = database.connect_db()
+    if conn:
+        database.create_tables(conn)
+        run_export(conn)
+        conn.close()
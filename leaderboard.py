@@ -0,0 +1,268 @@
+# leaderboard.py
+"""
+Топ-K видео и каналов по метрикам: просмотры, лайки, комментарии, ER, просмотры в день и прирост.
+
+Топы видео строятся глобально, для одного канала или "топ-K в каждом канале", топы каналов -
+по агрегатам видео канала. Все выборки ограничивают память O(K), независимо от размера videos:
+  * метрики, которые SQLite считает сам (views / likes / comments / er / views_per_day),
+    сортируются в SQLite с LIMIT (по просмотрам без фильтра дат - обход индекса
+    idx_videos_view_count с конца, с фильтром дат - диапазон по idx_videos_published);
+    топ-K в каждом канале - через оконную функцию ROW_NUMBER() OVER (PARTITION BY channel_id),
+    а если SQLite ее не поддерживает (< 3.25) - ограниченными кучами по каналам;
+  * прирост (growth) требует снимка счетчиков из истории (video_stats_history) на начало
+    периода, поэтому строки читаются потоком, а топ-K держится в ограниченной куче (heapq).
+
+Все периоды отсчитываются от опорной даты (как в оконной аналитике): видео, опубликованные
+после опорной точки, не учитываются.
+
+Запуск: python leaderboard.py [metric] [days] [limit]
+"""
+import sys
+import heapq
+import sqlite3
+from datetime import datetime, timezone
+import database
+import window_engine
+import config_loader as app_config
+
+SECONDS_PER_DAY = window_engine.SECONDS_PER_DAY
+DEFAULT_GROWTH_DAYS = 7 # Период прироста, если days не задан
+WINDOW_FUNCTIONS_SUPPORTED = sqlite3.sqlite_version_info >= (3, 25, 0)
+
+VIDEO_COLUMNS = ['video_id', 'channel_id', 'title', 'published_at', 'view_count',
+                 'like_count', 'comment_count', 'duration_seconds']
+
+# Выражения метрик видео (ключ -> SQL). Параметр :reference_ts - опорная точка (Unix timestamp)
+VIDEO_METRIC_SQL = {
+    'views': 'view_count',
+    'likes': 'like_count',
+    'comments': 'comment_count',
+    'er': '(like_count + comment_count) * 100.0 / view_count',
+    # Возраст видео меньше суток считается за сутки
+    'views_per_day': f'view_count * {SECONDS_PER_DAY}.0 / MAX(:reference_ts - published_at, {SECONDS_PER_DAY})',
+}
+# Агрегаты метрик канала по его видео (ключ -> SQL)
+CHANNEL_METRIC_SQL = {
+    'views': 'SUM(view_count)',
+    'likes': 'SUM(like_count)',
+    'comments': 'SUM(comment_count)',
+    'er': f"AVG({VIDEO_METRIC_SQL['er']})",
+    'views_per_day': f"SUM({VIDEO_METRIC_SQL['views_per_day']})",
+}
+LEADERBOARD_METRICS = list(VIDEO_METRIC_SQL) + ['growth']
+
+def _check_metric(metric):
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Expected one of: {', '.join(LEADERBOARD_METRICS)}")
+
+def _default_reference_ts():
+    return window_engine.get_reference_timestamp(window_engine.get_reference_date(app_config.REFERENCE_DATE))
+
+def _video_conditions(days, reference_ts, channel_id):
+    """Условия WHERE и именованные параметры для выборки видео периода."""
+    conditions = ["view_count > 0", "published_at < :reference_ts"]
+    params = {'reference_ts': reference_ts}
+    if days:
+        conditions.append("published_at >= :since_ts")
+        params['since_ts'] = reference_ts - days * SECONDS_PER_DAY
+    if channel_id:
+        conditions.append("channel_id = :channel_id")
+        params['channel_id'] = channel_id
+    return conditions, params
+
+def _push_bounded(heap, k, value, tiebreak, item):
+    """Добавляет элемент в min-кучу размера не больше k (в куче остаются k наибольших value)."""
+    entry = (value, tiebreak, item)
+    if len(heap) < k:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+def _heap_to_rows(heap):
+    """Элементы кучи по убыванию метрики (при равенстве - в порядке поступления)."""
+    rows = []
+    for value, _, item in sorted(heap, key=lambda entry: (-entry[0], -entry[1])):
+        item['metric_value'] = value
+        rows.append(item)
+    return rows
+
+def _iter_video_growth(conn, days, reference_ts, channel_id=None):
+    """
+    Потоково возвращает (строка видео, прирост просмотров за days дней до опорной точки).
+    База прироста - последний снимок истории на дату начала периода или раньше;
+    видео, опубликованные внутри периода, считаются с нуля. Видео без базы пропускаются.
+    """
+    since_ts = reference_ts - days * SECONDS_PER_DAY
+    since_date = datetime.fromtimestamp(since_ts, tz=timezone.utc).date().isoformat()
+    conditions, params = _video_conditions(None, reference_ts, channel_id)
+    params['since_date'] = since_date
+    columns = ", ".join(f"v.{column}" for column in VIDEO_COLUMNS)
+    # Снимок на начало периода - поиск по первичному ключу (video_id, fetch_date) истории
+    sql = f"""
+        SELECT {columns},
+               (SELECT h.view_count FROM video_stats_history h
+                WHERE h.video_id = v.video_id AND h.fetch_date <= :since_date
+                ORDER BY h.fetch_date DESC LIMIT 1) AS base_views
+        FROM videos v
+        WHERE {' AND '.join(conditions)}
+    """
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    for row in cursor:
+        published_ts, views, base_views = row[3], row[4], row[-1]
+        if published_ts >= since_ts:
+            base_views = 0
+        elif base_views is None:
+            continue
+        yield dict(zip(VIDEO_COLUMNS, row[:-1])), views - base_views
+
+def top_videos(conn, metric, k=10, days=None, channel_id=None, reference_ts=None):
+    """
+    Топ-K видео по метрике, глобально или для одного канала.
+
+    Args:
+        conn: Соединение с БД.
+        metric (str): Одна из LEADERBOARD_METRICS.
+        k (int): Размер топа.
+        days (int | None): Учитывать видео, опубликованные за days дней до опорной точки
+                           (для growth - период прироста, по умолчанию DEFAULT_GROWTH_DAYS).
+        channel_id (str | None): Ограничить топ одним каналом.
+        reference_ts (int | None): Опорная точка (по умолчанию - из конфигурации).
+
+    Returns:
+        list: Словари видео (VIDEO_COLUMNS + 'metric_value') по убыванию метрики.
+    """
+    _check_metric(metric)
+    if not conn or k <= 0: return []
+    reference_ts = reference_ts if reference_ts is not None else _default_reference_ts()
+    try:
+        if metric == 'growth':
+            heap = []
+            for i, (video, growth) in enumerate(_iter_video_growth(conn, days or DEFAULT_GROWTH_DAYS, reference_ts, channel_id)):
+                _push_bounded(heap, k, growth, -i, video)
+            return _heap_to_rows(heap)
+
+        conditions, params = _video_conditions(days, reference_ts, channel_id)
+        params['k'] = k
+        sql = f"""
+            SELECT {', '.join(VIDEO_COLUMNS)}, {VIDEO_METRIC_SQL[metric]} AS metric_value
+            FROM videos
+            WHERE {' AND '.join(conditions)}
+            ORDER BY metric_value DESC
+            LIMIT :k
+        """
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        column_names = [description[0] for description in cursor.description]
+        return [dict(zip(column_names, row)) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"ERROR Leaderboard: Failed to build top videos by {metric}: {e}")
+        return []
+
+def top_videos_per_channel(conn, metric, k=10, days=None, reference_ts=None):
+    """
+    Топ-K видео по метрике в каждом канале.
+
+    Returns:
+        dict: {channel_id: [словари видео по убыванию метрики]}.
+    """
+    _check_metric(metric)
+    if not conn or k <= 0: return {}
+    reference_ts = reference_ts if reference_ts is not None else _default_reference_ts()
+    heaps = {}
+    try:
+        if metric == 'growth':
+            rows = _iter_video_growth(conn, days or DEFAULT_GROWTH_DAYS, reference_ts)
+        else:
+            conditions, params = _video_conditions(days, reference_ts, None)
+            metric_sql = VIDEO_METRIC_SQL[metric]
+            cursor = conn.cursor()
+            if WINDOW_FUNCTIONS_SUPPORTED:
+                params['k'] = k
+                cursor.execute(f"""
+                    SELECT {', '.join(VIDEO_COLUMNS)}, metric_value FROM (
+                        SELECT {', '.join(VIDEO_COLUMNS)}, {metric_sql} AS metric_value,
+                               ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY {metric_sql} DESC) AS channel_rank
+                        FROM videos
+                        WHERE {' AND '.join(conditions)}
+                    )
+                    WHERE channel_rank <= :k
+                    ORDER BY channel_id, channel_rank
+                """, params)
+                results = {}
+                for row in cursor:
+                    video = dict(zip(VIDEO_COLUMNS + ['metric_value'], row))
+                    results.setdefault(video['channel_id'], []).append(video)
+                return results
+            cursor.execute(f"""
+                SELECT {', '.join(VIDEO_COLUMNS)}, {metric_sql} AS metric_value
+                FROM videos
+                WHERE {' AND '.join(conditions)}
+            """, params)
+            rows = ((dict(zip(VIDEO_COLUMNS, row[:-1])), row[-1]) for row in cursor)
+
+        for i, (video, value) in enumerate(rows):
+            _push_bounded(heaps.setdefault(video['channel_id'], []), k, value, -i, video)
+        return {channel_id: _heap_to_rows(heap) for channel_id, heap in sorted(heaps.items())}
+    except sqlite3.Error as e:
+        print(f"ERROR Leaderboard: Failed to build per-channel top videos by {metric}: {e}")
+        return {}
+
+def top_channels(conn, metric, k=10, days=None, reference_ts=None):
+    """
+    Топ-K каналов по агрегату метрики видео, опубликованных за days дней до опорной точки
+    (views / likes / comments / views_per_day - сумма, er - среднее, growth - суммарный прирост).
+
+    Returns:
+        list: Словари {'channel_id', 'channel_name', 'videos_count', 'metric_value'} по убыванию метрики.
+    """
+    _check_metric(metric)
+    if not conn or k <= 0: return []
+    reference_ts = reference_ts if reference_ts is not None else _default_reference_ts()
+    try:
+        if metric == 'growth':
+            # Агрегаты по каналам занимают O(число каналов), топ выбирается кучей
+            totals = {}
+            for video, growth in _iter_video_growth(conn, days or DEFAULT_GROWTH_DAYS, reference_ts):
+                total = totals.setdefault(video['channel_id'], [0, 0])
+                total[0] += growth
+                total[1] += 1
+            top = heapq.nlargest(k, totals.items(), key=lambda item: item[1][0])
+            channels_info = database.get_channels_db_info(conn, [channel_id for channel_id, _ in top])
+            return [{'channel_id': channel_id, 'channel_name': channels_info.get(channel_id, (None,))[0],
+                     'videos_count': videos_count, 'metric_value': growth}
+                    for channel_id, (growth, videos_count) in top]
+
+        conditions, params = _video_conditions(days, reference_ts, None)
+        params['k'] = k
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT v.channel_id, c.channel_name, COUNT(*) AS videos_count, {CHANNEL_METRIC_SQL[metric]} AS metric_value
+            FROM videos v LEFT JOIN channels c ON c.channel_id = v.channel_id
+            WHERE {' AND '.join(f'v.{condition}' for condition in conditions)}
+            GROUP BY v.channel_id
+            ORDER BY metric_value DESC
+            LIMIT :k
+        """, params)
+        column_names = [description[0] for description in cursor.description]
+        return [dict(zip(column_names, row)) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"ERROR Leaderboard: Failed to build top channels by {metric}: {e}")
+        return []
+
+if __name__ == "__main__":
+    from tabulate import tabulate
+    metric = sys.argv[1] if len(sys.argv) > 1 else 'views'
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    limit = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    conn = database.connect_db_readonly()
+    if conn:
+        videos = top_videos(conn, metric, limit, days)
+        print(f"\n--- Top {limit} videos by {metric} ({days}d) ---")
+        print(tabulate([[v['video_id'], v['channel_id'], (v['title'] or '')[:40], v['view_count'], round(v['metric_value'], 2)] for v in videos],
+                       headers=['Video', 'Channel', 'Title', 'Views', metric], tablefmt='simple'))
+        channels = top_channels(conn, metric, limit, days)
+        print(f"\n--- Top {limit} channels by {metric} ({days}d) ---")
+        print(tabulate([[c['channel_id'], c['channel_name'], c['videos_count'], round(c['metric_value'], 2)] for c in channels],
+                       headers=['Channel', 'Name', 'Videos', metric], tablefmt='simple'))
+        conn.close()
@@ -0,0 +1,100 @@
+# parallel_analysis.py
+"""
+Параллельный анализ каналов в несколько процессов.
+
+Анализ (pipeline.analyze_channel: базовая статистика, метрики окон, ER) - чистый Python по каждому
+каналу и при тысячах каналов занимает одно ядро на минуты. Здесь каналы делятся на пакеты и
+обрабатываются пулом процессов:
+  * каждый процесс один раз открывает свое соединение только для чтения (mode=ro) и использует его
+    для всех своих пакетов; в режиме WAL такие соединения не мешают записи основного процесса;
+  * воркер возвращает только рассчитанные метрики канала (без названия, подписчиков и т.п.);
+  * основной процесс дописывает их в channel_results в исходном порядке каналов, а ранжирование
+    и агрегаты групп считаются один раз, как и при последовательном анализе.
+Результат совпадает с последовательным режимом: воркеры выполняют тот же pipeline.analyze_channel
+с той же опорной датой и окнами. Каналы пакета, который завершился ошибкой, анализируются
+в основном процессе.
+
+Включается в config.ini: [ANALYSIS] WORKERS = N (0 - по числу ядер, 1 - последовательно).
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import database
+import pipeline
+
+CHUNKS_PER_WORKER = 4 # Пакетов на процесс (выравнивание нагрузки при разном числе видео у каналов)
+
+_worker_conn = None # Соединение только для чтения процесса-воркера
+
+def get_worker_count(requested_workers):
+    """Число процессов: запрошенное или (0) число ядер."""
+    return requested_workers if requested_workers > 0 else (os.cpu_count() or 1)
+
+def split_into_chunks(channel_ids, chunk_count):
+    """Делит список каналов на chunk_count пакетов подряд идущих каналов (порядок сохраняется)."""
+    chunk_size = -(-len(channel_ids) // max(1, chunk_count))
+    return [channel_ids[i:i + chunk_size] for i in range(0, len(channel_ids), chunk_size)]
+
+def _init_worker(db_name):
+    """Инициализатор процесса пула: открывает соединение только для чтения."""
+    global _worker_conn
+    _worker_conn = database.connect_db_readonly(db_name)
+
+def analyze_chunk(channel_ids, reference_date, windows):
+    """
+    Воркер: анализирует пакет каналов по соединению процесса.
+    Выполняется в отдельном процессе.
+
+    Returns:
+        list: [(channel_id, {метрика: значение})] в порядке channel_ids.
+    """
+    if _worker_conn is None:
+        raise RuntimeError("read-only database connection is not available in worker")
+    results = []
+    for channel_id in channel_ids:
+        metrics = {'channel_id': channel_id}
+        pipeline.analyze_channel(_worker_conn, metrics, reference_date, windows)
+        del metrics['channel_id']
+        results.append((channel_id, metrics))
+    return results
+
+def analyze_channels(conn, channel_results_list, reference_date, windows, workers):
+    """
+    Анализирует каналы пулом процессов и дописывает метрики в их channel_results.
+
+    Args:
+        conn: Соединение основного процесса (для каналов пакетов, завершившихся ошибкой).
+        channel_results_list (list): Словари channel_results (после pipeline.load_channel_db_info).
+        reference_date (date): Опорная дата запуска.
+        windows (list): Окна анализа в днях.
+        workers (int): Число процессов.
+
+    Returns:
+        list: Тот же channel_results_list.
+    """
+    by_id = {channel_results['channel_id']: channel_results for channel_results in channel_results_list}
+    channel_ids = list(by_id)
+    if not channel_ids:
+        return channel_results_list
+    conn.commit() # Воркеры видят только зафиксированные данные
+    worker_count = min(workers, len(channel_ids))
+    chunks = split_into_chunks(channel_ids, worker_count * CHUNKS_PER_WORKER)
+    print(f"\n=== Parallel analysis: {len(channel_ids)} channels, {worker_count} processes, {len(chunks)} chunks ===")
+    started = time.perf_counter()
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_worker, initargs=(database.DB_NAME,)) as executor:
+        futures = {executor.submit(analyze_chunk, chunk, reference_date, windows): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                for channel_id, metrics in future.result():
+                    by_id[channel_id].update(metrics)
+            except Exception as e:
+                print(f"ERROR Parallel analysis: Chunk of {len(futures[future])} channels failed: {e}. Analyzing them in the main process.")
+                failed.extend(futures[future])
+
+    for channel_id in failed:
+        pipeline.analyze_channel(conn, by_id[channel_id], reference_date, windows)
+    print(f"DEBUG Parallel analysis: {len(channel_ids) - len(failed)} channels analyzed by workers, "
+          f"{len(failed)} in main process in {time.perf_counter() - started:.2f}s.")
+    return channel_results_list
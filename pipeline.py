@@ -0,0 +1,163 @@
+# pipeline.py
+"""
+Общие шаги обработки канала, используемые разовым запуском (main.py)
+и долгоживущими режимами (scheduler.py, query_server.py).
+"""
+import math
+import youtube_api
+import database
+import analyzer
+import window_engine
+
+# Метрики, по которым считаются агрегаты группы (к ним добавляются оконные метрики)
+GROUP_METRICS = [ 'subscriber_count', 'observed_videos_count', 'avg_views', 'avg_likes', 'avg_duration_sec', 'avg_duration_sec_30d', 'avg_views_per_video_30d', 'videos_last_30d_count', 'avg_engagement_rate', 'views_sum_last_30d', 'view_trend_ratio' ]
+
+def parse_subscriber_count(channel_info):
+    """Возвращает количество подписчиков из ответа API как int (или None, если скрыто/некорректно)."""
+    sub_count_str = channel_info.get('subscriber_count')
+    if sub_count_str is None:
+        return None
+    try:
+        return int(sub_count_str)
+    except (ValueError, TypeError):
+        return None
+
+def fetch_channel(conn, channel_id, max_videos, channel_info=None, known_videos_count=None):
+    """
+    Получает из API информацию о канале, последние видео и их статистику и сохраняет все в БД.
+
+    Args:
+        conn: Объект соединения с БД.
+        channel_id (str): ID канала.
+        max_videos (int | None): Лимит видео для загрузки (None - все).
+        channel_info (dict, optional): Информация о канале, уже полученная пакетным запросом
+                                       (youtube_api.get_channels_details); None - запросить.
+        known_videos_count (int, optional): Число видео канала в БД до загрузки (см. save_fetched_channel).
+
+    Returns:
+        dict: {'channel_name', 'subscriber_count', 'videos', 'observed_videos_count', 'save_stats'}
+              или None, если не удалось получить информацию о канале.
+              'observed_videos_count' и 'save_stats' равны None, если видео не сохранялись.
+    """
+    if channel_info is None:
+        channel_info = youtube_api.get_channel_details(channel_id)
+    if not channel_info:
+        print(f"Warning: Failed to fetch channel details from API for {channel_id}. Skipping API update.")
+        return None
+
+    uploads_playlist_id = channel_info.get('uploads_playlist_id')
+    videos_data = []
+    if not uploads_playlist_id:
+        print(f"Warning: No uploads playlist ID found for {channel_id}")
+    else:
+        video_ids = youtube_api.get_playlist_video_ids(uploads_playlist_id, max_results=max_videos)
+        if not video_ids:
+            print("Warning: No video IDs received from API.")
+        else:
+            videos_data = youtube_api.get_video_details(video_ids)
+            if not videos_data:
+                print("Warning: No video details received from API.")
+    return save_fetched_channel(conn, channel_id, channel_info, videos_data, known_videos_count)
+
+def save_fetched_channel(conn, channel_id, channel_info, videos_data, known_videos_count=None):
+    """
+    Сохраняет в БД информацию о канале и его видео, полученные из API
+    (синхронным клиентом или youtube_api_async).
+    Если известно число видео канала в БД до сохранения (known_videos_count), новое число
+    считается по статистике записи, иначе - отдельным запросом COUNT.
+
+    Returns:
+        dict: То же, что fetch_channel.
+    """
+    result = {
+        'channel_name': channel_info['title'],
+        'subscriber_count': parse_subscriber_count(channel_info),
+        'videos': [],
+        'observed_videos_count': None,
+        'save_stats': None,
+    }
+    database.save_channel(conn, channel_info)
+    if not videos_data:
+        return result
+
+    result['save_stats'] = database.save_videos(conn, videos_data, channel_id) or None
+    result['videos'] = videos_data
+    if known_videos_count is not None and result['save_stats']:
+        result['observed_videos_count'] = known_videos_count + result['save_stats']['added_to_channel']
+    else:
+        result['observed_videos_count'] = database.get_total_videos_count(conn, channel_id)
+    return result
+
+def init_channel_results(channel_id, groups=None):
+    """
+    Возвращает словарь результатов канала со значениями по умолчанию.
+    groups - теги групп канала из списка каналов (хранятся строкой через запятую).
+    """
+    results = {
+        'channel_id': channel_id, 'channel_name': None, 'date_added': None,
+        'subscriber_count': None, 'observed_videos_count': 0,
+        'avg_views': None, 'max_views': None, 'min_views': None, 'avg_likes': None,
+        'max_likes': None, 'min_likes': None, 'avg_duration_sec': None,
+        'max_duration_sec': None, 'min_duration_sec': None, 'avg_duration_sec_30d': None,
+        'avg_views_per_video_30d': None, 'videos_last_30d_count': 0,
+        'avg_engagement_rate': 0.0, 'views_sum_last_30d': 0, 'view_trend_ratio': None, 'groups': None }
+    if groups:
+        results['groups'] = ", ".join(groups)
+    return results
+
+def load_channel_db_info(conn, channel_results, db_info=None):
+    """
+    Заполняет название, дату добавления, подписчиков и число видео канала из БД.
+    db_info - строка канала из database.get_channels_db_info, загруженная заранее для всего списка
+    каналов (None - запросить для одного канала).
+    """
+    channel_id = channel_results['channel_id']
+    if db_info is None:
+        db_info = database.get_channels_db_info(conn, [channel_id]).get(channel_id, (None, None, None, 0))
+    (channel_results['channel_name'], channel_results['date_added'],
+     channel_results['subscriber_count'], channel_results['observed_videos_count']) = db_info
+
+def analyze_channel(conn, channel_results, reference_date, windows):
+    """
+    Рассчитывает по данным БД базовую статистику и метрики всех окон канала
+    и дописывает их в channel_results.
+    """
+    channel_id = channel_results['channel_id']
+    video_stats_list = database.get_video_stats_for_channel(conn, channel_id)
+    basic_stats = analyzer.calculate_basic_stats(video_stats_list) if video_stats_list else None
+    if basic_stats: channel_results.update(basic_stats)
+    # Все окна (7/30/90/365 и т.д.) считаются за один запрос и один проход по видео
+    window_results = window_engine.analyze_channel_windows(conn, channel_id, reference_date, windows)
+    channel_results.update(window_results)
+    # Базовое 30-дневное окно дублируется в ключи основной таблицы и рангов
+    channel_results['avg_engagement_rate'] = window_results['avg_engagement_rate_30d']
+    channel_results['view_trend_ratio'] = window_results['view_trend_ratio_30d']
+    return channel_results
+
+def calculate_group_stats(ranked_results, window_metrics):
+    """Рассчитывает min/avg/max по группе каналов для GROUP_METRICS и оконных метрик."""
+    group_stats = {}
+    metrics_to_aggregate = GROUP_METRICS + [m for m in window_metrics if m not in GROUP_METRICS]
+    for metric in metrics_to_aggregate:
+        valid_values = []
+        for channel_data in ranked_results:
+            value = channel_data.get(metric)
+            if value is not None:
+                if metric.startswith('view_trend_ratio') and value == float('inf'): continue
+                if isinstance(value, (int, float)) and not math.isinf(value): valid_values.append(value)
+        if valid_values:
+            min_val, max_val, avg_val = min(valid_values), max(valid_values), sum(valid_values) / len(valid_values)
+            group_stats[metric] = {'min': min_val, 'avg': avg_val, 'max': max_val, 'count': len(valid_values)}
+        else:
+            group_stats[metric] = {'min': None, 'avg': None, 'max': None, 'count': 0}
+    return group_stats
+
+def calculate_group_stats_by_tag(ranked_results, window_metrics, channel_list):
+    """Рассчитывает агрегаты отдельно для каждого тега группы из списка каналов: {тег: group_stats}."""
+    stats_by_tag = {}
+    for tag in channel_list.group_names():
+        members = set(channel_list.channels_in_group(tag))
+        tag_results = [channel for channel in ranked_results if channel['channel_id'] in members]
+        if tag_results:
+            stats_by_tag[tag] = calculate_group_stats(tag_results, window_metrics)
+    return stats_by_tag
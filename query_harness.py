@@ -0,0 +1,353 @@
+# query_harness.py
+"""
+Регрессионная проверка числа запросов к SQLite и вызовов API (поиск N+1).
+
+Полный запуск main.py выполняется на фиксированной тестовой выборке: детерминированный список каналов
+и тестовый сервис API (FixtureYouTubeService) вместо googleapiclient, БД создается во временной папке.
+Все соединения с БД создаются классом TracedConnection (database.CONNECTION_FACTORY): он считает
+выполненные SQL-запросы (через set_trace_callback, с группировкой по тексту запроса без значений)
+и прочитанные строки; вызовы API считаются по эндпоинтам (youtube_api.api_call_counts).
+
+Сценарии (на одной БД, по порядку): загрузка из API, анализ без кэша, повторный анализ с кэшем.
+Каждый сценарий выполняется для CHANNELS и 2 * CHANNELS каналов, и проверяется прирост счетчиков
+между размерами:
+  * запросы, которые по природе выполняются для каждого канала или видео (запись видео канала,
+    выборки анализа), перечислены в PER_CHANNEL_STATEMENTS с допустимым числом на канал;
+  * любой другой запрос может расти не быстрее O(каналов / 50) - новый запрос в цикле по каналам
+    (N+1) нарушает бюджет;
+  * channels.list - O(каналов / 50), playlistItems.list и videos.list - не больше страниц на канал;
+  * прочитанные строки - не больше ROWS_PER_VIDEO на видео канала.
+
+Запуск: python query_harness.py [число каналов] [-v]
+Код возврата 1, если бюджет превышен. Нужен config.ini с ключом API (ключ не используется).
+"""
+import io
+import math
+import os
+import re
+import runpy
+import sqlite3
+import sys
+import random
+import tempfile
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+import config_loader as app_config
+import database
+import youtube_api
+import rate_limiter
+import anomalies
+
+DEFAULT_CHANNELS = 60
+FIXTURE_SEED = 20240601
+FIXTURE_MAX_VIDEOS = 120 # Видео канала в тестовом API (загружается не больше MAX_VIDEOS_PER_CHANNEL)
+MAX_VIDEOS_PER_CHANNEL = 100
+API_PAGE_SIZE = 50
+ROWS_PER_VIDEO = 4 # Допустимо прочитанных строк на видео канала (выборки анализа, поиск существующих видео)
+ROWS_PER_CHANNEL = 10
+BATCH_SLACK = 1 # Допуск для запросов O(каналов / 50): граница пакета
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+# Запросы, которые выполняются для каждого канала: (метка, регулярное выражение по нормализованному
+# тексту запроса, допустимое число на канал). executemany считается одним запросом.
+PER_CHANNEL_STATEMENTS = [
+    ('save_channel', r"^INSERT INTO channels ", 1),
+    ('save_videos: existing rows', r"^SELECT video_id, .* FROM \w+\.videos WHERE video_id IN", 2),
+    ('save_videos: upsert', r"^INSERT INTO \w+\.videos ", 2),
+    ('save_videos: history', r"^INSERT OR REPLACE INTO video_stats_history ", 2),
+    ('save_videos: last seen', r"^INSERT INTO video_last_seen ", 1),
+    ('save_videos: attached partitions', r"^PRAGMA database_list", 1),
+    ('transactions', r"^(BEGIN|COMMIT)", 3),
+    ('analysis: basic stats', r"^SELECT view_count, like_count, duration_seconds FROM videos WHERE channel_id = \?", 1),
+    ('analysis: windows', r"^SELECT video_id, published_at, view_count, like_count, comment_count, duration_seconds FROM videos WHERE channel_id = \?", 1),
+]
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+WHITESPACE_RE = re.compile(r"\s+")
+COMMENT_RE = re.compile(r"--[^\n]*")
+
+class QueryStats:
+    """Счетчики одного запуска: SQL-запросы по нормализованному тексту и прочитанные строки."""
+
+    def __init__(self):
+        self.statements = Counter()
+        self.rows = 0
+        self.batched_rows = 0 # Строки, записанные через executemany (один запрос на пакет)
+        self.in_executemany = False
+
+    def reset(self):
+        self.statements.clear()
+        self.rows = 0
+        self.batched_rows = 0
+
+stats = QueryStats()
+
+def normalize_sql(sql):
+    """Текст запроса без значений: литералы и списки параметров заменяются на '?'."""
+    sql = COMMENT_RE.sub(' ', sql)
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_LIST_RE.sub('?, ...', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+def _trace(sql):
+    if stats.in_executemany:
+        stats.batched_rows += 1
+    else:
+        stats.statements[normalize_sql(sql)] += 1
+
+class CountingCursor(sqlite3.Cursor):
+    """Курсор, считающий прочитанные строки. executemany считается одним запросом."""
+
+    def executemany(self, sql, seq_of_parameters):
+        stats.statements[normalize_sql(sql)] += 1
+        stats.in_executemany = True
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            stats.in_executemany = False
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        stats.rows += len(rows)
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        stats.rows += 1
+        return row
+
+class TracedConnection(sqlite3.Connection):
+    """Соединение, считающее запросы (set_trace_callback) и строки (CountingCursor)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# --- Тестовая выборка ---
+
+def fixture_channel_ids(count):
+    """ID каналов выборки (первые count каналов всегда одни и те же)."""
+    return [f"UCfixture{index:015d}" for index in range(count)]
+
+def _fixture_random(key):
+    return random.Random(f"{FIXTURE_SEED}:{key}")
+
+def _fixture_video_ids(channel_id):
+    video_count = _fixture_random(channel_id).randint(5, FIXTURE_MAX_VIDEOS)
+    return [f"{channel_id[-8:]}v{index:03d}" for index in range(video_count)]
+
+def _fixture_video_item(video_id, channel_id, now):
+    rng = _fixture_random(video_id)
+    index = int(video_id.rsplit('v', 1)[1])
+    published = now - timedelta(days=index * 3 + rng.random() * 3)
+    views = rng.randint(0, 200000)
+    return {'id': video_id,
+            'snippet': {'title': f"Video {video_id}", 'channelId': channel_id,
+                        'publishedAt': published.strftime('%Y-%m-%dT%H:%M:%SZ')},
+            'contentDetails': {'duration': f"PT{rng.randint(0, 59)}M{rng.randint(1, 59)}S"},
+            'statistics': {'viewCount': str(views), 'likeCount': str(views // rng.randint(10, 60)),
+                           'commentCount': str(views // rng.randint(100, 400))}}
+
+class FixtureRequest:
+    def __init__(self, handler):
+        self.handler = handler
+
+    def execute(self, num_retries=0):
+        return self.handler()
+
+class _FixtureChannels:
+    def list(self, part=None, id=None, forHandle=None, forUsername=None, maxResults=None):
+        def handler():
+            items = [{'id': channel_id,
+                      'snippet': {'title': f"Fixture {channel_id[-6:]}"},
+                      'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + channel_id[2:]}},
+                      'statistics': {'subscriberCount': str(_fixture_random(channel_id).randint(100, 10 ** 6))}}
+                     for channel_id in (id or '').split(',') if channel_id]
+            return {'items': items}
+        return FixtureRequest(handler)
+
+class _FixturePlaylistItems:
+    def list(self, part=None, playlistId=None, maxResults=API_PAGE_SIZE, pageToken=None):
+        def handler():
+            video_ids = _fixture_video_ids('UC' + playlistId[2:])
+            start = int(pageToken or 0)
+            response = {'items': [{'contentDetails': {'videoId': video_id}} for video_id in video_ids[start:start + maxResults]]}
+            if start + maxResults < len(video_ids):
+                response['nextPageToken'] = str(start + maxResults)
+            return response
+        return FixtureRequest(handler)
+
+class _FixtureVideos:
+    def __init__(self, now):
+        self.now = now
+
+    def list(self, part=None, id=None, maxResults=None):
+        def handler():
+            items = []
+            for video_id in id.split(','):
+                channel_id = 'UCfixture' + video_id.split('v')[0].rjust(15, '0')
+                items.append(_fixture_video_item(video_id, channel_id, self.now))
+            return {'items': items}
+        return FixtureRequest(handler)
+
+class FixtureYouTubeService:
+    """Тестовый сервис API с интерфейсом googleapiclient (channels / playlistItems / videos)."""
+
+    def __init__(self):
+        now = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._channels, self._playlist_items, self._videos = _FixtureChannels(), _FixturePlaylistItems(), _FixtureVideos(now)
+
+    def channels(self):
+        return self._channels
+
+    def playlistItems(self):
+        return self._playlist_items
+
+    def videos(self):
+        return self._videos
+
+# --- Запуск и проверка ---
+
+SCENARIOS = [
+    ('fetch', {'FETCH_DATA_FROM_API': True, 'ANALYSIS_CACHE_ENABLED': True}),
+    ('analyze', {'FETCH_DATA_FROM_API': False, 'ANALYSIS_CACHE_ENABLED': False}),
+    ('cached', {'FETCH_DATA_FROM_API': False, 'ANALYSIS_CACHE_ENABLED': True}),
+]
+RUN_SETTINGS = {
+    'ANALYZE_DATA_FROM_DB': True, 'ANALYSIS_WORKERS': 1, 'SHARDING_ENABLED': False, 'ASYNC_API_ENABLED': False, 'BATCH_API_ENABLED': False,
+    'EXPORT_ENABLED': False, 'STORAGE_COMPACT_AFTER_RUN': False, 'MAX_VIDEOS_TO_FETCH_PER_CHANNEL': MAX_VIDEOS_PER_CHANNEL,
+    'ANOMALIES_ENABLED': anomalies.np is not None,
+}
+
+def run_main(workdir, settings):
+    """
+    Выполняет main.py с настройками settings в рабочей папке workdir.
+
+    Returns:
+        dict: {'statements': Counter, 'rows', 'api_calls', 'output'}.
+    """
+    for name, value in dict(RUN_SETTINGS, **settings).items():
+        setattr(app_config, name, value)
+    app_config.CHANNELS_FILES = [os.path.join(workdir, 'channels.txt')]
+    app_config.STORAGE_PARTITION_DIR = os.path.join(workdir, 'partitions')
+    database.DB_NAME = os.path.join(workdir, 'fixture.db')
+    database.CONNECTION_FACTORY = TracedConnection
+    youtube_api.youtube_service = FixtureYouTubeService()
+    youtube_api.api_call_counts.clear()
+    stats.reset()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        try:
+            runpy.run_path(MAIN_SCRIPT, run_name='__main__')
+        except SystemExit as e:
+            print(f"SystemExit: {e}")
+    return {'statements': Counter(stats.statements), 'rows': stats.rows, 'batched_rows': stats.batched_rows,
+            'api_calls': dict(youtube_api.api_call_counts), 'output': output.getvalue()}
+
+def run_size(channel_count):
+    """Выполняет все сценарии на новой БД для channel_count каналов: {сценарий: результат run_main}."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='query_harness_') as workdir:
+        channel_ids = fixture_channel_ids(channel_count)
+        with open(os.path.join(workdir, 'channels.txt'), 'w', encoding='utf-8') as f:
+            f.write("# group: Fixture A\n" + "\n".join(channel_ids[::2]) + "\n")
+            f.write("# group: Fixture B\n" + "\n".join(channel_ids[1::2]) + "\n")
+        for name, settings in SCENARIOS:
+            results[name] = run_main(workdir, settings)
+    return results
+
+def check_budgets(small, large, small_channels, large_channels):
+    """
+    Сравнивает счетчики сценария для двух размеров списка каналов.
+
+    Returns:
+        list: Описания нарушений бюджета (пустой список - все в пределах).
+    """
+    violations = []
+    added_channels = large_channels - small_channels
+    batch_growth = math.ceil(large_channels / API_PAGE_SIZE) - math.ceil(small_channels / API_PAGE_SIZE) + BATCH_SLACK
+    for output, channels in ((small['output'], small_channels), (large['output'], large_channels)):
+        if 'UNEXPECTED ERROR' in output or 'SystemExit' in output or 'Traceback' in output:
+            violations.append(f"main.py failed for {channels} channels (run with -v to see the output)")
+
+    for sql in sorted(set(small['statements']) | set(large['statements'])):
+        growth = large['statements'][sql] - small['statements'][sql]
+        label, allowed = None, batch_growth
+        for statement_label, pattern, limit in PER_CHANNEL_STATEMENTS:
+            if re.search(pattern, sql):
+                label, allowed = statement_label, limit * added_channels
+                break
+        if growth > allowed:
+            violations.append(f"SQL grows by {growth} for +{added_channels} channels (allowed {allowed}, "
+                              f"{label or 'O(channels/50)'}): {sql[:160]}")
+
+    api_budgets = {'channels.list': batch_growth,
+                   'playlistItems.list': math.ceil(MAX_VIDEOS_PER_CHANNEL / API_PAGE_SIZE) * added_channels,
+                   'videos.list': math.ceil(MAX_VIDEOS_PER_CHANNEL / API_PAGE_SIZE) * added_channels}
+    for endpoint in sorted(set(small['api_calls']) | set(large['api_calls'])):
+        growth = large['api_calls'].get(endpoint, 0) - small['api_calls'].get(endpoint, 0)
+        allowed = api_budgets.get(endpoint, batch_growth)
+        if growth > allowed:
+            violations.append(f"API {endpoint} grows by {growth} for +{added_channels} channels (allowed {allowed})")
+
+    rows_allowed = (ROWS_PER_VIDEO * FIXTURE_MAX_VIDEOS + ROWS_PER_CHANNEL) * added_channels
+    if large['rows'] - small['rows'] > rows_allowed:
+        violations.append(f"Rows read grow by {large['rows'] - small['rows']} for +{added_channels} channels (allowed {rows_allowed})")
+    return violations
+
+def run_harness(channel_count=DEFAULT_CHANNELS, verbose=False):
+    """
+    Выполняет сценарии для channel_count и 2 * channel_count каналов и проверяет бюджеты.
+
+    Returns:
+        bool: True, если все бюджеты соблюдены.
+    """
+    rate_limiter.limiter.enabled = False # Тестовый API не ограничивает частоту, паузы не нужны
+    small_count, large_count = channel_count, channel_count * 2
+    small, large = run_size(small_count), run_size(large_count)
+    all_violations = []
+    for name, _ in SCENARIOS:
+        violations = check_budgets(small[name], large[name], small_count, large_count)
+        print(f"--- Scenario '{name}': SQL statements {sum(small[name]['statements'].values())}"
+              f" -> {sum(large[name]['statements'].values())}, rows read {small[name]['rows']} -> {large[name]['rows']}, "
+              f"API calls {small[name]['api_calls']} -> {large[name]['api_calls']} ({small_count} -> {large_count} channels): "
+              f"{'OK' if not violations else f'{len(violations)} violations'}")
+        if verbose:
+            for sql, count in large[name]['statements'].most_common():
+                print(f"    {small[name]['statements'][sql]:>7} -> {count:>7}  {sql[:150]}")
+        for violation in violations:
+            print(f"ERROR Query harness [{name}]: {violation}")
+            if verbose and 'failed' in violation:
+                print(large[name]['output'][-3000:])
+        all_violations.extend(violations)
+    print(f"\n=== Query harness: {'PASSED' if not all_violations else f'FAILED ({len(all_violations)} violations)'} ===")
+    return not all_violations
+
+if __name__ == "__main__":
+    arguments = [arg for arg in sys.argv[1:] if arg != '-v']
+    passed = run_harness(int(arguments[0]) if arguments else DEFAULT_CHANNELS, verbose='-v' in sys.argv[1:])
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,320 @@
+# query_server.py
+"""
+Локальный HTTP-сервер (только чтение) для запросов метрик, рангов, агрегатов и топа видео в JSON.
+
+Эндпоинты:
+  GET /health                          - состояние сервера и версия данных
+  GET /channels                        - метрики и ранги всех каналов
+  GET /channels/<channel_id>           - метрики и ранги одного канала
+  GET /ranks?metric=avg_views&limit=N  - каналы, отсортированные по рангу метрики
+  GET /groups                          - агрегаты (min/avg/max) по группе каналов
+  GET /top-videos?metric=views&days=7&limit=10[&channel_id=...] - топ видео
+                                       (views / likes / comments / er / views_per_day / growth)
+  GET /top-channels?metric=views&days=7&limit=10 - топ каналов по агрегату метрики видео
+
+Результаты анализа хранятся в памяти в виде готовых JSON-ответов. Кэш привязан к версии данных
+(PRAGMA data_version - меняется при каждой фиксации транзакции другим соединением, например
+main.py или scheduler.py). При изменении данных кэш пересчитывается в фоновом потоке, а до
+окончания пересчета отдается предыдущая версия (заголовок X-Stale: 1) - поэтому запросы
+не ждут пересчета, даже пока идет загрузка данных.
+
+Все соединения с БД открываются только для чтения (mode=ro) и в режиме WAL не блокируют запись.
+Запросы топов используют небольшой пул соединений, открытых при старте сервера
+(ThreadingHTTPServer обрабатывает каждый запрос в новом потоке).
+
+Запуск: python query_server.py
+"""
+import json
+import math
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import database
+import analyzer
+import pipeline
+import channel_sources
+import window_engine
+import leaderboard
+import config_loader as app_config
+
+MAX_LIMIT = 1000
+LEADERBOARD_CACHE_SIZE = 256
+READ_POOL_SIZE = 4 # Соединений только для чтения для запросов топов (одновременно выполняемых запросов)
+
+def _json_safe(value):
+    """Приводит значение к виду, допустимому в строгом JSON (даты -> ISO, бесконечность -> строка)."""
+    if isinstance(value, float) and math.isinf(value):
+        return "Infinity" if value > 0 else "-Infinity"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+def _to_json_bytes(payload):
+    return json.dumps(_json_safe(payload), ensure_ascii=False, allow_nan=False).encode('utf-8')
+
+class AnalysisSnapshot:
+    """Результаты анализа для одной версии данных с заранее сериализованными ответами."""
+
+    def __init__(self, version, reference_date, ranked_results, group_stats):
+        self.version = version
+        self.reference_date = reference_date
+        self.built_at = time.time()
+        self.ranked_results = ranked_results
+        self.channels_json = _to_json_bytes({'reference_date': reference_date, 'channels': ranked_results})
+        self.channel_json = {channel['channel_id']: _to_json_bytes(channel) for channel in ranked_results}
+        self.groups_json = _to_json_bytes({'reference_date': reference_date, 'groups': group_stats})
+        self.rank_json = {} # (metric, limit) -> bytes, заполняется по запросу
+        self._lock = threading.Lock()
+
+    def get_ranks_json(self, metric, limit):
+        key = (metric, limit)
+        cached = self.rank_json.get(key)
+        if cached is not None:
+            return cached
+        rank_key = f'rank_{metric}'
+        ranked = [channel for channel in self.ranked_results if channel.get(rank_key) is not None]
+        ranked.sort(key=lambda channel: channel[rank_key])
+        payload = {
+            'metric': metric,
+            'reference_date': self.reference_date,
+            'ranks': [{'rank': channel[rank_key], 'channel_id': channel['channel_id'],
+                       'channel_name': channel.get('channel_name'), 'value': channel.get(metric)}
+                      for channel in ranked[:limit]],
+        }
+        body = _to_json_bytes(payload)
+        with self._lock:
+            self.rank_json[key] = body
+        return body
+
+class QueryCache:
+    """
+    Кэш результатов анализа, инвалидируемый по версии данных БД.
+    Пересчет выполняется в фоне, пока отдается предыдущая версия.
+    """
+
+    def __init__(self, db_name, channels_files, windows, configured_reference_date):
+        self.db_name = db_name
+        self.channels_files = channels_files
+        self.windows = windows
+        self.configured_reference_date = configured_reference_date
+        self.window_metrics = window_engine.get_window_metric_names(windows)
+
+        self._version_conn = database.connect_db_readonly(db_name, check_same_thread=False)
+        if not self._version_conn:
+            raise RuntimeError(f"Could not open database '{db_name}' in read-only mode")
+        self._version_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._snapshot = None
+        self._refreshing = False
+        self._read_pool = queue.Queue() # [соединение, версия данных, для которой подключены партиции]
+        for _ in range(READ_POOL_SIZE):
+            conn = database.connect_db_readonly(db_name, check_same_thread=False)
+            if not conn:
+                raise RuntimeError(f"Could not open database '{db_name}' in read-only mode")
+            self._read_pool.put([conn, None])
+        self._leaderboards = OrderedDict() # (version, kind, metric, days, limit, channel_id) -> bytes, порядок - LRU
+        self._leaderboards_lock = threading.Lock()
+
+    def data_version(self):
+        """
+        Текущая версия данных: PRAGMA data_version (меняется при фиксации транзакций другими
+        соединениями) плюс опорная дата (если не задана в конфигурации, меняется в полночь).
+        """
+        with self._version_lock:
+            version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        return (version, window_engine.get_reference_date(self.configured_reference_date))
+
+    @contextmanager
+    def _read_conn(self, version):
+        """
+        Берет соединение из пула на время запроса (ждет, если все заняты). При смене версии данных
+        подключает партиции, созданные задачей уплотнения (storage.py) после открытия соединения.
+        """
+        entry = self._read_pool.get()
+        try:
+            if entry[1] != version:
+                database.attach_partitions(entry[0], readonly=True)
+                entry[1] = version
+            yield entry[0]
+        finally:
+            self._read_pool.put(entry)
+
+    def _build_snapshot(self, version):
+        started = time.perf_counter()
+        conn = database.connect_db_readonly(self.db_name)
+        if not conn:
+            return None
+        try:
+            reference_date = version[1]
+            # Handle разрешаются только из кэша (соединение только для чтения, без вызовов API)
+            channel_list = channel_sources.load_channel_list(self.channels_files, conn, resolve=False)
+            channel_ids = channel_list.ids or database.get_all_channel_ids(conn)
+            all_results = []
+            channels_db_info = database.get_channels_db_info(conn, channel_ids)
+            for channel_id in channel_ids:
+                channel_results = pipeline.init_channel_results(channel_id, channel_list.groups.get(channel_id))
+                pipeline.load_channel_db_info(conn, channel_results, channels_db_info.get(channel_id))
+                if not channel_results['channel_name']: channel_results['channel_name'] = f"Unknown (ID: {channel_id})"
+                pipeline.analyze_channel(conn, channel_results, reference_date, self.windows)
+                all_results.append(channel_results)
+            ranked_results = analyzer.calculate_ranks(all_results, extra_metrics=self.window_metrics)
+            group_stats = pipeline.calculate_group_stats(ranked_results, self.window_metrics)
+            snapshot = AnalysisSnapshot(version, reference_date, ranked_results, group_stats)
+        finally:
+            conn.close()
+        print(f"DEBUG Server: Analysis snapshot rebuilt for data version {version[0]} ({len(ranked_results)} channels) in {time.perf_counter() - started:.2f}s.")
+        return snapshot
+
+    def _refresh_in_background(self, version):
+        try:
+            snapshot = self._build_snapshot(version)
+            if snapshot:
+                self._snapshot = snapshot
+        except Exception as e:
+            print(f"ERROR Server: Background snapshot rebuild failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def get_snapshot(self):
+        """
+        Возвращает (snapshot, stale). Первый запрос строит снимок синхронно; дальше при смене
+        версии данных запускается фоновый пересчет, а запрос получает предыдущий снимок.
+        """
+        version = self.data_version()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._build_lock:
+                if self._snapshot is None:
+                    self._snapshot = self._build_snapshot(version)
+            return self._snapshot, False
+        if snapshot.version == version:
+            return snapshot, False
+        with self._build_lock:
+            if not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_in_background, args=(version,), daemon=True).start()
+        return snapshot, True
+
+    def get_leaderboard_json(self, kind, metric, days, limit, channel_id=None):
+        """Топ видео (kind='videos') или каналов (kind='channels') в JSON, с кэшем по версии данных."""
+        version = self.data_version()
+        key = (version, kind, metric, days, limit, channel_id)
+        with self._leaderboards_lock:
+            cached = self._leaderboards.get(key)
+            if cached is not None:
+                self._leaderboards.move_to_end(key)
+                return cached
+        reference_ts = window_engine.get_reference_timestamp(version[1])
+        with self._read_conn(version) as conn:
+            if kind == 'videos':
+                rows = leaderboard.top_videos(conn, metric, limit, days, channel_id, reference_ts)
+            else:
+                rows = leaderboard.top_channels(conn, metric, limit, days, reference_ts)
+        body = _to_json_bytes({'metric': metric, 'days': days, 'channel_id': channel_id, kind: rows})
+        with self._leaderboards_lock:
+            self._leaderboards[key] = body
+            self._leaderboards.move_to_end(key)
+            while len(self._leaderboards) > LEADERBOARD_CACHE_SIZE:
+                self._leaderboards.popitem(last=False) # Вытесняется давно не запрашивавшийся топ
+        return body
+
+def _parse_limit(params, default=100):
+    limit = int(params.get('limit', [default])[0])
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    cache = None # Устанавливается в run_server()
+
+    def _send(self, status, body, stale=False, version=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if version is not None:
+            self.send_header('X-Data-Version', str(version))
+        self.send_header('X-Stale', '1' if stale else '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, _to_json_bytes({'error': message}))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip('/') or '/'
+        params = parse_qs(url.query)
+        try:
+            if path == '/health':
+                snapshot = self.cache._snapshot
+                payload = {'status': 'ok', 'data_version': self.cache.data_version()[0],
+                           'snapshot_version': snapshot.version[0] if snapshot else None,
+                           'snapshot_built_at': snapshot.built_at if snapshot else None}
+                self._send(200, _to_json_bytes(payload))
+                return
+            if path in ('/top-videos', '/top-channels'):
+                metric = params.get('metric', ['views'])[0]
+                days = int(params.get('days', [0])[0])
+                if path == '/top-videos':
+                    channel_id = params.get('channel_id', [None])[0]
+                    body = self.cache.get_leaderboard_json('videos', metric, days, _parse_limit(params, 10), channel_id)
+                else:
+                    body = self.cache.get_leaderboard_json('channels', metric, days, _parse_limit(params, 10))
+                self._send(200, body)
+                return
+
+            snapshot, stale = self.cache.get_snapshot()
+            if snapshot is None:
+                self._send_error(503, "Analysis snapshot is not available")
+                return
+            if path == '/channels':
+                self._send(200, snapshot.channels_json, stale, snapshot.version[0])
+            elif path.startswith('/channels/'):
+                body = snapshot.channel_json.get(path[len('/channels/'):])
+                if body is None:
+                    self._send_error(404, "Channel not found")
+                else:
+                    self._send(200, body, stale, snapshot.version[0])
+            elif path == '/ranks':
+                metric = params.get('metric', ['avg_views'])[0]
+                self._send(200, snapshot.get_ranks_json(metric, _parse_limit(params)), stale, snapshot.version[0])
+            elif path == '/groups':
+                self._send(200, snapshot.groups_json, stale, snapshot.version[0])
+            else:
+                self._send_error(404, "Unknown endpoint")
+        except ValueError as e:
+            self._send_error(400, str(e))
+        except Exception as e:
+            print(f"ERROR Server: Failed to handle request '{self.path}': {e}")
+            self._send_error(500, "Internal server error")
+
+    def log_message(self, format, *args):
+        pass # Логирование каждого запроса отключено ради задержки; ошибки печатаются в do_GET
+
+def run_server(host=None, port=None):
+    """Запускает HTTP-сервер с параметрами из секции [SERVER] конфигурации."""
+    host = host or app_config.SERVER_HOST
+    port = port or app_config.SERVER_PORT
+    QueryRequestHandler.cache = QueryCache(app_config.DATABASE_NAME, app_config.CHANNELS_FILES,
+                                           app_config.ANALYSIS_WINDOWS, app_config.REFERENCE_DATE)
+    server = ThreadingHTTPServer((host, port), QueryRequestHandler)
+    server.daemon_threads = True
+    print(f"--- YouTube Channel Analyzer - Query Server on http://{host}:{port} ---")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDEBUG Server: Interrupted, shutting down.")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    run_server()
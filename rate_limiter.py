@@ -0,0 +1,166 @@
+# rate_limiter.py
+"""
+Ограничение частоты запросов к YouTube Data API на стороне клиента (token bucket).
+
+Кроме дневной квоты у API есть лимиты частоты (в секунду / на пользователя): при всплесках запросов
+API отвечает 403 rateLimitExceeded / userRateLimitExceeded или 429, и такие вызовы пропадают зря.
+Все вызовы API (channels.list, playlistItems.list, videos.list) синхронного и асинхронного клиентов
+проходят через один общий RateLimiter:
+  * корзина токенов на каждый ключ API (REQUESTS_PER_SEC, емкость BURST) и, при необходимости,
+    отдельные корзины эндпоинтов этого ключа (ENDPOINT_LIMITS);
+  * токен резервируется под блокировкой (threading.Lock), а ожидание выполняется вне ее:
+    time.sleep в потоках, asyncio.sleep в задачах asyncio - цикл событий не блокируется;
+  * адаптация: после ошибки лимита скорость ключа снижается вдвое (не ниже MIN_RATE_FACTOR от
+    заданной), а корзина опустошается; пока ошибок нет, скорость каждые RECOVERY_INTERVAL_SEC
+    секунд увеличивается в RECOVERY_FACTOR раз до заданной;
+  * статистика (время ожидания, число ошибок лимита и повторов) выводится в сводке запуска.
+
+Настройки - секция [RATE_LIMIT] config.ini.
+"""
+import asyncio
+import threading
+import time
+import config_loader as app_config
+
+BACKOFF_FACTOR = 0.5 # Множитель скорости после ошибки лимита
+MIN_RATE_FACTOR = 0.05 # Нижняя граница скорости (доля от заданной)
+RECOVERY_FACTOR = 1.25 # Множитель восстановления скорости
+RECOVERY_INTERVAL_SEC = 2.0 # Период восстановления скорости без ошибок лимита
+BACKOFF_COOLDOWN_SEC = 1.0 # Ошибки одного всплеска (в пределах этого времени) снижают скорость один раз
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+def is_rate_limit_error(status, content):
+    """Проверяет, что ответ API с ошибкой означает превышение лимита частоты (а не дневной квоты)."""
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+    return any(reason in str(content) for reason in RATE_LIMIT_REASONS)
+
+class TokenBucket:
+    """Корзина токенов. Не потокобезопасна сама по себе: вызывается под блокировкой RateLimiter."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def reserve(self, now, rate_factor=1.0):
+        """
+        Резервирует один токен и возвращает, сколько секунд нужно подождать до его появления.
+        Баланс может уйти в минус: это очередь уже зарезервированных запросов.
+        """
+        rate = self.rate * rate_factor
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / rate if self.tokens < 0 else 0.0
+
+    def drain(self, now):
+        """Опустошает корзину (после ошибки лимита запросы не отправляются пачкой)."""
+        self.tokens = min(self.tokens, 0.0)
+        self.updated = now
+
+class RateLimiter:
+    """Общий ограничитель частоты для всех ключей и эндпоинтов процесса."""
+
+    def __init__(self, requests_per_sec, burst, endpoint_limits=None, enabled=True):
+        self.requests_per_sec = requests_per_sec
+        self.burst = burst
+        self.endpoint_limits = endpoint_limits or {}
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.buckets = {} # (ключ API, эндпоинт или None) -> TokenBucket
+        self.rate_factors = {} # ключ API -> текущая доля заданной скорости
+        self.last_adjusted = {} # ключ API -> время последнего изменения скорости
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Обнуляет статистику ожиданий и ошибок лимита (например, в процессе-воркере после fork)."""
+        self.stats = {'requests': 0, 'waits': 0, 'wait_sec': 0.0, 'rate_limited': 0, 'retries': 0}
+
+    def _get_bucket(self, api_key, endpoint):
+        bucket = self.buckets.get((api_key, endpoint))
+        if bucket is None:
+            if endpoint is None:
+                bucket = TokenBucket(self.requests_per_sec, self.burst)
+            else:
+                rate = self.endpoint_limits[endpoint]
+                bucket = TokenBucket(rate, max(1, min(self.burst, int(rate))))
+            self.buckets[(api_key, endpoint)] = bucket
+        return bucket
+
+    def _reserve(self, api_key, endpoint):
+        """Резервирует токены ключа и эндпоинта и возвращает время ожидания в секундах."""
+        if not self.enabled:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            factor = self.rate_factors.get(api_key, 1.0)
+            delay = self._get_bucket(api_key, None).reserve(now, factor)
+            if endpoint in self.endpoint_limits:
+                delay = max(delay, self._get_bucket(api_key, endpoint).reserve(now, factor))
+            self.stats['requests'] += 1
+            if delay > 0:
+                self.stats['waits'] += 1
+                self.stats['wait_sec'] += delay
+            return delay
+
+    def acquire(self, api_key, endpoint):
+        """Ждет (в текущем потоке) разрешения на запрос к эндпоинту с ключом api_key."""
+        delay = self._reserve(api_key, endpoint)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, api_key, endpoint):
+        """Асинхронный вариант acquire: ожидание не блокирует цикл событий."""
+        delay = self._reserve(api_key, endpoint)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def report_rate_limited(self, api_key, will_retry=False):
+        """Учитывает ошибку лимита частоты: снижает скорость ключа и опустошает его корзины."""
+        with self.lock:
+            now = time.monotonic()
+            factor = self.rate_factors.get(api_key, 1.0)
+            if factor == 1.0 or now - self.last_adjusted[api_key] >= BACKOFF_COOLDOWN_SEC:
+                factor = max(MIN_RATE_FACTOR, factor * BACKOFF_FACTOR)
+                self.rate_factors[api_key] = factor
+                self.last_adjusted[api_key] = now
+            for (bucket_key, _), bucket in self.buckets.items():
+                if bucket_key == api_key:
+                    bucket.drain(now)
+            self.stats['rate_limited'] += 1
+            if will_retry:
+                self.stats['retries'] += 1
+        print(f"WARNING Rate limit: API rate limit hit for key {api_key[:4]}..., slowing down to "
+              f"{self.requests_per_sec * factor:.2f} req/s.")
+
+    def report_success(self, api_key):
+        """Учитывает успешный запрос: постепенно возвращает скорость ключа к заданной."""
+        factor = self.rate_factors.get(api_key)
+        if factor is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            factor = self.rate_factors.get(api_key)
+            if factor is None or now - self.last_adjusted[api_key] < RECOVERY_INTERVAL_SEC:
+                return
+            factor *= RECOVERY_FACTOR
+            self.last_adjusted[api_key] = now
+            if factor >= 1.0:
+                del self.rate_factors[api_key]
+            else:
+                self.rate_factors[api_key] = factor
+
+    def summary(self):
+        """Строка сводки для вывода в конце запуска."""
+        stats = self.stats
+        return (f"{stats['requests']} requests, {stats['waits']} waited {stats['wait_sec']:.1f}s in total, "
+                f"{stats['rate_limited']} rate-limit errors ({stats['retries']} retried)")
+
+limiter = RateLimiter(app_config.RATE_LIMIT_REQUESTS_PER_SEC, app_config.RATE_LIMIT_BURST,
+                      app_config.RATE_LIMIT_ENDPOINT_LIMITS, app_config.RATE_LIMIT_ENABLED)
@@ -0,0 +1,266 @@
+# report.py
+"""
+Итоговый отчет main.py: таблица каналов с метриками и рангами и агрегаты групп.
+
+При десятках тысяч каналов построение всей таблицы сразу (форматирование каждой ячейки цепочкой
+if/elif и одна таблица tabulate "grid") занимает секунды и мегабайты вывода. Здесь:
+  * форматтер каждой колонки выбирается один раз (compile_columns), строка - это один проход
+    по списку (ключ, форматтер);
+  * отбор каналов: условия по колонкам рангов (FILTER), сортировка по любой колонке ранга (SORT_BY),
+    top-N через heapq.nsmallest без полной сортировки;
+  * таблица выводится постранично (PAGE_SIZE / PAGE): форматируются и передаются в tabulate только
+    строки страницы, а формат 'stream' пишет строки с фиксированной шириной колонок пачками, без tabulate;
+  * CSV и JSON Lines (сырые значения метрик и рангов) записываются в файлы построчно.
+Ранги и метрики каналов не меняются: отчет только читает ranked_results.
+
+Настройки - секция [REPORT] config.ini.
+"""
+import csv
+import heapq
+import json
+import math
+import operator
+import os
+import sys
+from datetime import date
+import analyzer
+import config_loader as app_config
+
+try:
+    from tabulate import tabulate
+except ImportError:
+    tabulate = None
+
+STREAM_FLUSH_ROWS = 1000 # Строк в одной записи в stdout для формата 'stream'
+FILTER_OPERATORS = {'<=': operator.le, '>=': operator.ge, '<': operator.lt, '>': operator.gt, '=': operator.eq}
+IDENTITY_FIELDS = ['channel_id', 'channel_name', 'groups', 'date_added'] # Поля CSV / JSONL перед метриками
+
+# --- Форматтеры значений (None обрабатывается в compile_columns) ---
+
+def _format_raw(value):
+    return value
+
+def _format_int(value):
+    return f"{value:,}"
+
+def _format_subscribers(value):
+    return f"{value:,}" if isinstance(value, int) else 'Hidden'
+
+def _format_rate(value):
+    return f"{value:.2f}"
+
+def _format_trend(value):
+    return "+Inf%" if value == float('inf') else f"{(value - 1) * 100:+.1f}%"
+
+def _format_date(value):
+    return value.isoformat() if isinstance(value, date) else str(value)
+
+def _format_number(value):
+    return f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+
+# Колонки таблицы каналов: (заголовок, ключ channel_results, форматтер, ширина для 'stream', выравнивание)
+COLUMNS = [
+    ("Rank(Views)", 'rank_avg_views', _format_raw, 11, '>'),
+    ("Channel Name", 'channel_name', str, 24, '<'),
+    ("Subs", 'subscriber_count', _format_subscribers, 13, '>'),
+    ("Rank", 'rank_subscriber_count', _format_raw, 6, '>'),
+    ("Videos(30d)", 'videos_last_30d_count', _format_int, 11, '>'),
+    ("Rank", 'rank_videos_last_30d_count', _format_raw, 6, '>'),
+    ("Avg ER(%)", 'avg_engagement_rate', _format_rate, 9, '>'),
+    ("Rank", 'rank_avg_engagement_rate', _format_raw, 6, '>'),
+    ("Avg Views/Vid(30d)", 'avg_views_per_video_30d', _format_int, 18, '>'),
+    ("Rank", 'rank_avg_views_per_video_30d', _format_raw, 6, '>'),
+    ("Avg Dur(30d)", 'avg_duration_sec_30d', analyzer.format_duration, 12, '>'),
+    ("Rank", 'rank_avg_duration_sec_30d', _format_raw, 6, '>'),
+    ("Trend(%)", 'view_trend_ratio', _format_trend, 9, '>'),
+    ("Rank", 'rank_view_trend_ratio', _format_raw, 6, '>'),
+    ("Date Added", 'date_added', _format_date, 10, '<'),
+    ("Obs. Videos", 'observed_videos_count', _format_int, 11, '>'),
+]
+GROUP_STATS_HEADERS = ["Metric", "Min", "Avg", "Max", "Channels"]
+
+def get_rank_columns(window_metrics):
+    """Колонки рангов, доступные для сортировки и фильтра: rank_<метрика>."""
+    return [f'rank_{metric}' for metric in analyzer.get_rank_metrics(window_metrics)]
+
+def get_columns(sort_by):
+    """Колонки таблицы: колонка сортировки, если ее нет среди стандартных, добавляется первой."""
+    if any(key == sort_by for _, key, _, _, _ in COLUMNS):
+        return COLUMNS
+    return [(f"Rank({sort_by[len('rank_'):]})", sort_by, _format_raw, max(6, len(sort_by)), '>')] + COLUMNS
+
+def compile_columns(columns):
+    """
+    Возвращает [(ключ, форматтер)], где форматтер уже обрабатывает None ("N/A"):
+    в цикле по строкам не остается проверок типа колонки.
+    """
+    def with_na(formatter):
+        return lambda value: "N/A" if value is None else formatter(value)
+    return [(key, with_na(formatter)) for _, key, formatter, _, _ in columns]
+
+def iter_rows(channels, compiled_columns):
+    """Лениво форматирует строки таблицы."""
+    for channel in channels:
+        yield [formatter(channel.get(key)) for key, formatter in compiled_columns]
+
+def _sort_key(column):
+    # Каналы без ранга по колонке (нет данных) - в конце
+    return lambda channel: (channel.get(column) is None, channel.get(column) or 0)
+
+def select_channels(ranked_results, sort_by, filters=None, top_n=0):
+    """
+    Отбирает каналы для отчета: условия filters [(колонка ранга, оператор, число)], сортировка по
+    колонке ранга sort_by (по возрастанию ранга, каналы без ранга - в конце), первые top_n (0 - все).
+    Исходный список не меняется.
+
+    Returns:
+        list: Каналы (те же словари) в порядке отчета.
+    """
+    channels = ranked_results
+    for column, op, threshold in filters or []:
+        compare = FILTER_OPERATORS[op]
+        channels = [channel for channel in channels if channel.get(column) is not None and compare(channel[column], threshold)]
+    if top_n:
+        return heapq.nsmallest(top_n, channels, key=_sort_key(sort_by)) # Как sorted(...)[:top_n], но O(n log top_n)
+    return sorted(channels, key=_sort_key(sort_by))
+
+def _stream_format(columns):
+    """Шаблон строки с фиксированной шириной колонок (не уже заголовка; длинные значения обрезаются)."""
+    return " | ".join(f"{{:{align}{width}.{width}}}" for width, align in columns)
+
+def get_pages(total_rows, page_size=0, page=0):
+    """
+    Страницы для вывода: [(номер страницы, первая строка, конец)] (строки с 0, конец не включается).
+    page_size = 0 - одна страница, page = 0 - все страницы; номер вне диапазона дает пустой список.
+    """
+    page_size = page_size or max(total_rows, 1)
+    page_count = max(1, math.ceil(total_rows / page_size))
+    pages = [(index + 1, index * page_size, min(total_rows, (index + 1) * page_size)) for index in range(page_count)]
+    return pages if not page else pages[page - 1:page]
+
+def print_page(rows, headers, table_format='grid', columns=None, colalign=None, out=None):
+    """
+    Выводит одну страницу таблицы.
+
+    Args:
+        rows (iterable): Отформатированные строки (например, iter_rows).
+        headers (list): Заголовки колонок.
+        table_format (str): Формат tabulate, 'stream' - фиксированная ширина колонок без tabulate
+                            (строки пишутся в stdout пачками по STREAM_FLUSH_ROWS), 'none' - не выводить.
+        columns (list, optional): Описания колонок (ширина и выравнивание для 'stream').
+        colalign (tuple, optional): Выравнивание колонок для tabulate (по умолчанию - числа вправо, строки влево).
+    """
+    out = out or sys.stdout
+    if table_format == 'none':
+        return
+    if table_format != 'stream' and tabulate is not None:
+        print(tabulate(list(rows), headers=headers, tablefmt=table_format, numalign="right", stralign="left", colalign=colalign), file=out)
+        return
+    # 'stream' (или нет tabulate): построчный вывод без расчета ширины по всем строкам
+    columns = columns or [(header, None, None, 8, '<') for header in headers]
+    widths = [(max(width, len(header)), align) for header, (_, _, _, width, align) in zip(headers, columns)]
+    row_format = _stream_format(widths)
+    lines = [row_format.format(*headers), "-+-".join("-" * width for width, _ in widths)]
+    for row in rows:
+        lines.append(row_format.format(*map(str, row)))
+        if len(lines) >= STREAM_FLUSH_ROWS:
+            out.write("\n".join(lines) + "\n")
+            lines = []
+    if lines:
+        out.write("\n".join(lines) + "\n")
+
+def get_export_fields(window_metrics):
+    """Поля CSV / JSON Lines: идентификация канала, затем каждая метрика ранжирования и ее ранг."""
+    return IDENTITY_FIELDS + [field for metric in analyzer.get_rank_metrics(window_metrics) for field in (metric, f'rank_{metric}')]
+
+def _plain_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None # JSON не поддерживает Infinity
+    return value
+
+def _open_output(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return open(path, 'w', newline='', encoding='utf-8')
+
+def write_csv(path, channels, fields):
+    """Записывает каналы в CSV построчно (сырые значения; inf записывается как 'inf'). Возвращает число строк."""
+    count = 0
+    with _open_output(path) as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for channel in channels:
+            writer.writerow(['' if value is None else value.isoformat() if isinstance(value, date) else value
+                             for value in (channel.get(field) for field in fields)])
+            count += 1
+    return count
+
+def write_jsonl(path, channels, fields):
+    """Записывает каналы в JSON Lines построчно (сырые значения; нечисловые inf/nan - null). Возвращает число строк."""
+    count = 0
+    with _open_output(path) as f:
+        for channel in channels:
+            f.write(json.dumps({field: _plain_value(channel.get(field)) for field in fields}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def _validate_rank_column(column, rank_columns, what):
+    if column in rank_columns:
+        return True
+    print(f"ERROR Report: Unknown rank column '{column}' in {what}. Available: {', '.join(rank_columns)}")
+    return False
+
+def print_channels_report(ranked_results, window_metrics):
+    """
+    Выводит итоговую таблицу каналов и записывает CSV / JSON Lines по настройкам секции [REPORT].
+
+    Returns:
+        list: Каналы отчета в порядке вывода.
+    """
+    rank_columns = get_rank_columns(window_metrics)
+    sort_by = app_config.REPORT_SORT_BY
+    if not _validate_rank_column(sort_by, rank_columns, 'SORT_BY'):
+        sort_by = app_config.DEFAULT_REPORT_SORT_BY
+    filters = [condition for condition in app_config.REPORT_FILTER if _validate_rank_column(condition[0], rank_columns, 'FILTER')]
+
+    channels = select_channels(ranked_results, sort_by, filters, app_config.REPORT_TOP_N)
+    if len(channels) != len(ranked_results):
+        print(f"DEBUG Report: {len(channels)} of {len(ranked_results)} channels selected (sort: {sort_by}, "
+              f"filter: {filters or 'none'}, top: {app_config.REPORT_TOP_N or 'all'}).")
+    if not channels:
+        print("No channels match the report filter.")
+    else:
+        columns = get_columns(sort_by)
+        headers, compiled_columns = [column[0] for column in columns], compile_columns(columns)
+        pages = get_pages(len(channels), app_config.REPORT_PAGE_SIZE, app_config.REPORT_PAGE)
+        if not pages:
+            print(f"No rows on page {app_config.REPORT_PAGE} (total pages: {len(get_pages(len(channels), app_config.REPORT_PAGE_SIZE))}).")
+        for page_index, start, end in pages:
+            if app_config.REPORT_PAGE_SIZE and app_config.REPORT_TABLE_FORMAT != 'none':
+                print(f"--- Page {page_index}/{math.ceil(len(channels) / app_config.REPORT_PAGE_SIZE)} (rows {start + 1}-{end} of {len(channels)}) ---")
+            # Форматируются только строки выводимой страницы
+            print_page(iter_rows(channels[start:end], compiled_columns), headers, app_config.REPORT_TABLE_FORMAT, columns)
+
+    fields = get_export_fields(window_metrics)
+    if app_config.REPORT_CSV_FILE:
+        print(f"DEBUG Report: {write_csv(app_config.REPORT_CSV_FILE, channels, fields)} rows written to {app_config.REPORT_CSV_FILE}.")
+    if app_config.REPORT_JSONL_FILE:
+        print(f"DEBUG Report: {write_jsonl(app_config.REPORT_JSONL_FILE, channels, fields)} rows written to {app_config.REPORT_JSONL_FILE}.")
+    return channels
+
+def format_group_stats(group_stats):
+    """Строки таблицы агрегатов группы: метрика, min, avg, max, число каналов."""
+    compiled = compile_columns([(None, key, _format_number, None, None) for key in ('min', 'avg', 'max')])
+    return [[metric] + [formatter(stats.get(key)) for key, formatter in compiled] + [stats.get('count', 0)]
+            for metric, stats in group_stats.items()]
+
+def print_group_stats(group_stats):
+    """Выводит агрегаты группы таблицей (формат - TABLE_FORMAT, 'none' - как 'stream')."""
+    rows = format_group_stats(group_stats)
+    table_format = 'stream' if app_config.REPORT_TABLE_FORMAT == 'none' else app_config.REPORT_TABLE_FORMAT
+    columns = [("Metric", None, None, max([len(row[0]) for row in rows] + [6]), '<')] + \
+              [(header, None, None, 16, '>') for header in GROUP_STATS_HEADERS[1:]]
+    print_page(rows, GROUP_STATS_HEADERS, table_format, columns, colalign=("left",) + ("right",) * (len(GROUP_STATS_HEADERS) - 1))
@@ -0,0 +1,274 @@
+# scheduler.py
+"""
+Режим демона: непрерывное обновление каналов из API с приоритетной очередью.
+
+В отличие от разового запуска main.py (cron), демон держит открытыми сервис API и соединение с БД
+и обновляет каналы не по порядку файла, а по приоритету:
+  * канал, который еще ни разу не обновлялся, обновляется первым;
+  * срок следующего обновления = channels.last_fetched + интервал, где интервал тем короче,
+    чем чаще канал публикует видео (по числу видео за последние 30 дней),
+    в пределах [MIN_REFRESH_HOURS, MAX_REFRESH_HOURS];
+  * при равных сроках первым идет канал с большей частотой публикаций.
+
+Обновления выполняются в пределах суточного бюджета квоты (DAILY_QUOTA); расход за текущие сутки
+квоты хранится в БД (таблица daemon_quota_usage), поэтому перезапуск демона не тратит бюджет повторно.
+В бюджет входит и разрешение новых handle из файла каналов.
+После исчерпания бюджета демон ждет сброса квоты. Изменения файла
+каналов подхватываются без перезапуска (проверка времени изменения файлов каждые POLL_INTERVAL_SEC).
+
+Запуск: python scheduler.py (остановка - Ctrl+C).
+"""
+import os
+import sys
+import time
+import math
+import heapq
+from datetime import datetime, timedelta, timezone
+import youtube_api
+import database
+import pipeline
+import rate_limiter
+import channel_sources
+import config_loader as app_config
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles') # Квота YouTube Data API сбрасывается в полночь PT
+except Exception:
+    QUOTA_TIMEZONE = timezone.utc
+
+SECONDS_PER_HOUR = 3600
+UPLOAD_FREQUENCY_DAYS = 30 # Период, по которому оценивается частота публикаций
+DEFAULT_CHANNEL_COST = 3 # Оценка стоимости обновления канала до первого фактического замера
+
+def compute_refresh_interval(recent_uploads, min_hours, max_hours):
+    """
+    Интервал обновления канала (в секундах) по числу видео за последние UPLOAD_FREQUENCY_DAYS дней.
+    Канал обновляется примерно дважды между публикациями, но не чаще min_hours и не реже max_hours.
+    """
+    if not recent_uploads:
+        return max_hours * SECONDS_PER_HOUR
+    hours_between_uploads = UPLOAD_FREQUENCY_DAYS * 24 / recent_uploads
+    hours = min(max(hours_between_uploads / 2, min_hours), max_hours)
+    return hours * SECONDS_PER_HOUR
+
+def get_quota_day(now_ts):
+    """Текущие 'сутки квоты' (дата в часовом поясе сброса квоты)."""
+    return datetime.fromtimestamp(now_ts, tz=QUOTA_TIMEZONE).date()
+
+def seconds_until_quota_reset(now_ts):
+    """Количество секунд до следующего сброса суточной квоты."""
+    now = datetime.fromtimestamp(now_ts, tz=QUOTA_TIMEZONE)
+    next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=QUOTA_TIMEZONE)
+    return max((next_midnight - now).total_seconds(), 1)
+
+class RefreshScheduler:
+    """Приоритетная очередь обновления каналов (min-heap по сроку следующего обновления)."""
+
+    def __init__(self, conn, channels_files, max_videos, daily_quota, min_hours, max_hours, poll_interval):
+        self.conn = conn
+        self.channels_files = [channels_files] if isinstance(channels_files, str) else list(channels_files)
+        self.max_videos = max_videos
+        self.daily_quota = daily_quota
+        self.min_hours = min_hours
+        self.max_hours = max_hours
+        self.poll_interval = poll_interval
+
+        self.heap = [] # (due_ts, -recent_uploads, channel_id)
+        self.due = {} # channel_id -> актуальный due_ts (устаревшие записи кучи пропускаются)
+        self.channels = set()
+        self.channels_mtime = None
+        self.resolve_pending = False # В списке есть handle, не разрешенные из-за исчерпания бюджета квоты
+        self.partitions_mtime = self._get_partitions_mtime() # Партиции подключены при открытии соединения
+        self.channel_costs = {} # channel_id -> фактическая стоимость последнего обновления (единицы квоты)
+
+        self.quota_day = None
+        self.quota_used_today = 0
+        self.quota_exhausted = False # Сообщение об исчерпании бюджета уже выведено (до сброса квоты)
+        self.refreshed_count = 0
+        self.failed_count = 0
+
+    def _push(self, channel_id, due_ts, recent_uploads):
+        self.due[channel_id] = due_ts
+        heapq.heappush(self.heap, (due_ts, -(recent_uploads or 0), channel_id))
+
+    def reload_channels_if_changed(self):
+        """Перечитывает файлы каналов, если они изменились: новые каналы ставятся в очередь, удаленные исключаются."""
+        try:
+            mtime = tuple(os.stat(filename).st_mtime for filename in self.channels_files)
+        except OSError:
+            if self.channels_mtime is not None:
+                print(f"WARNING Scheduler: Channels file(s) '{', '.join(self.channels_files)}' not accessible. Keeping current list.")
+                self.channels_mtime = None
+            return
+        if mtime == self.channels_mtime:
+            return
+        self.channels_mtime = mtime
+
+        # Разрешение новых handle через API расходует квоту демона; после исчерпания бюджета -
+        # только кэш, неразрешенные handle перечитываются после сброса квоты (_roll_quota_day)
+        resolve = self.quota_used_today < self.daily_quota
+        units_before = youtube_api.get_quota_units_used()
+        channel_list = channel_sources.load_channel_list(self.channels_files, self.conn, resolve=resolve)
+        cost = youtube_api.get_quota_units_used() - units_before
+        if cost:
+            self.quota_used_today += cost
+            database.save_quota_usage(self.conn, self.quota_day.isoformat(), self.quota_used_today)
+        self.resolve_pending = not resolve and channel_list.stats['unresolved'] > 0
+        channel_ids = set(channel_list.ids)
+        added = channel_ids - self.channels
+        removed = self.channels - channel_ids
+        self.channels = channel_ids
+        for channel_id in removed:
+            self.due.pop(channel_id, None)
+
+        if added:
+            now_ts = time.time()
+            since_ts = int(now_ts - UPLOAD_FREQUENCY_DAYS * 24 * SECONDS_PER_HOUR)
+            refresh_state = database.get_channels_refresh_state(self.conn, since_ts)
+            for channel_id in added:
+                last_fetched, recent_uploads = refresh_state.get(channel_id, (None, 0))
+                if last_fetched is None:
+                    due_ts = 0 # Никогда не обновлялся - максимальный приоритет
+                else:
+                    due_ts = last_fetched + compute_refresh_interval(recent_uploads, self.min_hours, self.max_hours)
+                self._push(channel_id, due_ts, recent_uploads)
+        print(f"DEBUG Scheduler: Channels list loaded: {len(self.channels)} channels (+{len(added)}, -{len(removed)}).")
+
+    @staticmethod
+    def _get_partitions_mtime():
+        try:
+            return os.stat(app_config.STORAGE_PARTITION_DIR).st_mtime
+        except OSError:
+            return None
+
+    def reload_partitions_if_changed(self):
+        """Подключает новые файлы партиций (задача уплотнения storage.py работает в другом процессе)."""
+        mtime = self._get_partitions_mtime()
+        if mtime != self.partitions_mtime:
+            self.partitions_mtime = mtime
+            schemas = database.attach_partitions(self.conn)
+            print(f"DEBUG Scheduler: Partitions directory changed, {len(schemas)} partitions attached.")
+
+    def _roll_quota_day(self, now_ts):
+        quota_day = get_quota_day(now_ts)
+        if quota_day != self.quota_day:
+            if self.quota_day is not None:
+                print(f"DEBUG Scheduler: Quota day {self.quota_day} finished, used {self.quota_used_today}/{self.daily_quota} units.")
+            self.quota_day = quota_day
+            # Расход за текущие сутки мог быть сохранен до перезапуска демона
+            self.quota_used_today = database.get_quota_usage(self.conn, quota_day.isoformat())
+            self.quota_exhausted = False
+            if self.resolve_pending:
+                self.channels_mtime = None # Перечитать файл каналов и разрешить отложенные handle
+            if self.quota_used_today:
+                print(f"DEBUG Scheduler: Quota day {quota_day}: {self.quota_used_today}/{self.daily_quota} units already used.")
+
+    def _estimate_cost(self, channel_id):
+        """Оценка стоимости обновления: фактическая стоимость прошлого обновления или оценка по лимиту видео."""
+        if channel_id in self.channel_costs:
+            return self.channel_costs[channel_id]
+        if self.max_videos:
+            # 1 вызов channels.list + страницы playlistItems.list + пакеты videos.list по 50 ID
+            return 1 + 2 * math.ceil(self.max_videos / 50)
+        return DEFAULT_CHANNEL_COST
+
+    def _peek_valid(self):
+        """Возвращает актуальную вершину кучи, отбрасывая устаревшие записи."""
+        while self.heap:
+            due_ts, _, channel_id = self.heap[0]
+            if channel_id in self.channels and self.due.get(channel_id) == due_ts:
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+    def refresh_channel(self, channel_id):
+        """Обновляет один канал и планирует его следующее обновление."""
+        units_before = youtube_api.get_quota_units_used()
+        fetched = pipeline.fetch_channel(self.conn, channel_id, self.max_videos)
+        cost = youtube_api.get_quota_units_used() - units_before
+        self.quota_used_today += cost
+        database.save_quota_usage(self.conn, self.quota_day.isoformat(), self.quota_used_today)
+        self.channel_costs[channel_id] = max(cost, 1)
+
+        now_ts = time.time()
+        if fetched is None:
+            self.failed_count += 1
+            # Повторная попытка не раньше минимального интервала
+            self._push(channel_id, now_ts + self.min_hours * SECONDS_PER_HOUR, 0)
+            return
+
+        self.refreshed_count += 1
+        since_ts = now_ts - UPLOAD_FREQUENCY_DAYS * 24 * SECONDS_PER_HOUR
+        recent_uploads = sum(1 for video in fetched['videos'] if video.published_ts is not None and video.published_ts >= since_ts)
+        interval = compute_refresh_interval(recent_uploads, self.min_hours, self.max_hours)
+        self._push(channel_id, now_ts + interval, recent_uploads)
+        save_stats = fetched['save_stats'] or {}
+        print(f"DEBUG Scheduler: Refreshed {channel_id} ({fetched['channel_name']}), cost {cost} units, "
+              f"videos {save_stats.get('inserted', 0)} new / {save_stats.get('changed', 0)} changed / {save_stats.get('unchanged', 0)} unchanged, "
+              f"{recent_uploads} uploads in {UPLOAD_FREQUENCY_DAYS}d, next refresh in {interval / SECONDS_PER_HOUR:.1f}h. "
+              f"Quota used today: {self.quota_used_today}/{self.daily_quota}.")
+
+    def run_once(self):
+        """
+        Один шаг цикла демона. Возвращает количество секунд, которое стоит подождать
+        перед следующим шагом (0 - можно продолжать сразу).
+        """
+        now_ts = time.time()
+        self._roll_quota_day(now_ts) # До перечитывания каналов: разрешение handle учитывается в сутках квоты
+        self.reload_channels_if_changed()
+        self.reload_partitions_if_changed()
+
+        top = self._peek_valid()
+        if top is None:
+            return self.poll_interval
+        due_ts, _, channel_id = top
+        if due_ts > now_ts:
+            return min(due_ts - now_ts, self.poll_interval)
+
+        if self.quota_used_today + self._estimate_cost(channel_id) > self.daily_quota:
+            wait = seconds_until_quota_reset(now_ts)
+            if not self.quota_exhausted:
+                print(f"DEBUG Scheduler: Daily quota budget reached ({self.quota_used_today}/{self.daily_quota}). Next reset in {wait / SECONDS_PER_HOUR:.1f}h.")
+                self.quota_exhausted = True
+            return min(wait, self.poll_interval) # Продолжаем следить за файлом каналов и партициями до сброса квоты
+
+        heapq.heappop(self.heap)
+        staleness = "never refreshed" if due_ts == 0 else f"overdue by {max(now_ts - due_ts, 0) / SECONDS_PER_HOUR:.1f}h"
+        print(f"\n=== Scheduler: Refreshing {channel_id} ({staleness}, queue: {len(self.due)}) ===")
+        self.refresh_channel(channel_id)
+        return 0
+
+    def run_forever(self):
+        while True:
+            wait = self.run_once()
+            if wait > 0:
+                time.sleep(wait)
+
+def run_daemon():
+    """Запускает демон с параметрами из секции [DAEMON] конфигурации."""
+    conn = database.connect_db()
+    if not conn:
+        sys.exit("ERROR: Could not connect to database. Exiting.")
+    database.create_tables(conn)
+    if not youtube_api.get_authenticated_service(): # Прогреваем сервис API один раз
+        conn.close()
+        sys.exit("ERROR: Could not initialize YouTube API service. Exiting.")
+
+    scheduler = RefreshScheduler(
+        conn, app_config.CHANNELS_FILES, app_config.MAX_VIDEOS_TO_FETCH_PER_CHANNEL,
+        app_config.DAEMON_DAILY_QUOTA, app_config.DAEMON_MIN_REFRESH_HOURS,
+        app_config.DAEMON_MAX_REFRESH_HOURS, app_config.DAEMON_POLL_INTERVAL_SEC)
+    print(f"--- YouTube Channel Analyzer - Daemon Mode (quota budget: {app_config.DAEMON_DAILY_QUOTA} units/day) ---")
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        print("\nDEBUG Scheduler: Interrupted, shutting down.")
+    finally:
+        print(f"DEBUG Scheduler: Refreshed {scheduler.refreshed_count} channels, {scheduler.failed_count} failed, "
+              f"quota used today: {scheduler.quota_used_today} units.")
+        print(f"DEBUG Scheduler: API rate limiter: {rate_limiter.limiter.summary()}.")
+        conn.close()
+        print("DEBUG DB: Database connection closed.")
+
+if __name__ == "__main__":
+    run_daemon()
@@ -0,0 +1,126 @@
+# sharded_fetch.py
+"""
+Шардированная загрузка данных из API в несколько процессов.
+
+Список каналов делится на N шардов (N = WORKERS, но не больше числа ключей API). Каждый шард
+обрабатывается отдельным процессом со СВОИМ ключом API из API_KEYS и своей промежуточной
+БД SQLite (staging/shard_<i>.db), поэтому процессы не делят ни GIL, ни httplib2, ни блокировку
+записи SQLite. После завершения всех воркеров шарды одним пакетным upsert на шард переносятся
+в основную БД, а анализ и ранжирование выполняются один раз по объединенным данным (main.py).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import youtube_api
+import database
+import pipeline
+import batch_fetch
+import rate_limiter
+import config_loader as app_config
+
+def split_into_shards(channel_ids, shard_count):
+    """Делит список каналов на shard_count шардов по кругу (равномерно по размеру)."""
+    shards = [[] for _ in range(shard_count)]
+    for i, channel_id in enumerate(channel_ids):
+        shards[i % shard_count].append(channel_id)
+    return [shard for shard in shards if shard]
+
+def get_worker_count(requested_workers, api_keys_count):
+    """Число воркеров: запрошенное (или число ядер), но не больше числа ключей API."""
+    workers = requested_workers if requested_workers > 0 else (os.cpu_count() or 1)
+    return max(1, min(workers, api_keys_count))
+
+def fetch_shard(shard_index, channel_ids, api_key, staging_path, max_videos):
+    """
+    Воркер: загружает каналы шарда из API в промежуточную БД.
+    Выполняется в отдельном процессе.
+
+    Returns:
+        dict: {'shard', 'staging_path', 'channels_ok', 'channels_failed', 'api_calls', 'rate_limit'}
+              (вызовы API и ожидания только этого шарда).
+    """
+    # Воркер наследует счетчики родителя (например, вызовы разрешения handle до fork) - они уже учтены в родителе
+    youtube_api.api_call_counts.clear()
+    rate_limiter.limiter.reset_stats()
+    youtube_api.set_api_key(api_key)
+    if os.path.exists(staging_path):
+        os.remove(staging_path) # Промежуточная БД всегда создается заново
+    conn = database.connect_db(staging_path)
+    if not conn:
+        return {'shard': shard_index, 'staging_path': None, 'channels_ok': 0,
+                'channels_failed': len(channel_ids), 'api_calls': {}, 'rate_limit': {}}
+    channels_ok = 0
+    try:
+        database.create_tables(conn)
+        if app_config.BATCH_API_ENABLED:
+            # Промежуточная БД создается пустой: число видео каналов до загрузки известно (0)
+            fetched = batch_fetch.fetch_channels(conn, channel_ids, max_videos, known_counts=dict.fromkeys(channel_ids, 0))
+            channels_ok = len(fetched)
+        else:
+            channels_details = youtube_api.get_channels_details(channel_ids) # Пакетами по 50 ID на вызов
+            for i, channel_id in enumerate(channel_ids):
+                print(f"\n=== Shard {shard_index}: Fetching Channel ID: {channel_id} ({i+1}/{len(channel_ids)}) ===")
+                if channel_id not in channels_details:
+                    print(f"Warning: Failed to fetch channel details from API for {channel_id}. Skipping API update.")
+                    continue
+                # Промежуточная БД создается пустой: число видео канала до загрузки известно (0)
+                if pipeline.fetch_channel(conn, channel_id, max_videos, channels_details[channel_id], known_videos_count=0):
+                    channels_ok += 1
+    finally:
+        conn.close()
+    return {'shard': shard_index, 'staging_path': staging_path, 'channels_ok': channels_ok,
+            'channels_failed': len(channel_ids) - channels_ok, 'api_calls': dict(youtube_api.api_call_counts),
+            'rate_limit': dict(rate_limiter.limiter.stats)}
+
+def run_sharded_fetch(conn, channel_ids):
+    """
+    Загружает каналы в несколько процессов и сливает шарды в основную БД.
+
+    Args:
+        conn: Соединение с основной БД.
+        channel_ids (list): ID каналов для загрузки.
+
+    Returns:
+        dict: Сводка {'shards', 'channels_ok', 'channels_failed', 'api_calls'}.
+    """
+    api_keys = app_config.API_KEYS
+    worker_count = get_worker_count(app_config.SHARDING_WORKERS, len(api_keys))
+    shards = split_into_shards(channel_ids, worker_count)
+    staging_dir = app_config.SHARDING_STAGING_DIR
+    os.makedirs(staging_dir, exist_ok=True)
+    print(f"\n=== Sharded fetch: {len(channel_ids)} channels, {len(shards)} shards/processes ===")
+
+    summary = {'shards': len(shards), 'channels_ok': 0, 'channels_failed': 0, 'api_calls': {}}
+    results = []
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        futures = {
+            executor.submit(fetch_shard, i, shard, api_keys[i], os.path.join(staging_dir, f"shard_{i}.db"),
+                            app_config.MAX_VIDEOS_TO_FETCH_PER_CHANNEL): i
+            for i, shard in enumerate(shards)
+        }
+        for future in as_completed(futures):
+            shard_index = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"ERROR Sharded fetch: Shard {shard_index} failed: {e}")
+                summary['channels_failed'] += len(shards[shard_index])
+
+    # --- Слияние шардов в основную БД (в порядке номеров шардов) ---
+    print("\n=== Merging shards into main database ===")
+    for result in sorted(results, key=lambda r: r['shard']):
+        summary['channels_ok'] += result['channels_ok']
+        summary['channels_failed'] += result['channels_failed']
+        for endpoint, count in result['api_calls'].items():
+            summary['api_calls'][endpoint] = summary['api_calls'].get(endpoint, 0) + count
+        for stat, value in result['rate_limit'].items(): # Ожидание воркеров входит в сводку запуска
+            rate_limiter.limiter.stats[stat] += value
+        staging_path = result['staging_path']
+        if not staging_path:
+            continue
+        merged = database.merge_staging_db(conn, staging_path)
+        if merged is not None and not app_config.SHARDING_KEEP_STAGING:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(staging_path + suffix):
+                    os.remove(staging_path + suffix)
+    print(f"DEBUG Sharded fetch: {summary['channels_ok']} channels fetched, {summary['channels_failed']} failed, API calls: {summary['api_calls']}")
+    return summary
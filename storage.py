@@ -0,0 +1,209 @@
+# storage.py
+"""
+Задача хранения (retention / compaction) для растущей БД.
+
+  1. Перенос холодных данных: видео, опубликованные раньше HOT_DAYS дней назад, переносятся
+     из основной БД в файлы партиций по периоду публикации (PARTITION_DIR/videos_<год|год-месяц>.db).
+     Основная БД остается небольшой и целиком помещается в страничный кэш, а старые партиции
+     почти не меняются (быстрые бэкапы, VACUUM по отдельным файлам). Партиции подключаются
+     к соединениям через ATTACH, а запросы чтения видят их через временное представление videos
+     (см. database.attach_partitions), поэтому остальной код работает без изменений.
+     Число файлов партиций ограничено лимитом SQLite на ATTACH (database.get_max_partitions):
+     отдельные файлы имеют только последние периоды, более старые объединяются в архивную партицию
+     (PARTITION_DIR/videos_archive.db).
+  2. Прореживание истории счетчиков: снимки video_stats_history старше HISTORY_FULL_DAYS дней
+     сокращаются до одного (последнего) снимка на видео за неделю или месяц.
+  3. Инкрементальная очистка: свободные страницы возвращаются системе через PRAGMA incremental_vacuum
+     (для БД, созданных до включения auto_vacuum, однократно выполняется полный VACUUM),
+     WAL усекается, статистика планировщика обновляется (PRAGMA optimize).
+
+Перенос выполняется по одному периоду за транзакцию. В режиме WAL фиксация транзакции,
+затрагивающей несколько файлов, атомарна для каждого файла по отдельности: при сбое между ними
+строка может временно оказаться и в main, и в партиции - повторный запуск задачи это исправит.
+Долгоживущие соединения других процессов видят объединенную в архив партицию (и дубли ее строк
+в архиве), пока не вызовут database.attach_partitions: сервер запросов - при смене версии данных,
+демон - при изменении каталога партиций.
+
+Запуск: python storage.py (например, раз в сутки по cron) или после main.py (COMPACT_AFTER_RUN = True).
+"""
+import os
+import time
+import sqlite3
+from datetime import datetime, timedelta, timezone
+import database
+import config_loader as app_config
+
+SECONDS_PER_DAY = 86400
+PERIOD_FORMATS = {'year': '%Y', 'month': '%Y-%m'}
+# Корзины прореживания истории (fetch_date хранится как 'YYYY-MM-DD')
+DOWNSAMPLE_BUCKETS = {'week': "strftime('%Y-%W', fetch_date)", 'month': "substr(fetch_date, 1, 7)"}
+AUTO_VACUUM_INCREMENTAL = 2
+
+def _prepare_partition(conn, period):
+    """Подключает файл партиции периода (создавая его при необходимости) и возвращает имя схемы."""
+    schema = database.get_partition_schema_name(period)
+    attached = database.get_partition_schemas(conn)
+    if schema in attached:
+        return schema
+    max_partitions = database.get_max_partitions(conn)
+    if len(attached) >= max_partitions:
+        raise sqlite3.OperationalError(f"Cannot attach partition '{period}': {len(attached)} partitions already attached (limit {max_partitions})")
+    os.makedirs(app_config.STORAGE_PARTITION_DIR, exist_ok=True)
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (database.get_partition_path(period),))
+    conn.execute(f"PRAGMA {schema}.auto_vacuum=INCREMENTAL")
+    conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {schema}.videos ({database.VIDEOS_COLUMNS_DDL})")
+    database.create_video_indexes(cursor, schema)
+    conn.commit()
+    print(f"DEBUG Storage: Partition '{period}' attached as {schema}.")
+    return schema
+
+def _remove_partition_file(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def archive_old_partitions(conn, keep_periods):
+    """
+    Объединяет партиции периодов, не входящих в keep_periods, в архивную партицию:
+    строки переносятся в архив, файл партиции удаляется.
+
+    Returns:
+        int: Количество объединенных партиций.
+    """
+    old_periods = [partition_period for partition_period in database.get_partition_files()
+                   if partition_period != database.ARCHIVE_PERIOD and partition_period not in keep_periods]
+    if not old_periods:
+        return 0
+    archive_schema = _prepare_partition(conn, database.ARCHIVE_PERIOD)
+    columns = ", ".join(database.VIDEO_COLUMNS)
+    for partition_period in old_periods:
+        schema = _prepare_partition(conn, partition_period)
+        with conn:
+            cursor = conn.execute(f"INSERT OR REPLACE INTO {archive_schema}.videos ({columns}) SELECT {columns} FROM {schema}.videos")
+        conn.execute(f"DETACH DATABASE {schema}")
+        database.create_videos_view(conn) # Представление не должно ссылаться на отключенную партицию
+        _remove_partition_file(database.get_partition_path(partition_period))
+        print(f"DEBUG Storage: Partition '{partition_period}' merged into the archive ({cursor.rowcount} videos).")
+    return len(old_periods)
+
+def move_cold_videos(conn, hot_days, period):
+    """
+    Переносит видео, опубликованные раньше hot_days дней назад, из main.videos в партиции периодов.
+    Отдельные файлы получают только последние периоды (database.get_max_partitions минус архив),
+    видео более старых периодов и ранее созданные партиции этих периодов переносятся в архив.
+
+    Returns:
+        int: Количество перенесенных видео.
+    """
+    boundary_ts = int(time.time()) - hot_days * SECONDS_PER_DAY
+    period_sql = f"strftime('{PERIOD_FORMATS[period]}', published_at, 'unixepoch')"
+    periods = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT {period_sql} FROM main.videos WHERE published_at < ?", (boundary_ts,))]
+    known_periods = set(periods) | set(database.get_partition_files())
+    known_periods.discard(database.ARCHIVE_PERIOD)
+    keep_periods = set(sorted(known_periods)[-(database.get_max_partitions(conn) - 1):]) # Одно место - для архива
+    archive_old_partitions(conn, keep_periods) # Сначала освобождаем места для новых периодов
+    columns = ", ".join(database.VIDEO_COLUMNS)
+    moved = 0
+    for partition_period in periods:
+        schema = _prepare_partition(conn, partition_period if partition_period in keep_periods else database.ARCHIVE_PERIOD)
+        with conn:
+            conn.execute(f"""
+                INSERT OR REPLACE INTO {schema}.videos ({columns})
+                SELECT {columns} FROM main.videos
+                WHERE published_at < ? AND {period_sql} = ?
+            """, (boundary_ts, partition_period))
+            cursor = conn.execute(f"DELETE FROM main.videos WHERE published_at < ? AND {period_sql} = ?",
+                                  (boundary_ts, partition_period))
+        moved += cursor.rowcount
+        print(f"DEBUG Storage: Moved {cursor.rowcount} videos from '{partition_period}' to partition {schema}.")
+    database.attach_partitions(conn) # Остальные партиции, если соединение открыто без них (python storage.py)
+    database.create_videos_view(conn)
+    return moved
+
+def downsample_history(conn, full_days, downsample):
+    """
+    Оставляет в video_stats_history для снимков старше full_days дней только последний снимок
+    видео в каждой корзине (неделя / месяц).
+
+    Returns:
+        int: Количество удаленных снимков.
+    """
+    cutoff = (datetime.now(timezone.utc).date() - timedelta(days=full_days)).isoformat()
+    bucket_sql = DOWNSAMPLE_BUCKETS[downsample]
+    with conn:
+        cursor = conn.execute(f"""
+            DELETE FROM video_stats_history
+            WHERE fetch_date < :cutoff
+              AND (video_id, fetch_date) NOT IN (
+                  SELECT video_id, MAX(fetch_date) FROM video_stats_history
+                  WHERE fetch_date < :cutoff
+                  GROUP BY video_id, {bucket_sql})
+        """, {'cutoff': cutoff})
+    return cursor.rowcount
+
+def incremental_vacuum(conn, pages):
+    """
+    Возвращает свободные страницы основной БД и партиций файловой системе.
+
+    Returns:
+        int: Количество освобожденных страниц.
+    """
+    freed = 0
+    for schema in ['main'] + database.get_partition_schemas(conn):
+        if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            # Режим auto_vacuum меняется только полным VACUUM (однократно)
+            print(f"DEBUG Storage: Enabling incremental auto_vacuum for '{schema}' (one-time full VACUUM)...")
+            conn.commit()
+            pages_before = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+            conn.execute(f"PRAGMA {schema}.auto_vacuum=INCREMENTAL")
+            conn.execute(f"VACUUM {schema}")
+            freed += pages_before - conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+            continue
+        free_before = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA {schema}.incremental_vacuum({pages})" if pages else f"PRAGMA {schema}.incremental_vacuum").fetchall()
+        freed += free_before - conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+    conn.commit()
+    return freed
+
+def _file_size_mb(path):
+    return os.path.getsize(path) / (1024 * 1024) if os.path.exists(path) else 0.0
+
+def run_compaction(conn):
+    """
+    Выполняет задачу хранения с параметрами из секции [STORAGE] конфигурации.
+
+    Returns:
+        dict: Сводка {'moved_videos', 'history_removed', 'pages_freed', 'partitions'} или None при ошибке.
+    """
+    print("\n=== Storage: Retention / Compaction ===")
+    started = time.perf_counter()
+    try:
+        summary = {
+            'moved_videos': move_cold_videos(conn, app_config.STORAGE_HOT_DAYS, app_config.STORAGE_PARTITION_PERIOD),
+            'history_removed': downsample_history(conn, app_config.STORAGE_HISTORY_FULL_DAYS, app_config.STORAGE_HISTORY_DOWNSAMPLE),
+        }
+        summary['pages_freed'] = incremental_vacuum(conn, app_config.STORAGE_VACUUM_PAGES)
+        summary['partitions'] = len(database.get_partition_schemas(conn))
+        conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchall()
+        conn.execute("PRAGMA optimize")
+    except Exception as e:
+        print(f"ERROR Storage: Compaction failed: {e}")
+        return None
+    partitions_size = sum(_file_size_mb(path) for path in database.get_partition_files().values())
+    print(f"DEBUG Storage: {summary['moved_videos']} videos moved to partitions, {summary['history_removed']} history snapshots removed, "
+          f"{summary['pages_freed']} pages freed in {time.perf_counter() - started:.2f}s. "
+          f"Main DB: {_file_size_mb(database.DB_NAME):.1f} MB, {summary['partitions']} partitions: {partitions_size:.1f} MB.")
+    return summary
+
+if __name__ == "__main__":
+    # Партиции подключаются по мере необходимости: так задача может объединить в архив партиции,
+    # созданные до появления ограничения и превышающие лимит SQLite на ATTACH
+    conn = database.connect_db(partitions=False)
+    if conn:
+        database.create_tables(conn)
+        run_compaction(conn)
+        conn.close()
+        print("DEBUG DB: Database connection closed.")
@@ -0,0 +1,101 @@
+# window_engine.py
+"""
+Оконная аналитика каналов.
+
+Для каждого канала видео загружаются из БД ОДНИМ запросом за объединенный диапазон всех окон
+([reference - 2 * max_window, reference)), после чего за один проход рассчитываются метрики
+для каждого окна (количество, просмотры, ER, длительность) и тренд относительно предыдущего окна
+той же длины.
+
+Опорная дата (reference_date) фиксируется один раз на запуск, чтобы все каналы
+анализировались относительно одной и той же точки во времени.
+"""
+from datetime import datetime, timezone
+import database
+
+SECONDS_PER_DAY = 86400
+
+# Метрики окна (шаблоны ключей в channel_results, {n} - длина окна в днях)
+WINDOW_METRIC_TEMPLATES = [
+    'videos_last_{n}d_count',
+    'views_sum_last_{n}d',
+    'avg_engagement_rate_{n}d',
+    'avg_duration_sec_{n}d',
+    'avg_views_per_video_{n}d',
+    'view_trend_ratio_{n}d',
+]
+
+def get_reference_date(configured_date=None):
+    """Возвращает опорную дату запуска: дату из конфигурации или сегодняшнюю."""
+    return configured_date if configured_date is not None else datetime.now().date()
+
+def get_reference_timestamp(reference_date):
+    """Unix timestamp полуночи (UTC) опорной даты - правая (исключенная) граница всех окон."""
+    return int(datetime.combine(reference_date, datetime.min.time(), tzinfo=timezone.utc).timestamp())
+
+def get_window_metric_names(windows):
+    """Возвращает список ключей всех оконных метрик (для ранжирования и агрегатов)."""
+    return [template.format(n=window) for window in windows for template in WINDOW_METRIC_TEMPLATES]
+
+def calculate_window_metrics(videos, reference_ts, windows):
+    """
+    Рассчитывает метрики для всех окон за один проход по списку видео.
+
+    Видео попадает в текущее окно длины N, если опубликовано в [reference - N, reference),
+    и в предыдущее окно, если опубликовано в [reference - 2N, reference - N).
+
+    Args:
+        videos (list): Объекты VideoRecord (published_ts, view_count, like_count,
+                       comment_count, duration_seconds), как их возвращает БД.
+        reference_ts (int): Unix timestamp опорной точки (исключенная правая граница).
+        windows (list): Длины окон в днях.
+
+    Returns:
+        dict: Ключи из WINDOW_METRIC_TEMPLATES для каждого окна.
+    """
+    # Аккумуляторы по окнам: [count, views, duration, er_sum, er_count, prev_views]
+    bounds = [(window, window * SECONDS_PER_DAY) for window in windows]
+    acc = {window: [0, 0, 0, 0.0, 0, 0] for window in windows}
+
+    for video in videos:
+        age = reference_ts - video.published_ts
+        if age <= 0:
+            continue # Видео опубликовано после опорной точки
+        views = video.view_count
+        for window, window_sec in bounds:
+            if age <= window_sec:
+                a = acc[window]
+                a[0] += 1
+                a[1] += views
+                a[2] += video.duration_seconds
+                # Пропускаем видео без просмотров, чтобы избежать деления на ноль
+                if views > 0:
+                    a[3] += (video.like_count + video.comment_count) / views * 100
+                    a[4] += 1
+            elif age <= 2 * window_sec:
+                acc[window][5] += views
+
+    metrics = {}
+    for window in windows:
+        count, views_sum, duration_sum, er_sum, er_count, prev_views = acc[window]
+        view_trend_ratio = None
+        if prev_views > 0: view_trend_ratio = round(views_sum / prev_views, 2)
+        elif views_sum > 0: view_trend_ratio = float('inf')
+
+        metrics[f'videos_last_{window}d_count'] = count
+        metrics[f'views_sum_last_{window}d'] = views_sum
+        metrics[f'avg_engagement_rate_{window}d'] = round(er_sum / er_count, 2) if er_count > 0 else 0.0
+        metrics[f'avg_duration_sec_{window}d'] = round(duration_sum / count) if count > 0 and duration_sum > 0 else 0
+        metrics[f'avg_views_per_video_{window}d'] = round(views_sum / count) if count > 0 else 0
+        metrics[f'view_trend_ratio_{window}d'] = view_trend_ratio
+    return metrics
+
+def analyze_channel_windows(conn, channel_id, reference_date, windows):
+    """
+    Загружает видео канала за объединенный диапазон окон одним запросом
+    и рассчитывает метрики всех окон.
+    """
+    reference_ts = get_reference_timestamp(reference_date)
+    start_ts = reference_ts - 2 * max(windows) * SECONDS_PER_DAY
+    videos = database.get_videos_published_in_range(conn, channel_id, start_ts, reference_ts)
+    return calculate_window_metrics(videos, reference_ts, windows)
@@ -2,6 +2,8 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 # Заменяем импорт config на config_loader
 import config_loader as app_config
+import rate_limiter
+from records import VideoRecord
 import isodate
 import re
 from datetime import datetime, timezone
@@ -9,13 +11,130 @@ import time
 
 # Глобальный сервис API - без изменений
 youtube_service = None
+# Ключ API, назначенный процессу явно (например, воркеру шардированной загрузки); None - первый ключ из конфигурации
+api_key_override = None
 
-# !!! Функция get_authenticated_service теперь использует app_config.API_KEYS[0]
-#    (если мы не используем менеджер ключей, который сейчас отложен)
+# Счетчики вызовов API по эндпоинтам (для учета квоты: каждый вызов *.list стоит 1 единицу)
+api_call_counts = {}
+QUOTA_COST_PER_CALL = 1
+# Пакетные HTTP-запросы (execute_batch): число HTTP-запросов, вызовов API в них и повторенных по одному вызовов
+batch_stats = {'batches': 0, 'requests': 0, 'retried': 0}
+
+def count_api_call(endpoint):
+    """Учитывает вызов эндпоинта API (channels.list, playlistItems.list, videos.list)."""
+    api_call_counts[endpoint] = api_call_counts.get(endpoint, 0) + 1
+
+def get_current_api_key():
+    """Ключ API, с которым работает процесс (назначенный через set_api_key() или первый из конфигурации)."""
+    return api_key_override or (app_config.API_KEYS[0] if app_config.API_KEYS else '')
+
+def execute_request(request, endpoint):
+    """
+    Выполняет запрос googleapiclient через общий ограничитель частоты (rate_limiter) и учитывает вызов.
+    После ошибки лимита частоты (403 rateLimitExceeded / 429) ограничитель снижает скорость,
+    и запрос повторяется до RATE_LIMIT_RETRIES раз; остальные ошибки пробрасываются как есть.
+    """
+    api_key = get_current_api_key()
+    limiter = rate_limiter.limiter
+    for attempt in range(app_config.RATE_LIMIT_RETRIES + 1):
+        limiter.acquire(api_key, endpoint)
+        count_api_call(endpoint)
+        try:
+            response = request.execute()
+        except HttpError as e:
+            if not rate_limiter.is_rate_limit_error(e.resp.status, e.content):
+                raise
+            will_retry = attempt < app_config.RATE_LIMIT_RETRIES
+            limiter.report_rate_limited(api_key, will_retry)
+            if not will_retry:
+                raise
+            continue # Корзина ключа опустошена: следующий acquire дождется токена при сниженной скорости
+        limiter.report_success(api_key)
+        return response
+
+def is_retryable_error(exception):
+    """Временная ошибка запроса (лимит частоты, ошибка сервера 5xx, сетевая ошибка), после которой запрос стоит повторить."""
+    if isinstance(exception, HttpError):
+        return exception.resp.status >= 500 or rate_limiter.is_rate_limit_error(exception.resp.status, exception.content)
+    return True
+
+def execute_batch(requests, max_requests=None):
+    """
+    Выполняет независимые запросы googleapiclient пакетами: до max_requests запросов
+    (по умолчанию BATCH_API_MAX_REQUESTS из конфигурации) в одном HTTP-запросе (new_batch_http_request).
+    Каждый подзапрос расходует квоту и проходит через ограничитель частоты, как в execute_request.
+    Подзапросы, завершившиеся временной ошибкой (is_retryable_error), и подзапросы пакета, который
+    не удалось выполнить целиком, повторяются по одному через execute_request; остальные ошибки
+    (например, quotaExceeded) передаются обработчику без повтора.
+
+    Args:
+        requests (list): [(запрос googleapiclient, эндпоинт, обработчик)]. Обработчик вызывается
+                         ровно один раз для каждого запроса как handler(response, exception),
+                         где exception - None при успехе (порядок вызовов - порядок списка).
+        max_requests (int, optional): Максимум запросов в одном HTTP-запросе.
+
+    Returns:
+        bool: False, если сервис API не инициализирован (обработчики не вызываются).
+    """
+    youtube = get_authenticated_service()
+    if not youtube: return False
+
+    api_key = get_current_api_key()
+    limiter = rate_limiter.limiter
+    max_requests = max_requests or app_config.BATCH_API_MAX_REQUESTS
+    for start in range(0, len(requests), max_requests):
+        chunk = requests[start:start + max_requests]
+        outcomes = {} # request_id -> (response, exception)
+
+        def collect(request_id, response, exception):
+            outcomes[request_id] = (response, exception)
+
+        batch = youtube.new_batch_http_request(callback=collect)
+        for index, (request, endpoint, _) in enumerate(chunk):
+            limiter.acquire(api_key, endpoint)
+            count_api_call(endpoint)
+            batch.add(request, request_id=str(index))
+        batch_stats['batches'] += 1
+        batch_stats['requests'] += len(chunk)
+        try:
+            batch.execute()
+        except Exception as e:
+            print(f"WARNING youtube_api: Batch HTTP request with {len(chunk)} calls failed: {e}. Retrying failed calls one by one.")
+
+        succeeded = False
+        for index, (request, endpoint, handler) in enumerate(chunk):
+            response, exception = outcomes.get(str(index), (None, None))
+            if exception is None and response is not None:
+                succeeded = True
+            elif exception is None or is_retryable_error(exception):
+                if isinstance(exception, HttpError) and rate_limiter.is_rate_limit_error(exception.resp.status, exception.content):
+                    limiter.report_rate_limited(api_key, will_retry=True)
+                batch_stats['retried'] += 1
+                try:
+                    response, exception = execute_request(request, endpoint), None
+                except Exception as e:
+                    response, exception = None, e
+            handler(response, exception)
+        if succeeded:
+            limiter.report_success(api_key)
+    return True
+
+def get_quota_units_used():
+    """Возвращает количество израсходованных единиц квоты с момента запуска процесса."""
+    return sum(api_call_counts.values()) * QUOTA_COST_PER_CALL
+
+def set_api_key(api_key):
+    """Назначает процессу конкретный ключ API (сервис будет пересоздан при следующем обращении)."""
+    global youtube_service, api_key_override
+    api_key_override = api_key
+    youtube_service = None
+
+# !!! Функция get_authenticated_service использует ключ, назначенный через set_api_key() (воркеры шардированной
+#    загрузки), иначе app_config.API_KEYS[0] (менеджер ключей с переключением при исчерпании квоты пока отложен)
 def get_authenticated_service():
     """
     Инициализирует и возвращает объект сервиса YouTube API.
-    Использует ПЕРВЫЙ ключ из списка в config_loader.py.
+    Использует ключ, назначенный через set_api_key(), иначе ПЕРВЫЙ ключ из списка в config_loader.py.
     """
     global youtube_service
     if not app_config.API_KEYS: # Проверка, что ключи есть
@@ -23,8 +142,8 @@ def get_authenticated_service():
         return None
 
     if youtube_service is None:
-        current_key = app_config.API_KEYS[0] # Берем первый ключ
-        print(f"Initializing YouTube service with the first key from config.")
+        current_key = get_current_api_key() # Берем назначенный или первый ключ
+        print(f"Initializing YouTube service with key {current_key[:4]}...{current_key[-4:]}.")
         try:
             youtube_service = build('youtube', 'v3', developerKey=current_key)
             print("YouTube Service Initialized Successfully.")
@@ -38,6 +157,38 @@ def get_authenticated_service():
             return None
     return youtube_service
 
+def parse_channel_item(channel_id, channel_item):
+    """
+    Преобразует элемент ответа channels.list в словарь информации о канале
+    (общий для синхронного и асинхронного клиентов).
+    """
+    channel_title = channel_item['snippet']['title']
+    uploads_playlist_id = channel_item['contentDetails']['relatedPlaylists']['uploads']
+
+    # Извлекаем статистику, если она есть
+    statistics = channel_item.get('statistics', {})
+    subscriber_count = statistics.get('subscriberCount') # Может отсутствовать, если скрыто
+    # view_count = statistics.get('viewCount') # Общее число просмотров канала (если нужно)
+    # video_count = statistics.get('videoCount') # Общее число видео (если нужно)
+
+    # Если подписчики скрыты ('hiddenSubscriberCount' == True), subscriberCount не будет в ответе
+    if statistics.get('hiddenSubscriberCount', False):
+         print(f"Channel {channel_title}: Subscriber count is hidden.")
+         subscriber_count = None # Устанавливаем None, если скрыто
+
+    print(f"Found Channel: {channel_title} (ID: {channel_id})")
+    print(f"Uploads Playlist ID: {uploads_playlist_id}")
+    print(f"Subscriber Count: {'Hidden' if subscriber_count is None else subscriber_count}") # Обновлено сообщение
+
+    return {
+        'id': channel_id,
+        'title': channel_title,
+        'uploads_playlist_id': uploads_playlist_id,
+        'subscriber_count': subscriber_count # Добавляем подписчиков в результат
+        # 'total_views': view_count, # Можно добавить при необходимости
+        # 'total_videos': video_count # Можно добавить при необходимости
+    }
+
 def get_channel_details(channel_id):
     """
     Получает информацию о канале, включая ID плейлиста загрузок и кол-во подписчиков.
@@ -51,39 +202,13 @@ def get_channel_details(channel_id):
             part="snippet,contentDetails,statistics",
             id=channel_id
         )
-        response = request.execute()
+        response = execute_request(request, 'channels.list')
 
         if not response.get('items'):
             print(f"Error: No channel found with ID: {channel_id}")
             return None
 
-        channel_item = response['items'][0]
-        channel_title = channel_item['snippet']['title']
-        uploads_playlist_id = channel_item['contentDetails']['relatedPlaylists']['uploads']
-
-        # Извлекаем статистику, если она есть
-        statistics = channel_item.get('statistics', {})
-        subscriber_count = statistics.get('subscriberCount') # Может отсутствовать, если скрыто
-        # view_count = statistics.get('viewCount') # Общее число просмотров канала (если нужно)
-        # video_count = statistics.get('videoCount') # Общее число видео (если нужно)
-
-        # Если подписчики скрыты ('hiddenSubscriberCount' == True), subscriberCount не будет в ответе
-        if statistics.get('hiddenSubscriberCount', False):
-             print(f"Channel {channel_title}: Subscriber count is hidden.")
-             subscriber_count = None # Устанавливаем None, если скрыто
-
-        print(f"Found Channel: {channel_title} (ID: {channel_id})")
-        print(f"Uploads Playlist ID: {uploads_playlist_id}")
-        print(f"Subscriber Count: {'Hidden' if subscriber_count is None else subscriber_count}") # Обновлено сообщение
-
-        return {
-            'id': channel_id,
-            'title': channel_title,
-            'uploads_playlist_id': uploads_playlist_id,
-            'subscriber_count': subscriber_count # Добавляем подписчиков в результат
-            # 'total_views': view_count, # Можно добавить при необходимости
-            # 'total_videos': video_count # Можно добавить при необходимости
-        }
+        return parse_channel_item(channel_id, response['items'][0])
 
     except HttpError as e:
         # ... обработка ошибок остается прежней ...
@@ -94,6 +219,70 @@ def get_channel_details(channel_id):
         print(f"An unexpected error occurred while fetching channel details for {channel_id}: {e}")
         return None
 
+def get_channels_details(channel_ids):
+    """
+    Получает информацию о нескольких каналах пакетами по 50 ID на один вызов channels.list
+    (вместо вызова на каждый канал).
+
+    Returns:
+        dict: {channel_id: информация о канале, как у get_channel_details}. Каналы, которых нет в ответе
+              (не найдены или пакет завершился ошибкой), в словарь не попадают.
+    """
+    youtube = get_authenticated_service()
+    if not youtube: return {}
+
+    channels = {}
+    channel_ids = list(channel_ids)
+    for i in range(0, len(channel_ids), 50):
+        chunk_ids = channel_ids[i:i+50]
+        try:
+            request = youtube.channels().list(
+                part="snippet,contentDetails,statistics",
+                id=','.join(chunk_ids),
+                maxResults=50
+            )
+            response = execute_request(request, 'channels.list')
+            for channel_item in response.get('items', []):
+                channels[channel_item['id']] = parse_channel_item(channel_item['id'], channel_item)
+        except HttpError as e:
+            print(f"An HTTP error {e.resp.status} occurred while fetching details for {len(chunk_ids)} channels:\n{e.content}")
+            if e.resp.status == 403 and 'quotaExceeded' in str(e.content):
+                print("!!! YouTube API Quota Exceeded !!!")
+                break
+        except Exception as e:
+            print(f"An unexpected error occurred while fetching channels details chunk: {e}")
+    print(f"Fetched details for {len(channels)} of {len(channel_ids)} channels.")
+    return channels
+
+def resolve_channel_id(handle=None, username=None):
+    """
+    Определяет ID канала по @handle (forHandle) или старому имени пользователя (forUsername).
+    Стоит 1 единицу квоты.
+
+    Returns:
+        str | None | bool: ID канала; None, если канал не найден; False при ошибке запроса
+                           (результат не следует кэшировать).
+    """
+    youtube = get_authenticated_service()
+    if not youtube: return False
+
+    lookup = {'forHandle': handle} if handle else {'forUsername': username}
+    try:
+        request = youtube.channels().list(part="id", **lookup)
+        response = execute_request(request, 'channels.list')
+        items = response.get('items') or []
+        if not items:
+            print(f"Warning: No channel found for {lookup}")
+            return None
+        return items[0]['id']
+    except HttpError as e:
+        print(f"An HTTP error {e.resp.status} occurred while resolving channel {lookup}:\n{e.content}")
+        if e.resp.status == 403 and 'quotaExceeded' in str(e.content): print("!!! YouTube API Quota Exceeded !!!")
+        return False
+    except Exception as e:
+        print(f"An unexpected error occurred while resolving channel {lookup}: {e}")
+        return False
+
 def get_playlist_video_ids(playlist_id, max_results=None):
     """
     Получает список ID видео из указанного плейлиста YouTube.
@@ -124,7 +313,7 @@ def get_playlist_video_ids(playlist_id, max_results=None):
                 maxResults=50, # Максимальное значение за раз
                 pageToken=next_page_token
             )
-            response = request.execute()
+            response = execute_request(request, 'playlistItems.list')
 
             for item in response.get('items', []):
                 video_id = item.get('contentDetails', {}).get('videoId')
@@ -196,6 +385,40 @@ def parse_iso8601_duration(duration_str):
         print(f"Error parsing duration '{duration_str}': {e}")
         return 0
 
+def parse_video_item(item, fetch_date):
+    """
+    Преобразует элемент ответа videos.list в VideoRecord
+    (общий для синхронного и асинхронного клиентов).
+    """
+    video_id = item['id']
+    snippet = item.get('snippet', {})
+    content_details = item.get('contentDetails', {})
+    statistics = item.get('statistics', {}) # Статистика может отсутствовать
+
+    # Извлекаем данные, обрабатывая возможные отсутствующие ключи
+    title = snippet.get('title', 'N/A')
+    published_at_str = snippet.get('publishedAt')
+    # Конвертируем дату публикации в Unix timestamp (UTC)
+    published_ts = None
+    if published_at_str:
+        try:
+            published_ts = int(datetime.fromisoformat(published_at_str.replace('Z', '+00:00')).timestamp())
+        except ValueError:
+            print(f"Warning: Could not parse datetime '{published_at_str}' for video {video_id}")
+
+    duration_str = content_details.get('duration')
+    duration_seconds = parse_iso8601_duration(duration_str) if duration_str else 0
+
+    # Статистика может быть скрыта, поэтому используем .get с 0 по умолчанию
+    view_count = int(statistics.get('viewCount', 0))
+    like_count = int(statistics.get('likeCount', 0)) # Лайки могут быть скрыты
+    comment_count = int(statistics.get('commentCount', 0)) # Комментарии могут быть отключены
+
+    return VideoRecord(
+        video_id, snippet.get('channelId'), title, published_ts, duration_seconds,
+        view_count, like_count, comment_count, fetch_date
+    )
+
 
 def get_video_details(video_ids):
     """
@@ -206,9 +429,9 @@ def get_video_details(video_ids):
         video_ids (list): Список строк с ID видео.
 
     Returns:
-        list: Список словарей, где каждый словарь содержит детали одного видео:
-              {'id', 'title', 'published_at', 'duration_seconds',
-               'view_count', 'like_count', 'comment_count'}
+        list: Список объектов VideoRecord с деталями видео
+              (id, channel_id, title, published_ts, duration_seconds,
+               view_count, like_count, comment_count, fetch_date).
               Возвращает пустой список в случае ошибки инициализации API.
               Может вернуть неполный список, если закончилась квота.
     """
@@ -217,6 +440,7 @@ def get_video_details(video_ids):
         return []
 
     video_details_list = []
+    fetch_date = datetime.now().date().isoformat() # Дата сбора данных (одна строка на весь вызов)
     # Обрабатываем ID пакетами по 50 штук
     for i in range(0, len(video_ids), 50):
         chunk_ids = video_ids[i:i+50]
@@ -230,43 +454,9 @@ def get_video_details(video_ids):
                 id=ids_string,
                 maxResults=50
             )
-            response = request.execute()
+            response = execute_request(request, 'videos.list')
 
-            for item in response.get('items', []):
-                video_id = item['id']
-                snippet = item.get('snippet', {})
-                content_details = item.get('contentDetails', {})
-                statistics = item.get('statistics', {}) # Статистика может отсутствовать
-
-                # Извлекаем данные, обрабатывая возможные отсутствующие ключи
-                title = snippet.get('title', 'N/A')
-                published_at_str = snippet.get('publishedAt')
-                # Конвертируем дату публикации в объект datetime
-                published_at_dt = None
-                if published_at_str:
-                    try:
-                        published_at_dt = datetime.fromisoformat(published_at_str.replace('Z', '+00:00'))
-                    except ValueError:
-                        print(f"Warning: Could not parse datetime '{published_at_str}' for video {video_id}")
-
-                duration_str = content_details.get('duration')
-                duration_seconds = parse_iso8601_duration(duration_str) if duration_str else 0
-
-                # Статистика может быть скрыта, поэтому используем .get с 0 по умолчанию
-                view_count = int(statistics.get('viewCount', 0))
-                like_count = int(statistics.get('likeCount', 0)) # Лайки могут быть скрыты
-                comment_count = int(statistics.get('commentCount', 0)) # Комментарии могут быть отключены
-
-                video_details_list.append({
-                    'id': video_id,
-                    'title': title,
-                    'published_at': published_at_dt, # Сохраняем как объект datetime
-                    'duration_seconds': duration_seconds,
-                    'view_count': view_count,
-                    'like_count': like_count,
-                    'comment_count': comment_count,
-                    'fetch_date': datetime.now().date() # Добавим дату сбора данных
-                })
+            video_details_list.extend(parse_video_item(item, fetch_date) for item in response.get('items', []))
 
         except HttpError as e:
             print(f"An HTTP error {e.resp.status} occurred while fetching video details:\n{e.content}")
@@ -0,0 +1,280 @@
+# youtube_api_async.py
+"""
+Асинхронный клиент YouTube Data API v3 на asyncio + aiohttp.
+
+Синхронный клиент (youtube_api.py) выполняет запросы по одному через googleapiclient/httplib2,
+и при большом числе каналов время уходит в основном на накладные расходы каждого запроса
+(сборка запроса, установка TLS-соединения, ожидание ответа). Этот клиент обращается к тем же
+трем эндпоинтам (channels.list, playlistItems.list, videos.list) напрямую по HTTPS:
+  * одна сессия aiohttp с пулом keep-alive соединений на весь запуск;
+  * число одновременных запросов ограничено (MAX_CONCURRENT_REQUESTS);
+  * каналы обрабатываются параллельно, пакеты videos.list одного канала - тоже.
+Страницы playlistItems.list запрашиваются последовательно (каждой нужен токен предыдущей).
+
+Методы возвращают то же, что функции youtube_api (разбор ответов общий: parse_channel_item,
+parse_video_item), вызовы учитываются в тех же счетчиках квоты. Запись в SQLite выполняется
+в потоке цикла событий по мере готовности каналов (pipeline.save_fetched_channel).
+
+Включается в config.ini: [ASYNC_API] ENABLED = True. Требуется aiohttp.
+"""
+import asyncio
+import time
+from datetime import datetime
+import youtube_api
+import database
+import pipeline
+import rate_limiter
+import config_loader as app_config
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+    print("WARNING: 'aiohttp' library not found. Async API client is unavailable. Install it using: pip install aiohttp")
+
+API_BASE_URL = 'https://www.googleapis.com/youtube/v3'
+MAX_IDS_PER_REQUEST = 50
+
+class AsyncApiError(Exception):
+    """Ошибка HTTP при запросе к API (аналог HttpError googleapiclient)."""
+
+    def __init__(self, status, content):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.content = content
+
+    @property
+    def quota_exceeded(self):
+        return self.status == 403 and 'quotaExceeded' in self.content
+
+    @property
+    def rate_limited(self):
+        return rate_limiter.is_rate_limit_error(self.status, self.content)
+
+class AsyncYouTubeClient:
+    """
+    Клиент с пулом соединений. Используется как асинхронный контекстный менеджер:
+
+        async with AsyncYouTubeClient(api_key) as client:
+            channel_info = await client.get_channel_details(channel_id)
+    """
+
+    def __init__(self, api_key, max_concurrency=10, timeout_sec=30):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout_sec = timeout_sec
+        self.session = None
+        self.semaphore = None
+        self.quota_exceeded = False # После quotaExceeded новые запросы не отправляются
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout_sec))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+
+    async def _request(self, endpoint, params):
+        """
+        Выполняет GET-запрос к эндпоинту ('channels', 'playlistItems', 'videos') и возвращает JSON ответа.
+        Запросы проходят через общий ограничитель частоты (rate_limiter); после ошибки лимита частоты
+        запрос повторяется до RATE_LIMIT_RETRIES раз.
+        Raises:
+            AsyncApiError: Ответ с HTTP-статусом ошибки или квота уже исчерпана.
+        """
+        if self.quota_exceeded:
+            raise AsyncApiError(403, 'quotaExceeded (skipped)')
+        params = {key: value for key, value in params.items() if value is not None}
+        params['key'] = self.api_key
+        limiter = rate_limiter.limiter
+        for attempt in range(app_config.RATE_LIMIT_RETRIES + 1):
+            # Ожидание токена - до семафора, чтобы ждущие задачи не занимали слоты соединений
+            await limiter.acquire_async(self.api_key, f"{endpoint}.list")
+            async with self.semaphore:
+                youtube_api.count_api_call(f"{endpoint}.list")
+                async with self.session.get(f"{API_BASE_URL}/{endpoint}", params=params) as response:
+                    if response.status == 200:
+                        limiter.report_success(self.api_key)
+                        return await response.json()
+                    error = AsyncApiError(response.status, await response.text())
+            if error.quota_exceeded:
+                self.quota_exceeded = True
+            if not error.rate_limited:
+                raise error
+            will_retry = attempt < app_config.RATE_LIMIT_RETRIES
+            limiter.report_rate_limited(self.api_key, will_retry)
+            if not will_retry:
+                raise error
+
+    async def get_channel_details(self, channel_id):
+        """Асинхронный аналог youtube_api.get_channel_details."""
+        try:
+            response = await self._request('channels', {'part': 'snippet,contentDetails,statistics', 'id': channel_id})
+            if not response.get('items'):
+                print(f"Error: No channel found with ID: {channel_id}")
+                return None
+            return youtube_api.parse_channel_item(channel_id, response['items'][0])
+        except AsyncApiError as e:
+            print(f"An HTTP error {e.status} occurred while fetching channel details for {channel_id}:\n{e.content}")
+            if e.quota_exceeded: print("!!! YouTube API Quota Exceeded !!!")
+            return None
+        except Exception as e:
+            print(f"An unexpected error occurred while fetching channel details for {channel_id}: {e}")
+            return None
+
+    async def _get_channels_details_chunk(self, chunk_ids):
+        try:
+            response = await self._request('channels', {
+                'part': 'snippet,contentDetails,statistics', 'id': ','.join(chunk_ids), 'maxResults': MAX_IDS_PER_REQUEST})
+            return [(item['id'], youtube_api.parse_channel_item(item['id'], item)) for item in response.get('items', [])]
+        except AsyncApiError as e:
+            print(f"An HTTP error {e.status} occurred while fetching details for {len(chunk_ids)} channels:\n{e.content}")
+            if e.quota_exceeded: print("!!! YouTube API Quota Exceeded !!!")
+            return []
+        except Exception as e:
+            print(f"An unexpected error occurred while fetching channels details chunk: {e}")
+            return []
+
+    async def get_channels_details(self, channel_ids):
+        """Асинхронный аналог youtube_api.get_channels_details: пакеты по 50 ID запрашиваются параллельно."""
+        chunks = await asyncio.gather(*(
+            self._get_channels_details_chunk(channel_ids[i:i + MAX_IDS_PER_REQUEST])
+            for i in range(0, len(channel_ids), MAX_IDS_PER_REQUEST)))
+        channels = dict(item for chunk in chunks for item in chunk)
+        print(f"Fetched details for {len(channels)} of {len(channel_ids)} channels.")
+        return channels
+
+    async def get_playlist_video_ids(self, playlist_id, max_results=None):
+        """Асинхронный аналог youtube_api.get_playlist_video_ids."""
+        video_ids = []
+        next_page_token = None
+        print(f"Fetching video IDs from playlist: {playlist_id}...")
+        while max_results is None or len(video_ids) < max_results:
+            try:
+                response = await self._request('playlistItems', {
+                    'part': 'contentDetails', 'playlistId': playlist_id,
+                    'maxResults': MAX_IDS_PER_REQUEST, 'pageToken': next_page_token})
+            except AsyncApiError as e:
+                print(f"An HTTP error {e.status} occurred while fetching playlist items:\n{e.content}")
+                if e.quota_exceeded: print("!!! YouTube API Quota Exceeded during playlist fetch !!!")
+                break # Возвращаем то, что успели собрать
+            except Exception as e:
+                print(f"An unexpected error occurred while fetching playlist items: {e}")
+                break
+            for item in response.get('items', []):
+                video_id = item.get('contentDetails', {}).get('videoId')
+                if video_id:
+                    video_ids.append(video_id)
+            next_page_token = response.get('nextPageToken')
+            if not next_page_token:
+                break
+        print(f"Finished fetching. Total video IDs found: {len(video_ids)} ({playlist_id})")
+        return video_ids[:max_results] if max_results is not None else video_ids
+
+    async def _get_video_details_chunk(self, chunk_ids, fetch_date):
+        try:
+            response = await self._request('videos', {
+                'part': 'snippet,contentDetails,statistics', 'id': ','.join(chunk_ids), 'maxResults': MAX_IDS_PER_REQUEST})
+            return [youtube_api.parse_video_item(item, fetch_date) for item in response.get('items', [])]
+        except AsyncApiError as e:
+            print(f"An HTTP error {e.status} occurred while fetching video details:\n{e.content}")
+            if e.quota_exceeded: print("!!! YouTube API Quota Exceeded during video details fetch !!!")
+            return []
+        except Exception as e:
+            print(f"An unexpected error occurred while fetching video details chunk: {e}")
+            return []
+
+    async def get_video_details(self, video_ids):
+        """
+        Асинхронный аналог youtube_api.get_video_details: пакеты по 50 ID запрашиваются параллельно,
+        порядок видео в результате совпадает с порядком пакетов.
+        """
+        fetch_date = datetime.now().date().isoformat()
+        chunks = await asyncio.gather(*(
+            self._get_video_details_chunk(video_ids[i:i + MAX_IDS_PER_REQUEST], fetch_date)
+            for i in range(0, len(video_ids), MAX_IDS_PER_REQUEST)))
+        video_details_list = [video for chunk in chunks for video in chunk]
+        print(f"Finished fetching details. Total videos processed: {len(video_details_list)}")
+        return video_details_list
+
+    async def fetch_channel(self, channel_id, max_videos, channel_info=None):
+        """
+        Загружает информацию о канале (если она не получена заранее пакетным запросом)
+        и детали его последних видео (без записи в БД).
+
+        Returns:
+            tuple: (channel_info, список VideoRecord) или (None, []), если канал не получен.
+        """
+        if channel_info is None:
+            channel_info = await self.get_channel_details(channel_id)
+        if not channel_info:
+            print(f"Warning: Failed to fetch channel details from API for {channel_id}. Skipping API update.")
+            return None, []
+        uploads_playlist_id = channel_info.get('uploads_playlist_id')
+        if not uploads_playlist_id:
+            print(f"Warning: No uploads playlist ID found for {channel_id}")
+            return channel_info, []
+        video_ids = await self.get_playlist_video_ids(uploads_playlist_id, max_results=max_videos)
+        if not video_ids:
+            print("Warning: No video IDs received from API.")
+            return channel_info, []
+        videos_data = await self.get_video_details(video_ids)
+        if not videos_data:
+            print("Warning: No video details received from API.")
+        return channel_info, videos_data
+
+async def fetch_channels(conn, channel_ids, max_videos, api_key, max_concurrency, timeout_sec):
+    """
+    Загружает каналы параллельно (не более max_concurrency каналов одновременно)
+    и сохраняет каждый в БД по мере готовности. Информация о каналах запрашивается заранее
+    пакетами по 50 ID.
+
+    Returns:
+        dict: {channel_id: результат pipeline.save_fetched_channel без списка видео}.
+    """
+    results = {}
+    # Число видео каналов в БД до загрузки (одним запросом): после записи оно считается без COUNT
+    known_counts = {channel_id: info[3] for channel_id, info in database.get_channels_db_info(conn, channel_ids).items()}
+    async with AsyncYouTubeClient(api_key, max_concurrency, timeout_sec) as client:
+        channels_details = await client.get_channels_details(list(channel_ids))
+        pending = {}
+        channel_iter = iter(channel_id for channel_id in channel_ids if channel_id in channels_details)
+        while True:
+            for channel_id in channel_iter:
+                pending[asyncio.ensure_future(client.fetch_channel(channel_id, max_videos, channels_details[channel_id]))] = channel_id
+                if len(pending) >= max_concurrency:
+                    break
+            if not pending:
+                break
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                channel_id = pending.pop(task)
+                channel_info, videos_data = task.result()
+                if channel_info:
+                    result = pipeline.save_fetched_channel(conn, channel_id, channel_info, videos_data, known_counts.get(channel_id))
+                    result['videos'] = [] # Видео уже в БД, не держим их в памяти до конца загрузки
+                    results[channel_id] = result
+    return results
+
+def run_async_fetch(conn, channel_ids, max_videos):
+    """
+    Синхронная точка входа для main.py: загружает каналы асинхронным клиентом
+    с параметрами из секции [ASYNC_API] конфигурации.
+
+    Returns:
+        dict | None: {channel_id: результат загрузки} или None, если aiohttp не установлен.
+    """
+    if aiohttp is None:
+        print("ERROR Async API: 'aiohttp' is not installed. Falling back to the synchronous client.")
+        return None
+    api_key = youtube_api.api_key_override or app_config.API_KEYS[0]
+    print(f"\n=== Async fetch: {len(channel_ids)} channels, up to {app_config.ASYNC_API_MAX_CONCURRENT_REQUESTS} concurrent requests ===")
+    started = time.perf_counter()
+    results = asyncio.run(fetch_channels(conn, channel_ids, max_videos, api_key,
+                                         app_config.ASYNC_API_MAX_CONCURRENT_REQUESTS, app_config.ASYNC_API_TIMEOUT_SEC))
+    print(f"DEBUG Async fetch: {len(results)} channels fetched, {len(channel_ids) - len(results)} failed "
+          f"in {time.perf_counter() - started:.1f}s, API calls: {youtube_api.api_call_counts}")
+    return results